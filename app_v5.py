@@ -1,5 +1,5 @@
 # --- IMPORTACIONES ---
-from flask import Flask, render_template, request, send_from_directory, abort, redirect, url_for, session, jsonify
+from flask import Flask, render_template, request, send_from_directory, abort, redirect, url_for, session, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import traceback
 import os
@@ -7,17 +7,29 @@ import json
 import tempfile
 import sys
 import webbrowser
+import threading
+import time
 from threading import Timer
 from waitress import serve
 import uuid 
 from datetime import datetime
 import math
+from decimal import Decimal, ROUND_HALF_UP
+import hashlib
+import pickle
+import mmap
+from collections import OrderedDict
 import sqlite3
 import socket
 import pandas as pd
+import numpy as np
 import re
 import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
 from functools import wraps
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 from werkzeug.security import generate_password_hash, check_password_hash
 try:
     from zoneinfo import ZoneInfo
@@ -64,6 +76,10 @@ app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-change-me')
 app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # 25MB por archivo
 app.config['UPLOAD_EXTENSIONS'] = ['.xlsx', '.xls']
 
+# Los workers de ProcessPoolExecutor (siempre con spawn, ver _parsear_archivos_listas) vuelven a importar este módulo:
+# la inicialización con efectos (DDL, migraciones, banner, hilos de fondo) solo corre en el proceso principal.
+_PROCESO_PRINCIPAL = multiprocessing.current_process().name == 'MainProcess'
+
 # Paginación por defecto para Ventas Avanzadas (configurable por variable de entorno)
 VENTAS_AVANZADAS_PER_PAGE = int(os.getenv('VENTAS_AVANZADAS_PER_PAGE', '20'))
 
@@ -88,6 +104,13 @@ DATABASE_URL = os.getenv('DATABASE_URL') if psycopg else None
 USE_SQLITE = os.getenv('USE_SQLITE', '1' if not DATABASE_URL else '0').strip().lower() in ('1', 'true', 'yes', 'y')
 DEBUG_LOG = os.getenv('DEBUG_LOG', '0').strip().lower() in ('1', 'true', 'yes', 'y')
 LISTAS_EN_DB = os.getenv('LISTAS_EN_DB', '0').strip().lower() in ('1', 'true', 'yes', 'y')
+# Sin PostgreSQL, las listas (productos_listas/import_batches) se guardan en la base SQLite local
+LISTAS_SQLITE = bool(
+    LISTAS_EN_DB and USE_SQLITE and not (DATABASE_URL and psycopg)
+    and os.getenv('LISTAS_SQLITE', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+)
+# Hay una DB con las listas importadas (PostgreSQL o SQLite)
+LISTAS_DB = bool(LISTAS_EN_DB and ((DATABASE_URL and psycopg) or LISTAS_SQLITE))
 
 # Archivo de configuración persistente
 # En Railway, usar el volume montado en /app/listas_excel para persistencia
@@ -135,22 +158,24 @@ USAR_FALLBACK_EXCEL = app_config.get('usar_fallback_excel',
                                      os.getenv('USAR_FALLBACK_EXCEL', '1').strip().lower() in ('1', 'true', 'yes', 'y'))
 MODO_BARCODE_INTELIGENTE = app_config.get('modo_barcode_inteligente', True)
 BUSQUEDA_BARCODE_OPTIMIZADA = app_config.get('busqueda_barcode_optimizada', True)
-print(f'[CONFIG] app_config obtenido: {app_config}', flush=True)
-print(f'[CONFIG] USAR_FALLBACK_EXCEL final: {USAR_FALLBACK_EXCEL}', flush=True)
-print(f'[CONFIG] MODO_BARCODE_INTELIGENTE final: {MODO_BARCODE_INTELIGENTE}', flush=True)
-print(f'[CONFIG] BUSQUEDA_BARCODE_OPTIMIZADA final: {BUSQUEDA_BARCODE_OPTIMIZADA}', flush=True)
-
-# Print de configuración al iniciar
-print('=' * 60, flush=True)
-print('[CONFIG] Configuración de la aplicación:', flush=True)
-print(f'[CONFIG] DATABASE_URL: {"Configurado" if DATABASE_URL else "NO configurado"}', flush=True)
-print(f'[CONFIG] psycopg disponible: {psycopg is not None}', flush=True)
-print(f'[CONFIG] USE_SQLITE: {USE_SQLITE}', flush=True)
-print(f'[CONFIG] LISTAS_EN_DB: {LISTAS_EN_DB}', flush=True)
-print(f'[CONFIG] USAR_FALLBACK_EXCEL: {USAR_FALLBACK_EXCEL}', flush=True)
-print(f'[CONFIG] DEBUG_LOG: {DEBUG_LOG}', flush=True)
-print(f'[CONFIG] Condición para búsqueda en DB: LISTAS_EN_DB={LISTAS_EN_DB} AND DATABASE_URL={bool(DATABASE_URL)} AND psycopg={psycopg is not None} = {LISTAS_EN_DB and DATABASE_URL and psycopg}', flush=True)
-print('=' * 60, flush=True)
+if _PROCESO_PRINCIPAL:
+    print(f'[CONFIG] app_config obtenido: {app_config}', flush=True)
+    print(f'[CONFIG] USAR_FALLBACK_EXCEL final: {USAR_FALLBACK_EXCEL}', flush=True)
+    print(f'[CONFIG] MODO_BARCODE_INTELIGENTE final: {MODO_BARCODE_INTELIGENTE}', flush=True)
+    print(f'[CONFIG] BUSQUEDA_BARCODE_OPTIMIZADA final: {BUSQUEDA_BARCODE_OPTIMIZADA}', flush=True)
+
+    # Print de configuración al iniciar
+    print('=' * 60, flush=True)
+    print('[CONFIG] Configuración de la aplicación:', flush=True)
+    print(f'[CONFIG] DATABASE_URL: {"Configurado" if DATABASE_URL else "NO configurado"}', flush=True)
+    print(f'[CONFIG] psycopg disponible: {psycopg is not None}', flush=True)
+    print(f'[CONFIG] USE_SQLITE: {USE_SQLITE}', flush=True)
+    print(f'[CONFIG] LISTAS_EN_DB: {LISTAS_EN_DB}', flush=True)
+    print(f'[CONFIG] LISTAS_SQLITE: {LISTAS_SQLITE}', flush=True)
+    print(f'[CONFIG] USAR_FALLBACK_EXCEL: {USAR_FALLBACK_EXCEL}', flush=True)
+    print(f'[CONFIG] DEBUG_LOG: {DEBUG_LOG}', flush=True)
+    print(f'[CONFIG] Condición para búsqueda en DB: LISTAS_EN_DB={LISTAS_EN_DB} AND DATABASE_URL={bool(DATABASE_URL)} AND psycopg={psycopg is not None} = {LISTAS_EN_DB and DATABASE_URL and psycopg}', flush=True)
+    print('=' * 60, flush=True)
 
 
 def log_debug(*parts):
@@ -161,10 +186,291 @@ def log_debug(*parts):
             pass
 
 
+# --- POOL DE CONEXIONES POSTGRESQL ---
+# Cada búsqueda / escaneo / inserción de historial pedía una conexión nueva (handshake TLS + auth).
+# El pool mantiene conexiones abiertas y las reparte entre los hilos de waitress.
+PG_POOL_ENABLED = os.getenv('PG_POOL', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+PG_POOL_MIN = max(0, int(os.getenv('PG_POOL_MIN', '1')))
+PG_POOL_MAX = max(1, int(os.getenv('PG_POOL_MAX', '10')))
+PG_POOL_IDLE_TIMEOUT = float(os.getenv('PG_POOL_IDLE_TIMEOUT', '300'))  # segundos ociosa antes de cerrarla
+PG_POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', '15'))  # espera máxima por una conexión libre
+PG_POOL_CHECK = os.getenv('PG_POOL_CHECK', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+PG_POOL_CHECK_IDLE = float(os.getenv('PG_POOL_CHECK_IDLE', '30'))  # verificar con SELECT 1 si estuvo ociosa más de N s (0 = siempre)
+
+
+class _PgPool:
+    """Pool de conexiones psycopg thread-safe (mín/máx, timeout de ociosas, verificación al prestar)."""
+
+    def __init__(self, dsn, min_size=1, max_size=10, idle_timeout=300.0, timeout=15.0,
+                 check=True, check_idle=30.0):
+        self.dsn = dsn
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.check = check
+        self.check_idle = check_idle
+        self._cond = threading.Condition()
+        self._ociosas = []  # [(conn, devuelta_en)], la última es la más reciente (LIFO)
+        self._en_uso = 0
+        self._pid = os.getpid()
+        self.stats = {
+            'prestamos': 0,
+            'devoluciones': 0,
+            'conexiones_creadas': 0,
+            'conexiones_cerradas': 0,
+            'verificaciones_fallidas': 0,
+            'esperas': 0,
+            'timeouts': 0,
+            'errores_conexion': 0,
+        }
+
+    def _conectar(self):
+        kwargs = {'row_factory': dict_row} if dict_row else {}
+        conn = psycopg.connect(self.dsn, **kwargs)
+        with self._cond:
+            self.stats['conexiones_creadas'] += 1
+        return conn
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.stats['conexiones_cerradas'] += 1
+
+    def _verificar(self, conn, devuelta_en):
+        """True si la conexión sigue usable. Hace un ping solo si estuvo ociosa un rato."""
+        try:
+            if conn.closed or conn.broken:
+                return False
+            if not self.check or (time.monotonic() - devuelta_en) < self.check_idle:
+                return True
+            conn.execute('SELECT 1')
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _purgar_ociosas(self):
+        """Quita (bajo lock) las ociosas vencidas por encima del mínimo y las devuelve para cerrarlas."""
+        if self.idle_timeout <= 0:
+            return []
+        ahora = time.monotonic()
+        vencidas = []
+        while self._ociosas and (len(self._ociosas) + self._en_uso) > self.min_size:
+            conn, devuelta_en = self._ociosas[0]
+            if ahora - devuelta_en < self.idle_timeout:
+                break
+            self._ociosas.pop(0)
+            vencidas.append(conn)
+        return vencidas
+
+    def _reiniciar_si_fork(self):
+        # Un proceso hijo no debe reutilizar los sockets del padre
+        if self._pid != os.getpid():
+            self._ociosas = []
+            self._en_uso = 0
+            self._pid = os.getpid()
+
+    def prefill(self):
+        for _ in range(self.min_size):
+            try:
+                conn = self._conectar()
+            except Exception as e:
+                log_debug('_PgPool.prefill: error conectando:', e)
+                break
+            with self._cond:
+                self._ociosas.append((conn, time.monotonic()))
+
+    def getconn(self):
+        limite = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            devuelta_en = None
+            with self._cond:
+                self._reiniciar_si_fork()
+                vencidas = self._purgar_ociosas()
+                while True:
+                    if self._ociosas:
+                        conn, devuelta_en = self._ociosas.pop()
+                        break
+                    if len(self._ociosas) + self._en_uso < self.max_size:
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.stats['timeouts'] += 1
+                        raise TimeoutError(f'No hay conexiones PostgreSQL libres (máx {self.max_size}) tras {self.timeout}s')
+                    self.stats['esperas'] += 1
+                    self._cond.wait(restante)
+                self._en_uso += 1
+                self.stats['prestamos'] += 1
+            for vieja in vencidas:
+                self._cerrar(vieja)
+            if conn is not None:
+                if self._verificar(conn, devuelta_en):
+                    return conn
+                with self._cond:
+                    self.stats['verificaciones_fallidas'] += 1
+                    self._en_uso -= 1
+                    self.stats['prestamos'] -= 1
+                    self._cond.notify()
+                self._cerrar(conn)
+                continue  # probar con otra ociosa o crear una nueva
+            try:
+                return self._conectar()
+            except Exception:
+                with self._cond:
+                    self.stats['errores_conexion'] += 1
+                    self._en_uso -= 1
+                    self.stats['prestamos'] -= 1
+                    self._cond.notify()
+                raise
+
+    def putconn(self, conn):
+        reutilizable = False
+        try:
+            if not conn.closed and not conn.broken:
+                status = conn.info.transaction_status
+                if status != psycopg.pq.TransactionStatus.IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+                reutilizable = conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+        except Exception as e:
+            log_debug('_PgPool.putconn: conexión descartada:', e)
+            reutilizable = False
+        with self._cond:
+            if self._pid == os.getpid():
+                self._en_uso = max(0, self._en_uso - 1)
+            self.stats['devoluciones'] += 1
+            if reutilizable:
+                self._ociosas.append((conn, time.monotonic()))
+            vencidas = self._purgar_ociosas()
+            self._cond.notify()
+        if not reutilizable:
+            self._cerrar(conn)
+        for vieja in vencidas:
+            self._cerrar(vieja)
+
+    def snapshot(self):
+        with self._cond:
+            datos = dict(self.stats)
+            datos.update({
+                'min': self.min_size,
+                'max': self.max_size,
+                'ociosas': len(self._ociosas),
+                'en_uso': self._en_uso,
+                'idle_timeout': self.idle_timeout,
+                'check': self.check,
+            })
+        return datos
+
+
+class _ConexionPool:
+    """Envuelve una conexión del pool y respeta la semántica de `with psycopg.connect(...)`:
+    al salir hace commit (o rollback si hubo excepción) y la devuelve al pool en vez de cerrarla.
+    """
+
+    __slots__ = ('_conn', '_pool')
+
+    def __init__(self, conn, pool):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pool', pool)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg.OperationalError('la conexión ya fue devuelta al pool')
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn
+        if conn is None:
+            return
+        try:
+            if not conn.closed and not conn.autocommit:
+                if exc_type is None:
+                    conn.commit()
+                else:
+                    conn.rollback()
+        finally:
+            self.close()
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        self._pool.putconn(conn)
+
+    @property
+    def closed(self):
+        conn = self._conn
+        return True if conn is None else conn.closed
+
+    def __del__(self):
+        # Red de seguridad: si alguien olvidó cerrar, la conexión vuelve al pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_PG_POOL = None
+_PG_POOL_LOCK = threading.Lock()
+
+
+def _get_pg_pool():
+    global _PG_POOL
+    if _PG_POOL is not None:
+        return _PG_POOL
+    with _PG_POOL_LOCK:
+        if _PG_POOL is None:
+            pool = _PgPool(
+                DATABASE_URL,
+                min_size=PG_POOL_MIN,
+                max_size=PG_POOL_MAX,
+                idle_timeout=PG_POOL_IDLE_TIMEOUT,
+                timeout=PG_POOL_TIMEOUT,
+                check=PG_POOL_CHECK,
+                check_idle=PG_POOL_CHECK_IDLE,
+            )
+            pool.prefill()
+            _PG_POOL = pool
+            print(f'[INFO] Pool PostgreSQL creado (min={pool.min_size}, max={pool.max_size}, idle_timeout={pool.idle_timeout}s)', flush=True)
+    return _PG_POOL
+
+
+def pg_pool_stats():
+    """Estadísticas del pool para /health (None si el pool no está activo)."""
+    if not PG_POOL_ENABLED or _PG_POOL is None:
+        return None
+    try:
+        return _PG_POOL.snapshot()
+    except Exception:
+        return None
+
+
 def get_pg_conn():
     if not DATABASE_URL or not psycopg:
         log_debug('get_pg_conn: sin DATABASE_URL o psycopg no disponible.')
         return None
+    if PG_POOL_ENABLED:
+        try:
+            pool = _get_pg_pool()
+            return _ConexionPool(pool.getconn(), pool)
+        except Exception as e:
+            log_debug('Error obteniendo conexión del pool PostgreSQL:', e)
+            return None
     try:
         kwargs = {'row_factory': dict_row} if dict_row else {}
         conn = psycopg.connect(DATABASE_URL, **kwargs)
@@ -253,6 +559,15 @@ def ensure_pg_tables():
                 CREATE INDEX IF NOT EXISTS idx_prod_listas_prov_codigo ON productos_listas (proveedor_key, codigo);
                 CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo_dig ON productos_listas (codigo_digitos);
                 CREATE INDEX IF NOT EXISTS idx_prod_listas_arch_hoja ON productos_listas (archivo, hoja);
+
+                -- Códigos de barras ya resueltos a un único producto (ver barcode_aprendido_obtener)
+                CREATE TABLE IF NOT EXISTS codigos_barras_aprendidos (
+                    codigo_barras TEXT PRIMARY KEY,
+                    proveedor_key TEXT NOT NULL,
+                    codigo TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+                CREATE INDEX IF NOT EXISTS idx_barras_aprendidos_prov ON codigos_barras_aprendidos (proveedor_key);
                 """
             )
             
@@ -262,7 +577,87 @@ def ensure_pg_tables():
                 log_debug('ensure_pg_tables: columna iva verificada.')
             except Exception as col_err:
                 log_debug('ensure_pg_tables: error verificando columna iva:', col_err)
-            
+
+            # Atributos de búsqueda precalculados al importar (nombre con pulgadas, medidas y tokens)
+            try:
+                cur.execute(
+                    """
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS nombre_pulgadas TEXT;
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS medidas JSONB;
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS tokens TEXT[];
+                    """
+                )
+                log_debug('ensure_pg_tables: columnas de atributos de búsqueda verificadas.')
+            except Exception as col_err:
+                log_debug('ensure_pg_tables: error verificando columnas de atributos:', col_err)
+
+            # Importación por diferencias: hash del contenido de cada fila y conteos por lote
+            try:
+                cur.execute(
+                    """
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS fila_hash TEXT;
+                    ALTER TABLE import_batches ADD COLUMN IF NOT EXISTS filas_insertadas INT;
+                    ALTER TABLE import_batches ADD COLUMN IF NOT EXISTS filas_actualizadas INT;
+                    ALTER TABLE import_batches ADD COLUMN IF NOT EXISTS filas_borradas INT;
+                    ALTER TABLE import_batches ADD COLUMN IF NOT EXISTS filas_sin_cambios INT;
+                    """
+                )
+                log_debug('ensure_pg_tables: columnas de importación por diferencias verificadas.')
+            except Exception as col_err:
+                log_debug('ensure_pg_tables: error verificando columnas de importación por diferencias:', col_err)
+
+            # Búsqueda exacta por código con índices: codigo solo y dígitos sin ceros a la izquierda (lo llena la carga)
+            try:
+                cur.execute(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'productos_listas' AND column_name = 'codigo_digitos_nl'"
+                )
+                columna_nueva = cur.fetchone() is None
+                cur.execute(
+                    """
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS codigo_digitos_nl TEXT;
+                    CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo ON productos_listas (codigo);
+                    CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo_dig_nl ON productos_listas (codigo_digitos_nl);
+                    """
+                )
+                if columna_nueva:
+                    # Filas importadas antes de existir la columna (una sola vez)
+                    cur.execute(
+                        "UPDATE productos_listas SET codigo_digitos_nl = NULLIF(regexp_replace(codigo_digitos, '^0+', ''), '')"
+                    )
+                    print(f'[INFO] codigo_digitos_nl completado en {cur.rowcount} filas existentes.', flush=True)
+                log_debug('ensure_pg_tables: índices de búsqueda por código verificados.')
+            except Exception as col_err:
+                log_debug('ensure_pg_tables: error verificando índices de búsqueda por código:', col_err)
+
+            # Clave de código de barras precalculada por la carga (ver clave_codigo_barras)
+            try:
+                cur.execute(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'productos_listas' AND column_name = 'clave_barras'"
+                )
+                columna_nueva = cur.fetchone() is None
+                cur.execute(
+                    """
+                    ALTER TABLE productos_listas ADD COLUMN IF NOT EXISTS clave_barras TEXT;
+                    CREATE INDEX IF NOT EXISTS idx_prod_listas_clave_barras ON productos_listas (clave_barras);
+                    """
+                )
+                if columna_nueva:
+                    cur.execute(
+                        """
+                        UPDATE productos_listas SET clave_barras = CASE
+                            WHEN codigo_digitos ~ '^[0-9]{4}$' THEN 'ean:' || codigo_digitos
+                            WHEN codigo_digitos ~ '^99[2-8][0-9]{4}$' THEN 'cm:' || substr(codigo_digitos, 4)
+                            WHEN codigo ~ '^99[2-8][0-9]{4}\\.1$' THEN 'cm.1:' || substr(codigo, 4, 4)
+                        END
+                        """
+                    )
+                    print(f'[INFO] clave_barras completada en {cur.rowcount} filas existentes.', flush=True)
+                log_debug('ensure_pg_tables: clave de código de barras verificada.')
+            except Exception as col_err:
+                log_debug('ensure_pg_tables: error verificando clave de código de barras:', col_err)
+
             # Intentar crear índice GIN para búsquedas de texto con pg_trgm (requiere extensión habilitada)
             try:
                 cur.execute(
@@ -276,6 +671,19 @@ def ensure_pg_tables():
             except Exception as trgm_err:
                 log_debug('ensure_pg_tables: no se pudo crear índice GIN trgm (¿pg_trgm no habilitado?):', trgm_err)
                 print(f'[WARN] Índice GIN trgm no creado (extensión pg_trgm no habilitada): {trgm_err}', flush=True)
+
+            # Búsqueda por código parcial (codigo_digitos LIKE '%patron%'): con pg_trgm el LIKE usa este índice
+            # en lugar de recorrer toda la tabla (patrones de 3 o más dígitos)
+            try:
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo_dig_trgm
+                    ON productos_listas USING GIN (codigo_digitos gin_trgm_ops);
+                    """
+                )
+                log_debug('ensure_pg_tables: índice GIN trgm de codigo_digitos creado o ya existe.')
+            except Exception as trgm_err:
+                log_debug('ensure_pg_tables: no se pudo crear índice GIN trgm de codigo_digitos:', trgm_err)
         
         print('[SUCCESS] Tablas PostgreSQL verificadas correctamente.', flush=True)
         log_debug('ensure_pg_tables: tablas verificadas.')
@@ -291,7 +699,8 @@ def ensure_pg_tables():
 
 
 def get_sqlite_conn():
-    conn = sqlite3.connect(SQLITE_DB_PATH)
+    # timeout: con listas en SQLite, una búsqueda puede coincidir con la transacción de carga de un archivo
+    conn = sqlite3.connect(SQLITE_DB_PATH, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -339,12 +748,151 @@ def ensure_sqlite_tables():
         log_debug('ensure_sqlite_tables: tablas verificadas.')
     except Exception as e:
         log_debug('ensure_sqlite_tables: error creando tablas:', e)
+    if LISTAS_SQLITE:
+        ensure_sqlite_listas_tables()
+
+
+# Índice de texto de productos_listas en SQLite: FTS5 con tokenizador trigram (SQLite >= 3.34),
+# que resuelve LIKE '%subcadena%' de 3 o más caracteres sin recorrer la tabla.
+_SQLITE_LISTAS_FTS = {'activo': False}
+
+
+def ensure_sqlite_listas_tables():
+    """Crea productos_listas/import_batches (mismas columnas que en PostgreSQL, JSON como TEXT)
+    y la tabla FTS5 sobre nombre/código normalizados, mantenida por triggers.
+    """
+    try:
+        with get_sqlite_conn() as conn:
+            cur = conn.cursor()
+            # WAL: las búsquedas leen mientras el sync escribe
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS import_batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    proveedor_key TEXT,
+                    archivo TEXT,
+                    mtime REAL,
+                    started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TEXT,
+                    status TEXT,
+                    total_rows INTEGER,
+                    error TEXT,
+                    filas_insertadas INTEGER,
+                    filas_actualizadas INTEGER,
+                    filas_borradas INTEGER,
+                    filas_sin_cambios INTEGER
+                );
+
+                CREATE TABLE IF NOT EXISTS productos_listas (
+                    id INTEGER PRIMARY KEY,
+                    proveedor_key TEXT NOT NULL,
+                    proveedor_nombre TEXT,
+                    archivo TEXT NOT NULL,
+                    hoja TEXT NOT NULL,
+                    mtime REAL NOT NULL,
+                    codigo TEXT,
+                    codigo_digitos TEXT,
+                    codigo_normalizado TEXT,
+                    nombre TEXT,
+                    nombre_normalizado TEXT,
+                    precio REAL,
+                    precio_fuente TEXT,
+                    iva TEXT,
+                    precios TEXT,
+                    extra_datos TEXT,
+                    nombre_pulgadas TEXT,
+                    medidas TEXT,
+                    tokens TEXT,
+                    batch_id INTEGER,
+                    fila_hash TEXT,
+                    codigo_digitos_nl TEXT,
+                    clave_barras TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+
+                CREATE TABLE IF NOT EXISTS codigos_barras_aprendidos (
+                    codigo_barras TEXT PRIMARY KEY,
+                    proveedor_key TEXT NOT NULL,
+                    codigo TEXT NOT NULL,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS idx_barras_aprendidos_prov ON codigos_barras_aprendidos (proveedor_key);
+                """
+            )
+            columnas = {row[1] for row in cur.execute("PRAGMA table_info(productos_listas)").fetchall()}
+            if 'codigo_digitos_nl' not in columnas:
+                # Tabla creada antes de la columna: el índice por expresión se reemplaza por el de la columna
+                cur.execute("ALTER TABLE productos_listas ADD COLUMN codigo_digitos_nl TEXT")
+                cur.execute("UPDATE productos_listas SET codigo_digitos_nl = NULLIF(ltrim(codigo_digitos, '0'), '')")
+                cur.execute("DROP INDEX IF EXISTS idx_prod_listas_codigo_dig_nl")
+            if 'clave_barras' not in columnas:
+                cur.execute("ALTER TABLE productos_listas ADD COLUMN clave_barras TEXT")
+                cur.execute(
+                    """
+                    UPDATE productos_listas SET clave_barras = CASE
+                        WHEN codigo_digitos GLOB '[0-9][0-9][0-9][0-9]' THEN 'ean:' || codigo_digitos
+                        WHEN codigo_digitos GLOB '99[2-8][0-9][0-9][0-9][0-9]' THEN 'cm:' || substr(codigo_digitos, 4)
+                        WHEN codigo GLOB '99[2-8][0-9][0-9][0-9][0-9].1' THEN 'cm.1:' || substr(codigo, 4, 4)
+                    END
+                    """
+                )
+            cur.executescript(
+                """
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_prov_codigo ON productos_listas (proveedor_key, codigo);
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo ON productos_listas (codigo);
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo_dig ON productos_listas (codigo_digitos);
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_codigo_dig_nl ON productos_listas (codigo_digitos_nl);
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_clave_barras ON productos_listas (clave_barras);
+                CREATE INDEX IF NOT EXISTS idx_prod_listas_arch_hoja ON productos_listas (archivo, hoja);
+                CREATE INDEX IF NOT EXISTS idx_import_batches_archivo ON import_batches (archivo, status);
+                """
+            )
+            try:
+                existia = cur.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='productos_listas_fts'"
+                ).fetchone() is not None
+                cur.executescript(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS productos_listas_fts USING fts5(
+                        nombre_normalizado, codigo_normalizado, codigo_digitos,
+                        content='productos_listas', content_rowid='id', tokenize='trigram'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS productos_listas_fts_ai AFTER INSERT ON productos_listas BEGIN
+                        INSERT INTO productos_listas_fts (rowid, nombre_normalizado, codigo_normalizado, codigo_digitos)
+                        VALUES (new.id, new.nombre_normalizado, new.codigo_normalizado, new.codigo_digitos);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS productos_listas_fts_ad AFTER DELETE ON productos_listas BEGIN
+                        INSERT INTO productos_listas_fts (productos_listas_fts, rowid, nombre_normalizado, codigo_normalizado, codigo_digitos)
+                        VALUES ('delete', old.id, old.nombre_normalizado, old.codigo_normalizado, old.codigo_digitos);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS productos_listas_fts_au
+                    AFTER UPDATE OF nombre_normalizado, codigo_normalizado, codigo_digitos ON productos_listas BEGIN
+                        INSERT INTO productos_listas_fts (productos_listas_fts, rowid, nombre_normalizado, codigo_normalizado, codigo_digitos)
+                        VALUES ('delete', old.id, old.nombre_normalizado, old.codigo_normalizado, old.codigo_digitos);
+                        INSERT INTO productos_listas_fts (rowid, nombre_normalizado, codigo_normalizado, codigo_digitos)
+                        VALUES (new.id, new.nombre_normalizado, new.codigo_normalizado, new.codigo_digitos);
+                    END;
+                    """
+                )
+                if not existia:
+                    # Tabla de listas anterior al índice: se indexa lo que ya estaba cargado
+                    cur.execute("INSERT INTO productos_listas_fts (productos_listas_fts) VALUES ('rebuild')")
+                _SQLITE_LISTAS_FTS['activo'] = True
+            except sqlite3.Error as fts_err:
+                print(f'[WARN] SQLite sin FTS5/trigram ({sqlite3.sqlite_version}): búsqueda de listas con LIKE. {fts_err}', flush=True)
+            conn.commit()
+        log_debug('ensure_sqlite_listas_tables: tablas de listas verificadas, FTS:', _SQLITE_LISTAS_FTS['activo'])
+    except Exception as e:
+        print(f'[ERROR] ensure_sqlite_listas_tables: {e}', flush=True)
 
 
-if USE_SQLITE:
-    ensure_sqlite_tables()
-elif DATABASE_URL:
-    ensure_pg_tables()
+if _PROCESO_PRINCIPAL:
+    if USE_SQLITE:
+        ensure_sqlite_tables()
+    elif DATABASE_URL:
+        ensure_pg_tables()
 
 
 def maybe_migrate_historial_json_to_pg():
@@ -452,10 +1000,11 @@ def maybe_migrate_historial_json_to_sqlite():
         log_debug('maybe_migrate_historial_json_to_sqlite: error general', e)
 
 
-if DATABASE_URL and psycopg:
-    maybe_migrate_historial_json_to_pg()
-else:
-    maybe_migrate_historial_json_to_sqlite()
+if _PROCESO_PRINCIPAL:
+    if DATABASE_URL and psycopg:
+        maybe_migrate_historial_json_to_pg()
+    else:
+        maybe_migrate_historial_json_to_sqlite()
 
 # --- AUTENTICACIÓN BÁSICA ---
 def load_credentials():
@@ -540,7 +1089,8 @@ def save_credentials(data):
     except Exception as e:
         log_debug('save_credentials: error escribiendo auth.json', e)
 
-credentials_cache = load_credentials()
+# En los workers no: con la DB vacía cada uno crearía el usuario por defecto (las rutas la recargan igual)
+credentials_cache = load_credentials() if _PROCESO_PRINCIPAL else None
 
 def login_required(fn):
     @wraps(fn)
@@ -755,13 +1305,44 @@ EXCEL_PROVIDER_CONFIG = {
 }
 
 # --- FUNCIONES AUXILIARES ---
+# normalize_text: sin acentos, en minúsculas, solo [a-z0-9] y espacios simples. Lo que queda de cada carácter
+# (NFD sin marcas, lower() y el filtro) no depende de sus vecinos, así que se traduce carácter por carácter con
+# una tabla que se arma a medida que aparecen; el texto ASCII, casi todo, pasa por bytes.translate.
+def _normalizar_caracter(cp: int) -> str:
+    base = ''.join(c for c in unicodedata.normalize('NFD', chr(cp)) if unicodedata.category(c) != 'Mn').lower()
+    return ''.join(c for c in base if 'a' <= c <= 'z' or '0' <= c <= '9' or c.isspace())
+
+
+class _TablaNormalizacion(dict):
+    """Tabla de str.translate que calcula la traducción de un carácter la primera vez que aparece."""
+
+    def __missing__(self, cp):
+        traduccion = _normalizar_caracter(cp)
+        self[cp] = traduccion
+        return traduccion
+
+
+_NORMALIZAR_TABLA = _TablaNormalizacion()
+_NORMALIZAR_ASCII = bytes(ord(_normalizar_caracter(c) or chr(c)) for c in range(128)) + bytes(range(128, 256))
+_NORMALIZAR_ASCII_BORRAR = bytes(c for c in range(128) if not _normalizar_caracter(c))
+_NORMALIZADOS = {}  # texto corto (encabezados, códigos, consultas) -> normalizado
+
+
 def normalize_text(text):
     text = str(text)
-    text = ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
-    text = text.lower()
-    text = re.sub(r'[^a-z0-9\s]+', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    normalizado = _NORMALIZADOS.get(text)
+    if normalizado is not None:
+        return normalizado
+    if text.isascii():
+        normalizado = text.encode('ascii').translate(_NORMALIZAR_ASCII, _NORMALIZAR_ASCII_BORRAR).decode('ascii')
+    else:
+        normalizado = text.translate(_NORMALIZAR_TABLA)
+    normalizado = ' '.join(normalizado.split())
+    if len(text) <= 48:
+        if len(_NORMALIZADOS) >= 8192:
+            _NORMALIZADOS.clear()
+        _NORMALIZADOS[text] = normalizado
+    return normalizado
 
 
 _MEDIDA_RE = re.compile(r'(?<!\d)(\d+(?:[\.,]\d+)?)\s*(mm|cm|m)\b', re.IGNORECASE)
@@ -817,13 +1398,6 @@ def _query_texto_sin_medidas(query: str) -> str:
     return normalize_text(base)
 
 
-def _token_match_by_wordprefix(token: str, haystack_norm: str) -> bool:
-    if not token:
-        return True
-    patron = rf'(^|\s){re.escape(token)}'
-    return re.search(patron, haystack_norm) is not None
-
-
 def _expand_token_variants(token: str):
     """Devuelve variantes normalizadas de un token técnico/abreviado."""
     token = normalize_text(token)
@@ -913,49 +1487,130 @@ def _build_db_like_tokens(query: str):
     return dedup
 
 
-def producto_coincide_busqueda(nombre: str, codigo: str, query: str) -> bool:
-    query = (query or '').strip()
-    if not query:
+def atributos_busqueda_producto(nombre: str, codigo: str):
+    """Atributos derivados que se guardan por fila al importar, para no recalcularlos en cada búsqueda.
+    Devuelve (nombre_pulgadas, nombre_normalizado, medidas, tokens).
+    """
+    nombre = nombre or ''
+    nombre_pulgadas = formatear_pulgadas(nombre)
+    nombre_norm = normalize_text(nombre_pulgadas)
+    medidas = _extract_medidas(nombre)
+    if codigo:
+        medidas.extend(_extract_medidas(codigo))
+    return nombre_pulgadas, nombre_norm, medidas, sorted(set(nombre_norm.split()))
+
+
+def atributos_desde_fila(fila: dict):
+    """Arma (nombre_norm, codigo_norm, medidas, tokens_nombre) a partir de las columnas precalculadas.
+    Devuelve None si la fila no las tiene (importada antes de existir), y se recalculan.
+    """
+    if not isinstance(fila, dict):
+        return None
+    nombre_norm = fila.get('nombre_normalizado')
+    medidas = fila.get('medidas')
+    if nombre_norm is None or medidas is None:
+        return None
+    if isinstance(medidas, str):
+        try:
+            medidas = json.loads(medidas)
+        except Exception:
+            return None
+    if not isinstance(medidas, tuple):
+        medidas = [(float(v), u) for v, u in medidas]
+    tokens = fila.get('tokens')
+    if tokens is None:
+        tokens = nombre_norm.split()
+    return nombre_norm, fila.get('codigo_normalizado') or '', medidas, tokens
+
+
+class ConsultaCompilada:
+    """Consulta de búsqueda preparada una sola vez: texto normalizado sin medidas, variantes de cada token
+    (con la regex de inicio de palabra ya compilada) y medidas. producto_coincide_busqueda y
+    calcular_puntaje_relevancia la aceptan en lugar del texto, para no repetir ese trabajo en cada fila."""
+    __slots__ = ('query', 'query_norm', 'tokens', 'medidas')
+
+    def __init__(self, query: str):
+        self.query = (query or '').strip()
+        self.query_norm = _query_texto_sin_medidas(self.query)
+        tokens = []
+        for token in self.query_norm.split():
+            variants = _expand_token_variants(token)
+            if not variants:
+                continue
+            inicio_palabra = re.compile(r'(^|\s)(?:' + '|'.join(re.escape(v) for v in variants) + ')')
+            # (variantes, regex de inicio de palabra, alguna variante con espacios)
+            tokens.append((tuple(variants), inicio_palabra, any(' ' in v for v in variants)))
+        self.tokens = tuple(tokens)
+        self.medidas = _extract_medidas(self.query)
+
+
+_CONSULTAS_COMPILADAS = {}  # texto de la consulta -> ConsultaCompilada
+
+
+def compilar_consulta(query) -> ConsultaCompilada:
+    """ConsultaCompilada de `query` (texto o ya compilada). Las últimas consultas quedan memorizadas."""
+    if isinstance(query, ConsultaCompilada):
+        return query
+    consulta = _CONSULTAS_COMPILADAS.get(query)
+    if consulta is None:
+        consulta = ConsultaCompilada(query)
+        if len(_CONSULTAS_COMPILADAS) > 256:
+            _CONSULTAS_COMPILADAS.clear()
+        _CONSULTAS_COMPILADAS[query] = consulta
+    return consulta
+
+
+def _medidas_coinciden(valor_obj: float, unidad_obj: str, medidas_producto) -> bool:
+    return any(unidad == unidad_obj and abs(valor - valor_obj) <= 0.011 for valor, unidad in medidas_producto)
+
+
+def producto_coincide_busqueda(nombre: str, codigo: str, query, atributos=None) -> bool:
+    """`query`: texto de la consulta o ConsultaCompilada (conviene compilarla una vez al filtrar muchas filas)."""
+    consulta = compilar_consulta(query)
+    if not consulta.query:
         return True
 
-    nombre_norm = normalize_text(formatear_pulgadas(nombre or ''))
-    codigo_norm = normalize_text(codigo or '')
+    if atributos:
+        nombre_norm, codigo_norm, medidas_producto, _ = atributos
+    else:
+        nombre_norm = normalize_text(formatear_pulgadas(nombre or ''))
+        codigo_norm = normalize_text(codigo or '')
+        medidas_producto = None
     combinado = f"{nombre_norm} {codigo_norm}".strip()
 
-    tokens_texto = [t for t in _query_texto_sin_medidas(query).split() if t]
-    for token in tokens_texto:
-        variants = _expand_token_variants(token)
-        if not variants:
-            continue
-        if not any(
-            _token_match_by_wordprefix(v, combinado) or v in combinado
-            for v in variants
-        ):
+    # Un inicio de palabra también es una subcadena: basta con buscar cada variante en el texto
+    for variants, _, _ in consulta.tokens:
+        if not any(v in combinado for v in variants):
             return False
 
-    medidas_query = _extract_medidas(query)
-    if medidas_query:
-        medidas_producto = _extract_medidas(nombre or '')
-        if codigo:
-            medidas_producto.extend(_extract_medidas(codigo or ''))
+    if consulta.medidas:
+        if medidas_producto is None:
+            medidas_producto = _extract_medidas(nombre or '')
+            if codigo:
+                medidas_producto.extend(_extract_medidas(codigo or ''))
         if not medidas_producto:
             return False
-        for valor_obj, unidad_obj in medidas_query:
-            if not any((unidad == unidad_obj and abs(valor - valor_obj) <= 0.011) for valor, unidad in medidas_producto):
+        for valor_obj, unidad_obj in consulta.medidas:
+            if not _medidas_coinciden(valor_obj, unidad_obj, medidas_producto):
                 return False
 
     return True
 
 
-def calcular_puntaje_relevancia(nombre: str, codigo: str, query: str) -> int:
-    query = (query or '').strip()
-    if not query:
+def calcular_puntaje_relevancia(nombre: str, codigo: str, query, atributos=None) -> int:
+    """`query`: texto de la consulta o ConsultaCompilada."""
+    consulta = compilar_consulta(query)
+    if not consulta.query:
         return 0
 
-    nombre_norm = normalize_text(formatear_pulgadas(nombre or ''))
-    codigo_norm = normalize_text(codigo or '')
-    query_norm = _query_texto_sin_medidas(query)
-    tokens_texto = [t for t in query_norm.split() if t]
+    if atributos:
+        nombre_norm, codigo_norm, medidas_prod, tokens_nombre = atributos
+    else:
+        nombre_norm = normalize_text(formatear_pulgadas(nombre or ''))
+        codigo_norm = normalize_text(codigo or '')
+        medidas_prod = None
+        tokens_nombre = None
+    query_norm = consulta.query_norm
 
     puntaje = 0
 
@@ -969,26 +1624,26 @@ def calcular_puntaje_relevancia(nombre: str, codigo: str, query: str) -> int:
         if query_norm in nombre_norm:
             puntaje += 90
 
-    for token in tokens_texto:
-        variants = _expand_token_variants(token)
-        if not variants:
-            continue
-
-        if any(_token_match_by_wordprefix(v, nombre_norm) for v in variants):
+    for variants, inicio_palabra, con_espacios in consulta.tokens:
+        if tokens_nombre is not None and not con_espacios:
+            prefijo_nombre = any(t.startswith(variants) for t in tokens_nombre)
+        else:
+            prefijo_nombre = inicio_palabra.search(nombre_norm) is not None
+        if prefijo_nombre:
             puntaje += 28
         elif any(v in nombre_norm for v in variants):
             puntaje += 10
 
-        if any(_token_match_by_wordprefix(v, codigo_norm) for v in variants):
+        if inicio_palabra.search(codigo_norm) is not None:
             puntaje += 18
         elif any(v in codigo_norm for v in variants):
             puntaje += 8
 
-    medidas_q = _extract_medidas(query)
-    if medidas_q:
-        medidas_prod = _extract_medidas(nombre or '') + _extract_medidas(codigo or '')
-        for valor_q, unidad_q in medidas_q:
-            if any(unidad == unidad_q and abs(valor - valor_q) <= 0.011 for valor, unidad in medidas_prod):
+    if consulta.medidas:
+        if medidas_prod is None:
+            medidas_prod = _extract_medidas(nombre or '') + _extract_medidas(codigo or '')
+        for valor_q, unidad_q in consulta.medidas:
+            if _medidas_coinciden(valor_q, unidad_q, medidas_prod):
                 puntaje += 70
 
     if query_norm and nombre_norm:
@@ -998,9 +1653,75 @@ def calcular_puntaje_relevancia(nombre: str, codigo: str, query: str) -> int:
     return int(puntaje)
 
 
-def ordenar_resultados_por_relevancia(resultados: list, query: str):
+def puntaje_relevancia_sql(query: str):
+    """calcular_puntaje_relevancia como expresión de PostgreSQL sobre las columnas precalculadas de
+    productos_listas, para ordenar y cortar (LIMIT) en la DB. Devuelve (expresión, parámetros); la expresión
+    queda vacía si la consulta no suma puntos (todas las filas valen 0).
+    Da el mismo puntaje que la versión Python para filas con nombre_normalizado y medidas: si se cambia
+    una, cambiar la otra.
+    """
+    consulta = compilar_consulta(query)
+    if not consulta.query:
+        return '', []
+    query_norm = consulta.query_norm
+    codigo_norm = "COALESCE(codigo_normalizado, '')"
+    partes = []
+    params = []
+
+    if query_norm:
+        partes.append(
+            "(CASE WHEN nombre_normalizado = %s THEN 300 ELSE 0 END"
+            f" + CASE WHEN {codigo_norm} = %s THEN 260 ELSE 0 END"
+            " + CASE WHEN nombre_normalizado LIKE %s THEN 180 ELSE 0 END"
+            " + CASE WHEN strpos(nombre_normalizado, %s) > 0 THEN 90 ELSE 0 END)"
+        )
+        params.extend([query_norm, query_norm, f"{query_norm}%", query_norm])
+
+    # Los tokens normalizados solo tienen [a-z0-9]: van sin escapar en el patrón y en el LIKE
+    for variants, _, _ in consulta.tokens:
+        inicio_palabra = f"(^|\\s)({'|'.join(variants)})"
+        contiene = [f"%{v}%" for v in variants]
+        partes.append(
+            "(CASE WHEN nombre_normalizado ~ %s THEN 28 WHEN nombre_normalizado LIKE ANY(%s) THEN 10 ELSE 0 END"
+            f" + CASE WHEN {codigo_norm} ~ %s THEN 18 WHEN {codigo_norm} LIKE ANY(%s) THEN 8 ELSE 0 END)"
+        )
+        params.extend([inicio_palabra, contiene, inicio_palabra, contiene])
+
+    for valor_q, unidad_q in consulta.medidas:
+        partes.append(
+            "(CASE WHEN EXISTS (SELECT 1 FROM jsonb_array_elements(medidas) m"
+            " WHERE m->>1 = %s AND abs((m->>0)::float8 - %s) <= 0.011) THEN 70 ELSE 0 END)"
+        )
+        params.extend([unidad_q, float(valor_q)])
+
+    if not partes:
+        return '', []
+    expresion = ' + '.join(partes)
+    if query_norm:
+        expresion += " - LEAST(25, GREATEST(0, length(nombre_normalizado) - %s) / 6)"
+        params.append(len(query_norm))
+    return f"({expresion})", params
+
+
+def ordenar_resultados_por_relevancia(resultados: list, query, atributos: list = None):
+    """Ordena por puntaje de relevancia. `query`: texto o ConsultaCompilada. `atributos` (opcional) es una
+    lista paralela a `resultados` con los atributos precalculados de cada fila (ver atributos_desde_fila).
+    """
     if not resultados:
         return resultados
+    query = compilar_consulta(query)
+
+    if atributos is not None:
+        claves = []
+        for item, attrs in zip(resultados, atributos):
+            nombre = item.get('nombre') or item.get('producto') or ''
+            codigo = item.get('codigo') or ''
+            if attrs:
+                claves.append((-calcular_puntaje_relevancia(nombre, codigo, query, attrs), attrs[0]))
+            else:
+                claves.append((-calcular_puntaje_relevancia(nombre, codigo, query), normalize_text(formatear_pulgadas(nombre))))
+        orden = sorted(range(len(resultados)), key=claves.__getitem__)
+        return [resultados[i] for i in orden]
 
     def _extract(item):
         nombre = item.get('nombre') or item.get('producto') or ''
@@ -1281,6 +2002,90 @@ def buscar_productos_manual(productos, query):
     return resultados
 
 
+# --- CACHÉ DE LIBROS EXCEL PARSEADOS (búsqueda con fallback a Excel) ---
+# Clave: (ruta, mtime_ns, tamaño, fila de encabezado). En memoria con tope LRU de EXCEL_CACHE_MAX libros y,
+# si EXCEL_CACHE_DIR está definido, también en disco (pickle) para compartirlo entre workers y reinicios.
+EXCEL_CACHE_MAX = int(os.getenv('EXCEL_CACHE_MAX', '16'))
+EXCEL_CACHE_DIR = os.getenv('EXCEL_CACHE_DIR', '').strip()
+
+_EXCEL_CACHE = OrderedDict()  # clave -> {hoja: DataFrame}
+_EXCEL_CACHE_LOCK = threading.Lock()
+_EXCEL_CACHE_STATS = {'aciertos': 0, 'aciertos_disco': 0, 'lecturas': 0, 'descartes': 0}
+
+
+def _excel_cache_ruta_disco(file_path: str, header) -> str:
+    nombre = hashlib.sha1(f'{os.path.abspath(file_path)}|{header}'.encode('utf-8')).hexdigest()
+    return os.path.join(EXCEL_CACHE_DIR, nombre + '.pkl')
+
+
+def _excel_cache_leer_disco(file_path: str, header, firma):
+    try:
+        with open(_excel_cache_ruta_disco(file_path, header), 'rb') as fh:
+            guardado = pickle.load(fh)
+        if guardado.get('firma') == firma:
+            return guardado['hojas']
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        log_debug('leer_excel_cacheado: caché en disco ilegible', file_path, exc)
+    return None
+
+
+def _excel_cache_guardar_disco(file_path: str, header, firma, hojas):
+    try:
+        os.makedirs(EXCEL_CACHE_DIR, exist_ok=True)
+        destino = _excel_cache_ruta_disco(file_path, header)
+        # Escritura atómica: otro worker puede estar leyendo el mismo archivo
+        fd, temporal = tempfile.mkstemp(dir=EXCEL_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump({'firma': firma, 'hojas': hojas}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, destino)
+    except Exception as exc:
+        log_debug('leer_excel_cacheado: no se pudo guardar en disco', file_path, exc)
+
+
+def leer_excel_cacheado(file_path: str, header=0) -> dict:
+    """Equivalente a pd.read_excel(file_path, sheet_name=None, header=header) con caché.
+    Devuelve copias superficiales de los DataFrames: el llamador puede reasignar columnas sin
+    afectar la caché (no modificar valores in-place).
+    """
+    st = os.stat(file_path)
+    firma = (st.st_mtime_ns, st.st_size)
+    clave = (os.path.abspath(file_path), firma, header)
+    origen = None
+    with _EXCEL_CACHE_LOCK:
+        hojas = _EXCEL_CACHE.get(clave)
+        if hojas is not None:
+            _EXCEL_CACHE.move_to_end(clave)
+            _EXCEL_CACHE_STATS['aciertos'] += 1
+    if hojas is None and EXCEL_CACHE_DIR:
+        hojas = _excel_cache_leer_disco(file_path, header, firma)
+        origen = 'aciertos_disco'
+    if hojas is None:
+        hojas = pd.read_excel(file_path, sheet_name=None, header=header)
+        origen = 'lecturas'
+        if EXCEL_CACHE_DIR:
+            _excel_cache_guardar_disco(file_path, header, firma, hojas)
+    if origen is not None:
+        with _EXCEL_CACHE_LOCK:
+            _EXCEL_CACHE_STATS[origen] += 1
+            if EXCEL_CACHE_MAX > 0:
+                # Versiones anteriores del mismo libro ya no sirven
+                for vieja in [k for k in _EXCEL_CACHE if k[0] == clave[0] and k[2] == header and k != clave]:
+                    del _EXCEL_CACHE[vieja]
+                _EXCEL_CACHE[clave] = hojas
+                _EXCEL_CACHE.move_to_end(clave)
+                while len(_EXCEL_CACHE) > EXCEL_CACHE_MAX:
+                    _EXCEL_CACHE.popitem(last=False)
+                    _EXCEL_CACHE_STATS['descartes'] += 1
+    return {nombre: df.copy(deep=False) for nombre, df in hojas.items()}
+
+
+def excel_cache_stats():
+    with _EXCEL_CACHE_LOCK:
+        return dict(_EXCEL_CACHE_STATS, libros=len(_EXCEL_CACHE), max=EXCEL_CACHE_MAX, disco=EXCEL_CACHE_DIR or None)
+
+
 def build_producto_entry(fila, actual_cols, provider_key, proveedor_display_name, sheet_name, df_columns, codigo_override=None):
     def _sanitize_value(value):
         if isinstance(value, str):
@@ -1365,11 +2170,13 @@ def build_producto_entry(fila, actual_cols, provider_key, proveedor_display_name
     }
 
 
-def buscar_productos_por_codigos_multiples(codigos_lista: list, proveedor_filtrado: str = ''):
+def buscar_productos_por_codigos_multiples(codigos_lista: list, proveedor_filtrado: str = '', sin_ceros: list = ()):
     """
     Búsqueda optimizada de productos por múltiples códigos a la vez.
     Hace UNA SOLA query en lugar de múltiples queries secuenciales.
     Mucho más rápido para códigos de barras con muchas variantes.
+    `sin_ceros`: dígitos sin ceros a la izquierda que además se comparan con codigo_digitos_nl
+    (el criterio de buscar_productos_por_codigo_exacto para el código tal cual).
     """
     if not codigos_lista:
         return []
@@ -1378,226 +2185,89 @@ def buscar_productos_por_codigos_multiples(codigos_lista: list, proveedor_filtra
     codigos_limpios = [c.strip() for c in codigos_lista if c and c.strip()]
     if not codigos_limpios:
         return []
+    sin_ceros = [c for c in dict.fromkeys(sin_ceros) if c]
     
     prov_key_filter = provider_name_to_key(proveedor_filtrado) if proveedor_filtrado else ''
     resultados = []
     
-    # Si está habilitado el modo listas en DB y hay PostgreSQL disponible
-    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+    # Si está habilitado el modo listas en DB y hay PostgreSQL o SQLite disponible (o, sin DB, snapshots columnares)
+    if LISTAS_DB or snapshots_segmentos() is not None:
         print(f'[DEBUG buscar_productos_por_codigos_multiples] Buscando {len(codigos_limpios)} códigos en DB, prov_filter={prov_key_filter}', flush=True)
         try:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                # Construir query con IN para buscar todos los códigos de una vez
-                # Separar códigos numéricos de no-numéricos para optimizar
-                codigos_numericos = [c for c in codigos_limpios if c.replace('.', '').isdigit()]
-                codigos_no_numericos = [c for c in codigos_limpios if not c.replace('.', '').isdigit()]
+            # Construir query con IN para buscar todos los códigos de una vez
+            # Separar códigos numéricos de no-numéricos para optimizar
+            codigos_numericos = [c for c in codigos_limpios if c.replace('.', '').isdigit()]
+            codigos_no_numericos = [c for c in codigos_limpios if not c.replace('.', '').isdigit()]
                 
-                if codigos_numericos:
-                    # Para códigos numéricos, usar la lógica expandida
+            # Fragmentos de código de barras (y grupos completos de prefijos Crossmaster): una sola clave indexada
+            claves_barras, codigos_numericos = claves_barras_de_variantes(codigos_numericos)
+
+            if codigos_numericos or claves_barras or sin_ceros:
+                # Para códigos numéricos, usar la lógica expandida
+                rows = catalogo_buscar_codigos(codigos_numericos, codigos_numericos, sin_ceros, prov_key_filter,
+                                               claves_barras=claves_barras)
+                if rows is None:
+                    condiciones = []
+                    params = []
+                    if codigos_numericos:
+                        condiciones.append("codigo = ANY(%s) OR codigo_digitos = ANY(%s)")
+                        params += [codigos_numericos, codigos_numericos]
+                    if sin_ceros:
+                        condiciones.append("codigo_digitos_nl = ANY(%s)")
+                        params.append(sin_ceros)
+                    if claves_barras:
+                        condiciones.append("clave_barras = ANY(%s)")
+                        params.append(claves_barras)
+                    where = f"({' OR '.join(condiciones)})"
                     if prov_key_filter:
+                        where += " AND proveedor_key = %s"
+                        params.append(prov_key_filter)
+                    with get_pg_conn() as conn, conn.cursor() as cur:
                         cur.execute(
-                            """
+                            f"""
                             SELECT
                                    proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
                             FROM productos_listas
-                            WHERE (
-                                codigo = ANY(%s)
-                                OR codigo_digitos = ANY(%s)
-                            ) AND proveedor_key = %s
+                            WHERE {where}
                             ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
                             """,
-                            (codigos_numericos, codigos_numericos, prov_key_filter)
+                            params
                         )
-                    else:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE (
-                                codigo = ANY(%s)
-                                OR codigo_digitos = ANY(%s)
+                        rows = cur.fetchall()
+                print(f'[DEBUG buscar_productos_por_codigos_multiples] Encontrados {len(rows)} productos con códigos numéricos', flush=True)
+
+                resultados.extend(_producto_fila_codigo(r) for r in rows)
+
+            # Si hay códigos no numéricos, buscarlos por separado
+            if codigos_no_numericos:
+                rows = catalogo_buscar_codigos(codigos_no_numericos, prov_key_filter=prov_key_filter)
+                if rows is None:
+                    with get_pg_conn() as conn, conn.cursor() as cur:
+                        if prov_key_filter:
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
+                                FROM productos_listas
+                                WHERE codigo = ANY(%s) AND proveedor_key = %s
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigos_no_numericos, prov_key_filter)
                             )
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigos_numericos, codigos_numericos)
-                        )
-                    
-                    rows = cur.fetchall()
-                    print(f'[DEBUG buscar_productos_por_codigos_multiples] Encontrados {len(rows)} productos con códigos numéricos', flush=True)
-                    
-                    # Procesar resultados (mismo código que buscar_productos_por_codigo_exacto)
-                    for r in rows:
-                        if isinstance(r, dict):
-                            prov_key = r.get('proveedor_key')
-                            prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
-                            hoja = r.get('hoja')
-                            codigo_raw = r.get('codigo') or ''
-                            nombre_raw = r.get('nombre') or ''
-                            precio_db = r.get('precio')
-                            iva_db = r.get('iva')
-                            precios_json = r.get('precios') or {}
-                            extra_json = r.get('extra_datos') or {}
-                            archivo = r.get('archivo')
                         else:
-                            prov_key = r[0]
-                            prov_name = r[1] or get_proveedor_display_name(prov_key)
-                            archivo = r[2]
-                            hoja = r[3]
-                            codigo_raw = r[4] or ''
-                            nombre_raw = r[5] or ''
-                            precio_db = r[6]
-                            iva_db = r[7]
-                            precios_json = r[8] or {}
-                            extra_json = r[9] or {}
-                        
-                        # Parsear JSONB si viene como string
-                        if isinstance(precios_json, str):
-                            try:
-                                precios_json = json.loads(precios_json)
-                            except:
-                                precios_json = {}
-                        if isinstance(extra_json, str):
-                            try:
-                                extra_json = json.loads(extra_json)
-                            except:
-                                extra_json = {}
-                        
-                        # Construir dict de precios
-                        precios_a_mostrar = {}
-                        if precio_db is not None and precio_db > 0:
-                            precio_float = float(precio_db) if hasattr(precio_db, '__float__') else precio_db
-                            if prov_key == 'brementools':
-                                precios_a_mostrar['Precio de Venta'] = precio_float
-                            elif prov_key == 'crossmaster':
-                                precios_a_mostrar['Precio Lista'] = precio_float
-                            elif prov_key == 'berger':
-                                precios_a_mostrar['Precio'] = precio_float
-                            elif prov_key == 'chiesa':
-                                precios_a_mostrar['Pr.Unit'] = precio_float
-                            elif prov_key == 'cachan':
-                                precios_a_mostrar['Precio'] = precio_float
-                            else:
-                                precios_a_mostrar['Precio'] = precio_float
-                        
-                        if precios_json:
-                            for k, v in precios_json.items():
-                                if v is not None and v != '':
-                                    try:
-                                        precios_a_mostrar[k] = float(v) if hasattr(v, '__float__') else v
-                                    except:
-                                        precios_a_mostrar[k] = v
-                        
-                        resultados.append({
-                            'codigo': codigo_raw,
-                            'producto': nombre_raw,
-                            'proveedor': f"{prov_name} (Hoja: {hoja})" if hoja else prov_name,
-                            'proveedor_key': prov_key,
-                            'sheet_name': hoja or '',
-                            'iva': iva_db if iva_db is not None else 'N/A',
-                            'precios': precios_a_mostrar,
-                            'extra_datos': extra_json,
-                            'precios_calculados': {},
-                            'fuente': 'DB'
-                        })
-                
-                # Si hay códigos no numéricos, buscarlos por separado
-                if codigos_no_numericos:
-                    if prov_key_filter:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE codigo = ANY(%s) AND proveedor_key = %s
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigos_no_numericos, prov_key_filter)
-                        )
-                    else:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE codigo = ANY(%s)
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigos_no_numericos,)
-                        )
-                    
-                    # Procesar estos resultados también (mismo código)
-                    rows = cur.fetchall()
-                    for r in rows:
-                        if isinstance(r, dict):
-                            prov_key = r.get('proveedor_key')
-                            prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
-                            hoja = r.get('hoja')
-                            codigo_raw = r.get('codigo') or ''
-                            nombre_raw = r.get('nombre') or ''
-                            precio_db = r.get('precio')
-                            iva_db = r.get('iva')
-                            precios_json = r.get('precios') or {}
-                            extra_json = r.get('extra_datos') or {}
-                        else:
-                            prov_key = r[0]
-                            prov_name = r[1] or get_proveedor_display_name(prov_key)
-                            hoja = r[3]
-                            codigo_raw = r[4] or ''
-                            nombre_raw = r[5] or ''
-                            precio_db = r[6]
-                            iva_db = r[7]
-                            precios_json = r[8] or {}
-                            extra_json = r[9] or {}
-
-                        if isinstance(precios_json, str):
-                            try:
-                                precios_json = json.loads(precios_json)
-                            except Exception:
-                                precios_json = {}
-                        if isinstance(extra_json, str):
-                            try:
-                                extra_json = json.loads(extra_json)
-                            except Exception:
-                                extra_json = {}
-
-                        precios_a_mostrar = {}
-                        if precio_db is not None and precio_db > 0:
-                            precio_float = float(precio_db) if hasattr(precio_db, '__float__') else precio_db
-                            if prov_key == 'brementools':
-                                precios_a_mostrar['Precio de Venta'] = precio_float
-                            elif prov_key == 'crossmaster':
-                                precios_a_mostrar['Precio Lista'] = precio_float
-                            elif prov_key == 'berger':
-                                precios_a_mostrar['Precio'] = precio_float
-                            elif prov_key == 'chiesa':
-                                precios_a_mostrar['Pr.Unit'] = precio_float
-                            elif prov_key == 'cachan':
-                                precios_a_mostrar['Precio'] = precio_float
-                            else:
-                                precios_a_mostrar['Precio'] = precio_float
-
-                        if precios_json:
-                            for k, v in precios_json.items():
-                                if v is not None and v != '':
-                                    try:
-                                        precios_a_mostrar[k] = float(v) if hasattr(v, '__float__') else v
-                                    except Exception:
-                                        precios_a_mostrar[k] = v
-
-                        resultados.append({
-                            'codigo': codigo_raw,
-                            'producto': nombre_raw,
-                            'proveedor': f"{prov_name} (Hoja: {hoja})" if hoja else prov_name,
-                            'proveedor_key': prov_key,
-                            'sheet_name': hoja or '',
-                            'iva': iva_db if iva_db is not None else 'N/A',
-                            'precios': precios_a_mostrar,
-                            'extra_datos': extra_json,
-                            'precios_calculados': {},
-                            'fuente': 'DB'
-                        })
-                        
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
+                                FROM productos_listas
+                                WHERE codigo = ANY(%s)
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigos_no_numericos,)
+                            )
+                        rows = cur.fetchall()
+                resultados.extend(_producto_fila_codigo(r) for r in rows)
+
         except Exception as exc:
             print(f'[ERROR buscar_productos_por_codigos_multiples] Error en búsqueda DB: {exc}', flush=True)
     
@@ -1624,205 +2294,95 @@ def buscar_productos_por_codigo_exacto(codigo_exacto: str, proveedor_filtrado: s
     prov_key_filter = provider_name_to_key(proveedor_filtrado) if proveedor_filtrado else ''
     resultados = []
 
-    # Si está habilitado el modo listas en DB y hay PostgreSQL disponible
-    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+    # Si está habilitado el modo listas en DB y hay PostgreSQL o SQLite disponible (o, sin DB, snapshots columnares)
+    if LISTAS_DB or snapshots_segmentos() is not None:
         print(f'[DEBUG buscar_productos_por_codigo_exacto] Buscando en DB: codigo={codigo_limpio}, prov_filter={prov_key_filter}', flush=True)
         try:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                # Ampliar criterios de igualdad cuando el código ingresado es numérico:
-                # - Igualdad exacta por columna codigo
-                # - Igualdad exacta por codigo_digitos
-                # - Igualdad ignorando ceros a la izquierda en codigo_digitos
-                es_numerico = codigo_limpio.isdigit()
-                if es_numerico:
-                    if prov_key_filter:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE (
-                                codigo = %s
-                                OR codigo_digitos = %s
-                                OR regexp_replace(codigo_digitos, '^0+', '') = regexp_replace(%s, '^0+', '')
-                            ) AND proveedor_key = %s
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigo_limpio, codigo_limpio, codigo_limpio, prov_key_filter)
-                        )
-                    else:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE (
-                                codigo = %s
-                                OR codigo_digitos = %s
-                                OR regexp_replace(codigo_digitos, '^0+', '') = regexp_replace(%s, '^0+', '')
+            es_numerico = codigo_limpio.isdigit()
+            if es_numerico:
+                rows = catalogo_buscar_codigos([codigo_limpio], [codigo_limpio], [codigo_limpio.lstrip('0')], prov_key_filter)
+            else:
+                rows = catalogo_buscar_codigos([codigo_limpio], prov_key_filter=prov_key_filter)
+            if rows is None:
+                with get_pg_conn() as conn, conn.cursor() as cur:
+                    # Ampliar criterios de igualdad cuando el código ingresado es numérico:
+                    # - Igualdad exacta por columna codigo
+                    # - Igualdad exacta por codigo_digitos
+                    # - Igualdad ignorando ceros a la izquierda (columna codigo_digitos_nl, indexada)
+                    if es_numerico:
+                        if prov_key_filter:
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime, nombre_pulgadas
+                                FROM productos_listas
+                                WHERE (
+                                    codigo = %s
+                                    OR codigo_digitos = %s
+                                    OR codigo_digitos_nl = %s
+                                ) AND proveedor_key = %s
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigo_limpio, codigo_limpio, codigo_limpio.lstrip('0'), prov_key_filter)
+                            )
+                        else:
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime, nombre_pulgadas
+                                FROM productos_listas
+                                WHERE (
+                                    codigo = %s
+                                    OR codigo_digitos = %s
+                                    OR codigo_digitos_nl = %s
+                                )
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigo_limpio, codigo_limpio, codigo_limpio.lstrip('0'))
                             )
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigo_limpio, codigo_limpio, codigo_limpio)
-                        )
-                else:
-                    if prov_key_filter:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE codigo = %s AND proveedor_key = %s
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigo_limpio, prov_key_filter)
-                        )
-                    else:
-                        cur.execute(
-                            """
-                            SELECT
-                                   proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime
-                            FROM productos_listas
-                            WHERE codigo = %s
-                            ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
-                            """,
-                            (codigo_limpio,)
-                        )
-                rows = cur.fetchall()
-                print(f'[DEBUG buscar_productos_por_codigo_exacto] Resultados de DB: {len(rows)} filas', flush=True)
-                if DEBUG_LOG:
-                    log_debug(f'buscar_productos_por_codigo_exacto: encontrados {len(rows)} resultados')
-                
-                for r in rows:
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: fila raw = {r}')
-                    
-                    if isinstance(r, dict):
-                        prov_key = r.get('proveedor_key')
-                        prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
-                        hoja = r.get('hoja')
-                        codigo_raw = r.get('codigo') or ''
-                        nombre_raw = r.get('nombre') or ''
-                        precio_db = r.get('precio')
-                        iva_db = r.get('iva')
-                        precios_json = r.get('precios') or {}
-                        extra_json = r.get('extra_datos') or {}
-                        archivo = r.get('archivo')
-                        mtime_row = r.get('mtime')
                     else:
-                        prov_key = r[0]
-                        prov_name = r[1] or get_proveedor_display_name(prov_key)
-                        archivo = r[2]
-                        hoja = r[3]
-                        codigo_raw = r[4] or ''
-                        nombre_raw = r[5] or ''
-                        precio_db = r[6]
-                        iva_db = r[7]
-                        precios_json = r[8] or {}
-                        extra_json = r[9] or {}
-                        mtime_row = r[10] if len(r) > 10 else None
-                    
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: extraído iva_db = "{iva_db}" (tipo: {type(iva_db)})')
-                    
-                    # Parsear JSONB si viene como string
-                    if isinstance(precios_json, str):
-                        try:
-                            precios_json = json.loads(precios_json)
-                        except:
-                            precios_json = {}
-                    if isinstance(extra_json, str):
-                        try:
-                            extra_json = json.loads(extra_json)
-                        except:
-                            extra_json = {}
-                    
-                    # Debug: verificar qué datos vienen de la DB
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: codigo={codigo_raw}, precio_db={precio_db}, iva_db={iva_db}, precios_json={precios_json}, prov_key={prov_key}')
-                    
-                    # Construir dict de precios con nombre apropiado según proveedor
-                    precios_a_mostrar = {}
-                    if precio_db is not None and precio_db > 0:
-                        # Convertir Decimal a float para compatibilidad con template
-                        precio_float = float(precio_db) if hasattr(precio_db, '__float__') else precio_db
-                        # Determinar el nombre del precio canónico según el proveedor
-                        if prov_key == 'brementools':
-                            precios_a_mostrar['Precio de Venta'] = precio_float
-                        elif prov_key == 'crossmaster':
-                            precios_a_mostrar['Precio Lista'] = precio_float
-                        elif prov_key == 'berger':
-                            precios_a_mostrar['Precio'] = precio_float
-                        elif prov_key == 'chiesa':
-                            precios_a_mostrar['Pr.Unit'] = precio_float
-                        elif prov_key == 'cachan':
-                            precios_a_mostrar['Precio'] = precio_float
+                        if prov_key_filter:
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime, nombre_pulgadas
+                                FROM productos_listas
+                                WHERE codigo = %s AND proveedor_key = %s
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigo_limpio, prov_key_filter)
+                            )
                         else:
-                            precios_a_mostrar['Precio'] = precio_float
-                    
-                    # Agregar precios adicionales del JSONB
-                    if precios_json:
-                        for k, v in precios_json.items():
-                            if v is not None and v != '':
-                                # Convertir a float si es necesario
-                                v_float = float(v) if hasattr(v, '__float__') else v
-                                # Normalizar el nombre de la clave para comparación
-                                k_lower = str(k).lower().strip().replace('  ', ' ')
-                                # Usar nombres exactos para precios específicos
-                                if k_lower in ['precio neto', 'precioneto']:
-                                    k_display = 'Precio Neto'
-                                elif k_lower in ['precio neto unitario', 'precionetunitario']:
-                                    k_display = 'Precio Neto Unitario'
-                                elif k_lower in ['precio de lista', 'precio lista', 'preciolista', 'preciodelista']:
-                                    k_display = 'Precio de Lista'
-                                else:
-                                    # Capitalizar nombres de precios adicionales
-                                    k_display = k.title() if isinstance(k, str) else str(k)
-                                
-                                if k_display not in precios_a_mostrar:
-                                    precios_a_mostrar[k_display] = v_float
-                    
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: precios_a_mostrar={precios_a_mostrar}')
-                    
-                    iva_display = iva_db if iva_db else 'N/A'
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: iva_display final = "{iva_display}"')
-                    
-                    producto = {
-                        'codigo': str(codigo_raw),
-                        'producto': formatear_pulgadas(nombre_raw),
-                        'proveedor': f"{prov_name} (Hoja: {hoja})",
-                        'proveedor_key': prov_key,
-                        'sheet_name': hoja,
-                        'iva': iva_display,
-                        'precios': precios_a_mostrar,
-                        'extra_datos': extra_json,
-                        'precios_calculados': {},
-                        'fuente': 'DB'
-                    }
-                    if archivo:
-                        producto['archivo'] = archivo
-                    if mtime_row is not None:
-                        try:
-                            producto['fecha_archivo'] = ts_to_local(float(mtime_row)).strftime('%d/%m/%Y %H:%M')
-                        except Exception:
-                            producto['fecha_archivo'] = None
-                    
-                    if DEBUG_LOG:
-                        log_debug(f'buscar_productos_por_codigo_exacto: producto construido con iva = "{producto["iva"]}"')
-                    
-                    resultados.append(producto)
+                            cur.execute(
+                                """
+                                SELECT
+                                       proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, mtime, nombre_pulgadas
+                                FROM productos_listas
+                                WHERE codigo = %s
+                                ORDER BY proveedor_key, codigo, archivo, hoja, nombre, mtime DESC
+                                """,
+                                (codigo_limpio,)
+                            )
+                    rows = cur.fetchall()
+            print(f'[DEBUG buscar_productos_por_codigo_exacto] Resultados de DB: {len(rows)} filas', flush=True)
+            if DEBUG_LOG:
+                log_debug(f'buscar_productos_por_codigo_exacto: encontrados {len(rows)} resultados')
                 
-                # Sólo retornamos si hay resultados desde DB; si no, seguimos con fallback a Excel
-                if resultados:
-                    print(f'[DEBUG buscar_productos_por_codigo_exacto] Retornando {len(resultados)} resultados de DB', flush=True)
-                    return resultados
-                else:
-                    if not USAR_FALLBACK_EXCEL:
-                        print(f'[DEBUG buscar_productos_por_codigo_exacto] No hay resultados en DB y fallback a Excel está desactivado', flush=True)
-                        return []
-                    print(f'[DEBUG buscar_productos_por_codigo_exacto] No hay resultados en DB, usando fallback a Excel', flush=True)
+            for r in rows:
+                producto = _producto_fila_exacto(r)
+                if DEBUG_LOG:
+                    log_debug(f'buscar_productos_por_codigo_exacto: fila raw = {r} -> producto = {producto}')
+                resultados.append(producto)
+
+            # Sólo retornamos si hay resultados desde DB; si no, seguimos con fallback a Excel
+            if resultados:
+                print(f'[DEBUG buscar_productos_por_codigo_exacto] Retornando {len(resultados)} resultados de DB', flush=True)
+                return resultados
+            else:
+                if not USAR_FALLBACK_EXCEL:
+                    print(f'[DEBUG buscar_productos_por_codigo_exacto] No hay resultados en DB y fallback a Excel está desactivado', flush=True)
+                    return []
+                print(f'[DEBUG buscar_productos_por_codigo_exacto] No hay resultados en DB, usando fallback a Excel', flush=True)
         except Exception as exc:
             print(f'[ERROR buscar_productos_por_codigo_exacto] Error en DB: {exc}', flush=True)
             log_debug('buscar_productos_por_codigo_exacto(DB): error, se usa fallback Excel', exc)
@@ -1858,7 +2418,7 @@ def buscar_productos_por_codigo_exacto(codigo_exacto: str, proveedor_filtrado: s
 
         file_path = os.path.join(LISTAS_PATH, filename)
         try:
-            all_sheets = pd.read_excel(file_path, sheet_name=None, header=header_row_index)
+            all_sheets = leer_excel_cacheado(file_path, header=header_row_index)
         except Exception as exc:
             log_debug('buscar_productos_por_codigo_exacto: error leyendo', filename, exc)
             continue
@@ -1976,108 +2536,40 @@ def buscar_productos_por_codigo_patron(patron: str, proveedor_filtrado: str = ''
     prov_key_filter = provider_name_to_key(proveedor_filtrado) if proveedor_filtrado else ''
     resultados = []
 
-    # Si está habilitado el modo listas en DB y hay PostgreSQL disponible, consultar primero en la base
-    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+    # Si está habilitado el modo listas en DB y hay PostgreSQL o SQLite disponible (o, sin DB, snapshots columnares), consultar primero ahí
+    if LISTAS_DB or snapshots_segmentos() is not None:
         try:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                like_param = f"%{patron}%"
-                if prov_key_filter:
-                    cur.execute(
-                        """
-                        SELECT proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos
-                        FROM productos_listas
-                        WHERE codigo_digitos LIKE %s AND proveedor_key = %s
-                        ORDER BY proveedor_key, codigo
-                        LIMIT 500
-                        """,
-                        (like_param, prov_key_filter)
-                    )
-                else:
-                    cur.execute(
-                        """
-                        SELECT proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos
-                        FROM productos_listas
-                        WHERE codigo_digitos LIKE %s
-                        ORDER BY proveedor_key, codigo
-                        LIMIT 500
-                        """,
-                        (like_param,)
-                    )
-                rows = cur.fetchall()
-                for r in rows:
-                    if isinstance(r, dict):
-                        prov_key = r.get('proveedor_key')
-                        prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
-                        hoja = r.get('hoja')
-                        codigo_raw = r.get('codigo') or ''
-                        nombre_raw = r.get('nombre') or ''
-                        precio_db = r.get('precio')
-                        iva_text = r.get('iva') or 'N/A'
-                        precios_json = r.get('precios') or {}
-                        extra_json = r.get('extra_datos') or {}
+            rows = catalogo_buscar_patron_digitos(patron, prov_key_filter)
+            if rows is None:
+                with get_pg_conn() as conn, conn.cursor() as cur:
+                    like_param = f"%{patron}%"
+                    if prov_key_filter:
+                        cur.execute(
+                            """
+                            SELECT proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, nombre_pulgadas
+                            FROM productos_listas
+                            WHERE codigo_digitos LIKE %s AND proveedor_key = %s
+                            ORDER BY proveedor_key, codigo
+                            LIMIT 500
+                            """,
+                            (like_param, prov_key_filter)
+                        )
                     else:
-                        prov_key = r[0]
-                        prov_name = (r[1] or get_proveedor_display_name(prov_key))
-                        hoja = r[3]
-                        codigo_raw = r[4] or ''
-                        nombre_raw = r[5] or ''
-                        precio_db = r[6]
-                        iva_text = r[7] or 'N/A'
-                        precios_json = r[8] or {}
-                        extra_json = r[9] or {}
-
-                    if isinstance(precios_json, str):
-                        try:
-                            precios_json = json.loads(precios_json)
-                        except Exception:
-                            precios_json = {}
-                    if isinstance(extra_json, str):
-                        try:
-                            extra_json = json.loads(extra_json)
-                        except Exception:
-                            extra_json = {}
-
-                    precios_a_mostrar = {}
-                    if precio_db is not None and precio_db > 0:
-                        precio_float = float(precio_db) if hasattr(precio_db, '__float__') else precio_db
-                        if prov_key == 'brementools':
-                            precios_a_mostrar['Precio de Venta'] = precio_float
-                        elif prov_key == 'crossmaster':
-                            precios_a_mostrar['Precio Lista'] = precio_float
-                        elif prov_key == 'berger':
-                            precios_a_mostrar['Precio'] = precio_float
-                        elif prov_key == 'chiesa':
-                            precios_a_mostrar['Pr.Unit'] = precio_float
-                        elif prov_key == 'cachan':
-                            precios_a_mostrar['Precio'] = precio_float
-                        else:
-                            precios_a_mostrar['Precio'] = precio_float
-
-                    if precios_json:
-                        for k, v in precios_json.items():
-                            if v is not None and v != '':
-                                try:
-                                    precios_a_mostrar[k] = float(v) if hasattr(v, '__float__') else v
-                                except Exception:
-                                    precios_a_mostrar[k] = v
-
-                    producto = {
-                        'codigo': str(codigo_raw),
-                        'producto': formatear_pulgadas(nombre_raw),
-                        'proveedor': f"{prov_name} (Hoja: {hoja})",
-                        'proveedor_key': prov_key,
-                        'sheet_name': hoja,
-                        'iva': iva_text,
-                        'precios': precios_a_mostrar,
-                        'extra_datos': extra_json,
-                        'precios_calculados': {},
-                        'fuente': 'DB'
-                    }
-                    producto['codigo_coincidencia'] = ''.join(filter(str.isdigit, str(codigo_raw)))
-                    resultados.append(producto)
-                if resultados:
-                    resultados.sort(key=lambda p: (p.get('proveedor', ''), p.get('codigo', '')))
-                    return resultados
+                        cur.execute(
+                            """
+                            SELECT proveedor_key, proveedor_nombre, archivo, hoja, codigo, nombre, precio, iva, precios, extra_datos, nombre_pulgadas
+                            FROM productos_listas
+                            WHERE codigo_digitos LIKE %s
+                            ORDER BY proveedor_key, codigo
+                            LIMIT 500
+                            """,
+                            (like_param,)
+                        )
+                    rows = cur.fetchall()
+            resultados.extend(_producto_fila_patron(r) for r in rows)
+            if resultados:
+                resultados.sort(key=lambda p: (p.get('proveedor', ''), p.get('codigo', '')))
+                return resultados
         except Exception as exc:
             log_debug('buscar_productos_por_codigo_patron(DB): error, se usa fallback Excel', exc)
 
@@ -2107,7 +2599,7 @@ def buscar_productos_por_codigo_patron(patron: str, proveedor_filtrado: str = ''
 
         file_path = os.path.join(LISTAS_PATH, filename)
         try:
-            all_sheets = pd.read_excel(file_path, sheet_name=None, header=header_row_index)
+            all_sheets = leer_excel_cacheado(file_path, header=header_row_index)
         except Exception as exc:
             log_debug('buscar_productos_por_codigo_patron: error leyendo', filename, exc)
             continue
@@ -2172,6 +2664,7 @@ def _listas_provider_configs():
             'codigo': ['codigo', 'código', 'codigo ean', 'código ean', 'ean', 'cod'],
             'nombre': ['descripcion', 'descripción', 'producto', 'nombre'],
             'precio_canon': ['precio lista', 'precio de lista'],
+            'etiqueta_precio': 'Precio Lista',
             'iva': ['iva', 'i.v.a']
         },
         'berger': {
@@ -2179,6 +2672,7 @@ def _listas_provider_configs():
             'codigo': ['codigo', 'código', 'cod'],
             'nombre': ['detalle', 'descripcion', 'descripción', 'producto', 'nombre'],
             'precio_canon': ['precio', 'pventa'],
+            'etiqueta_precio': 'Precio',
             'iva': ['iva']
         },
         'brementools': {
@@ -2186,6 +2680,7 @@ def _listas_provider_configs():
             'codigo': ['codigo', 'código', 'codigo ean', 'código ean', 'ean'],
             'nombre': ['producto', 'descripcion', 'descripción'],
             'precio_canon': ['precio de venta', 'precio venta', 'precio venta con iva'],
+            'etiqueta_precio': 'Precio de Venta',
             'precios_extra': ['precio de lista', 'precio lista', 'precio neto', 'precioneto', 'precio neto unitario', 'precionetunitario'],
             'iva': ['iva'],
             'extras': ['cantidad']
@@ -2195,6 +2690,7 @@ def _listas_provider_configs():
             'codigo': ['codigo', 'código'],
             'nombre': ['nombre', 'producto', 'descripcion', 'descripción'],
             'precio_canon': ['precio'],
+            'etiqueta_precio': 'Precio',
             'iva': []
         },
         'chiesa': {
@@ -2202,13 +2698,195 @@ def _listas_provider_configs():
             'codigo': ['codigo', 'código'],
             'nombre': ['descripcion', 'descripción', 'producto', 'nombre'],
             'precio_canon': ['pr unit', 'prunit'],
+            'etiqueta_precio': 'Pr.Unit',
+            # Precios calculados que muestra la búsqueda: etiqueta -> factor sobre el precio
+            'precios_calculados': {'Costo (-4% extra)': 0.96, 'Costo (+4% extra)': 1.04},
             'iva': ['iva', 'i.v.a']
         },
         'manual': {
-            'header': 0
+            'header': 0,
+            'etiqueta_precio': 'Precio'
         }
     }
 
+
+# --- Mapeo de filas de productos_listas a productos de búsqueda ---
+# Una sola implementación para todas las búsquedas en DB (PostgreSQL, SQLite y catálogo): parsea los JSON,
+# pasa los precios a float y etiqueta el precio canónico según el proveedor. Lo que depende del proveedor
+# se resuelve con tablas armadas una vez desde _listas_provider_configs, no con if/elif por fila.
+_ETIQUETA_PRECIO = {key: cfg.get('etiqueta_precio', 'Precio') for key, cfg in _listas_provider_configs().items()}
+_PRECIOS_CALCULADOS = {
+    key: tuple(cfg['precios_calculados'].items())
+    for key, cfg in _listas_provider_configs().items() if cfg.get('precios_calculados')
+}
+_ETIQUETAS_PRECIO_EXTRA = {}  # clave del JSON de precios -> etiqueta a mostrar (se completa al usarse)
+_FECHAS_ARCHIVO = {}  # mtime -> fecha formateada
+
+
+def _etiqueta_precio_extra(clave) -> str:
+    etiqueta = _ETIQUETAS_PRECIO_EXTRA.get(clave)
+    if etiqueta is None:
+        k_lower = str(clave).lower().strip().replace('  ', ' ')
+        if k_lower in ('precio neto', 'precioneto'):
+            etiqueta = 'Precio Neto'
+        elif k_lower in ('precio neto unitario', 'precionetunitario'):
+            etiqueta = 'Precio Neto Unitario'
+        elif k_lower in ('precio de lista', 'precio lista', 'preciolista', 'preciodelista'):
+            etiqueta = 'Precio de Lista'
+        else:
+            etiqueta = clave.title() if isinstance(clave, str) else str(clave)
+        if len(_ETIQUETAS_PRECIO_EXTRA) < 10000:
+            _ETIQUETAS_PRECIO_EXTRA[clave] = etiqueta
+    return etiqueta
+
+
+def _json_fila(valor):
+    """Columna JSONB como dict: PostgreSQL ya la devuelve parseada, SQLite y el catálogo como texto."""
+    if type(valor) is dict:
+        return valor
+    if not valor:
+        return {}
+    if isinstance(valor, str):
+        if valor == '{}':
+            return {}
+        try:
+            return json.loads(valor)
+        except Exception:
+            return {}
+    return valor
+
+
+def _precios_fila(prov_key, precio, precios_json, normalizar: bool = True) -> dict:
+    """Precios a mostrar: el canónico con la etiqueta del proveedor y los del JSON de precios.
+    Con `normalizar` las claves del JSON se muestran con su etiqueta (sin pisar el canónico); si no, tal cual.
+    """
+    precios = {}
+    if precio is not None:
+        if type(precio) is not float:
+            precio = float(precio)  # Decimal de PostgreSQL: comparar y mostrar como float
+        if precio > 0:
+            precios[_ETIQUETA_PRECIO.get(prov_key, 'Precio')] = precio
+    if precios_json:
+        for k, v in precios_json.items():
+            # Los valores del JSON casi siempre son float: se evitan la comparación con '' y hasattr
+            if type(v) is not float:
+                if v is None or v == '':
+                    continue
+                if hasattr(v, '__float__'):
+                    v = float(v)
+            if not normalizar:
+                precios[k] = v
+            else:
+                etiqueta = _etiqueta_precio_extra(k)
+                if etiqueta not in precios:
+                    precios[etiqueta] = v
+    return precios
+
+
+def _fecha_archivo(mtime):
+    fecha = _FECHAS_ARCHIVO.get(mtime)
+    if fecha is None and mtime not in _FECHAS_ARCHIVO:
+        try:
+            fecha = ts_to_local(float(mtime)).strftime('%d/%m/%Y %H:%M')
+        except Exception:
+            fecha = None
+        if len(_FECHAS_ARCHIVO) > 1000:
+            _FECHAS_ARCHIVO.clear()
+        _FECHAS_ARCHIVO[mtime] = fecha
+    return fecha
+
+
+def _producto_fila_codigo(r) -> dict:
+    """Producto de buscar_productos_por_codigos_multiples."""
+    prov_key = r.get('proveedor_key')
+    hoja = r.get('hoja')
+    prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
+    iva = r.get('iva')
+    return {
+        'codigo': r.get('codigo') or '',
+        'producto': r.get('nombre') or '',
+        'proveedor': f"{prov_name} (Hoja: {hoja})" if hoja else prov_name,
+        'proveedor_key': prov_key,
+        'sheet_name': hoja or '',
+        'iva': iva if iva is not None else 'N/A',
+        'precios': _precios_fila(prov_key, r.get('precio'), _json_fila(r.get('precios')), normalizar=False),
+        'extra_datos': _json_fila(r.get('extra_datos')),
+        'precios_calculados': {},
+        'fuente': 'DB'
+    }
+
+
+def _producto_fila_exacto(r) -> dict:
+    """Producto de buscar_productos_por_codigo_exacto (con archivo y fecha del archivo)."""
+    prov_key = r.get('proveedor_key')
+    hoja = r.get('hoja')
+    prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
+    producto = {
+        'codigo': str(r.get('codigo') or ''),
+        'producto': r.get('nombre_pulgadas') or formatear_pulgadas(r.get('nombre') or ''),
+        'proveedor': f"{prov_name} (Hoja: {hoja})",
+        'proveedor_key': prov_key,
+        'sheet_name': hoja,
+        'iva': r.get('iva') or 'N/A',
+        'precios': _precios_fila(prov_key, r.get('precio'), _json_fila(r.get('precios'))),
+        'extra_datos': _json_fila(r.get('extra_datos')),
+        'precios_calculados': {},
+        'fuente': 'DB'
+    }
+    if r.get('archivo'):
+        producto['archivo'] = r['archivo']
+    if r.get('mtime') is not None:
+        producto['fecha_archivo'] = _fecha_archivo(r['mtime'])
+    return producto
+
+
+def _producto_fila_patron(r) -> dict:
+    """Producto de buscar_productos_por_codigo_patron."""
+    prov_key = r.get('proveedor_key')
+    hoja = r.get('hoja')
+    prov_name = r.get('proveedor_nombre') or get_proveedor_display_name(prov_key)
+    codigo = str(r.get('codigo') or '')
+    return {
+        'codigo': codigo,
+        'producto': r.get('nombre_pulgadas') or formatear_pulgadas(r.get('nombre') or ''),
+        'proveedor': f"{prov_name} (Hoja: {hoja})",
+        'proveedor_key': prov_key,
+        'sheet_name': hoja,
+        'iva': r.get('iva') or 'N/A',
+        'precios': _precios_fila(prov_key, r.get('precio'), _json_fila(r.get('precios')), normalizar=False),
+        'extra_datos': _json_fila(r.get('extra_datos')),
+        'precios_calculados': {},
+        'fuente': 'DB',
+        'codigo_coincidencia': codigo if codigo.isdigit() else ''.join(filter(str.isdigit, codigo)),
+    }
+
+
+def _producto_fila_avanzado(r) -> dict:
+    """Producto de buscar_productos_avanzados_db."""
+    prov_key = r.get('proveedor_key')
+    codigo = r.get('codigo')
+    precio = r.get('precio')
+    if precio is not None:
+        precio = float(precio)  # Decimal en PostgreSQL: se convierte una sola vez
+    precios_calculados = {}
+    factores = _PRECIOS_CALCULADOS.get(prov_key)
+    if factores and precio is not None:
+        for etiqueta, factor in factores:
+            precios_calculados[etiqueta] = round(precio * factor, 4)
+    return {
+        'codigo': str(codigo) if codigo is not None else '',
+        'nombre': r.get('nombre') or '',
+        'precio': precio,
+        'precio_valido': precio is not None and precio > 0,
+        'precios': _precios_fila(prov_key, precio, _json_fila(r.get('precios'))),
+        'proveedor': r.get('proveedor_nombre') or prov_key or '',
+        'proveedor_key': prov_key or '',
+        'extra_datos': _json_fila(r.get('extra_datos')),
+        'iva': r.get('iva') or 'N/A',
+        'precios_calculados': precios_calculados,
+        'fuente': 'DB'
+    }
+
 def _find_first_col(df_cols, aliases):
     if not aliases:
         return None
@@ -2331,7 +3009,7 @@ def importar_excel_con_mapeo_db(
     col_iva: str,
     cols_extra: list[str]
 ):
-    if not (DATABASE_URL and psycopg):
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
         return 0, '⚠️ Esta importación guiada requiere PostgreSQL habilitado.'
 
     if not temp_filename or not temp_filename.startswith('_wizard_'):
@@ -2415,7 +3093,7 @@ def importar_excel_con_mapeo_db(
                         extra[str(col)] = value.item() if hasattr(value, 'item') else value
 
             codigo_digitos = ''.join(filter(str.isdigit, code))
-            nombre_norm = normalize_text(formatear_pulgadas(name))
+            nombre_pulg, nombre_norm, medidas, tokens = atributos_busqueda_producto(name, code)
             codigo_norm = normalize_text(code)
 
             batch_rows.append((
@@ -2426,7 +3104,8 @@ def importar_excel_con_mapeo_db(
                 str(col_precio) if col_precio else 'precio',
                 iva_text,
                 json.dumps(precios_dict, ensure_ascii=False),
-                json.dumps(extra, ensure_ascii=False)
+                json.dumps(extra, ensure_ascii=False),
+                nombre_pulg, json.dumps(medidas), tokens
             ))
 
             stats['importadas'] = len(batch_rows)
@@ -2437,31 +3116,11 @@ def importar_excel_con_mapeo_db(
                 f"Leídas: {stats['total_filas']} | Omitidas vacías: {stats['omitidas_vacias']}"
             )
 
-        with get_pg_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO import_batches (proveedor_key, archivo, mtime, status) VALUES (%s,%s,%s,%s) RETURNING id",
-                (provider_key, archivo_db, mtime, 'running')
-            )
-            batch_row = cur.fetchone()
-            batch_id = (batch_row['id'] if isinstance(batch_row, dict) else batch_row[0]) if batch_row is not None else None
-
-            cur.execute("DELETE FROM productos_listas WHERE archivo=%s", (archivo_db,))
-            cur.executemany(
-                """
-                INSERT INTO productos_listas
-                (proveedor_key, proveedor_nombre, archivo, hoja, mtime,
-                 codigo, codigo_digitos, codigo_normalizado,
-                 nombre, nombre_normalizado,
-                 precio, precio_fuente, iva, precios, extra_datos, batch_id)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s::jsonb,%s)
-                """,
-                [row + (batch_id,) for row in batch_rows]
-            )
-            cur.execute(
-                "UPDATE import_batches SET status=%s, completed_at=NOW(), total_rows=%s WHERE id=%s",
-                ('completed', len(batch_rows), batch_id)
-            )
-            conn.commit()
+        listas_db_aplicar_archivo(
+            provider_key, archivo_db, mtime, lambda batch_id: [row + (batch_id,) for row in batch_rows]
+        )
+        listas_estado_invalidar()
+        catalogo_refrescar()
 
         try:
             os.remove(temp_path)
@@ -2482,404 +3141,1041 @@ def importar_excel_con_mapeo_db(
     except Exception as exc:
         return 0, f'❌ Error importando Excel con mapeo: {exc}'
 
-def sync_listas_to_db():
-    """Lee archivos Excel de LISTAS_PATH y carga productos a PostgreSQL.
-    Reemplaza por archivo (DELETE + INSERT en transacción) y registra lote en import_batches.
-    Devuelve un dict resumen.
+# ---------------------------------------------------------------------------
+# Ingesta columnar de hojas de listas (reemplaza el recorrido con df.iterrows())
+# ---------------------------------------------------------------------------
+_PRECIOS_VISIBLES_BREMENTOOLS = (
+    'precio de lista', 'precio lista', 'precio neto', 'precioneto', 'precio neto unitario', 'precionetunitario'
+)
+
+
+def _valores_hoja(df):
+    """Devuelve una función columna -> Series(object) con los mismos valores que entregaría df.iterrows().
+    iterrows() arma cada fila desde df.values: si no hay columnas de texto los enteros suben a float.
     """
-    print("[DEBUG sync_listas_to_db] === INICIO DE SINCRONIZACIÓN ===")
-    resumen = {'procesados': 0, 'insertados': 0, 'archivos': []}
-    if not (DATABASE_URL and psycopg):
-        print("[DEBUG sync_listas_to_db] ERROR: PostgreSQL no disponible")
-        return {'error': 'PostgreSQL no disponible.'}
-    print(f"[DEBUG sync_listas_to_db] PostgreSQL disponible, LISTAS_PATH={LISTAS_PATH}")
+    df_columns = list(df.columns)
+    if all(dt != object for dt in df.dtypes):
+        matriz = df.values
+        return lambda col: pd.Series(matriz[:, df_columns.index(col)], dtype=object)
+    return lambda col: df[col].reset_index(drop=True).astype(object)
 
-    prov_cfg = _listas_provider_configs()
-    try:
-        excel_files = sorted(
-            f for f in os.listdir(LISTAS_PATH)
-            if f.lower().endswith(('.xlsx', '.xls'))
-            and 'old' not in f.lower()
-            and not _is_temp_wizard_excel(f)
-        )
-        print(f"[DEBUG sync_listas_to_db] Archivos Excel encontrados: {len(excel_files)} -> {excel_files}")
-    except Exception as exc:
-        print(f"[DEBUG sync_listas_to_db] ERROR al listar {LISTAS_PATH}: {exc}")
-        return {'error': f'No se pudo listar {LISTAS_PATH}: {exc}'}
 
-    # Limpiar archivos obsoletos en DB (que ya no existen en disco o quedaron OLD)
+def _texto_columna(valores):
+    """str(v).strip() para celdas no vacías, '' para NaN/None."""
+    texto = pd.Series('', index=valores.index, dtype=object)
+    presentes = valores.notna()
+    if presentes.any():
+        texto[presentes] = valores[presentes].astype(str).str.strip()
+    return texto
+
+
+def _precios_columna(valores):
+    """parse_price_value() sobre una columna: los números se convierten en bloque y los textos
+    se parsean una sola vez por valor distinto. NaN donde no hay precio.
+    """
+    resultado = pd.Series(np.nan, index=valores.index, dtype=float)
+    presentes = valores[valores.notna()]
+    if presentes.empty:
+        return resultado
+    numericos = presentes.map(lambda v: isinstance(v, (int, float, np.number))).astype(bool)
+    if numericos.any():
+        resultado[presentes.index[numericos]] = presentes[numericos].astype(float)
+    textos = presentes[~numericos]
+    if not textos.empty:
+        parseados = {v: parse_price_value(v) for v in pd.unique(textos)}
+        resultado[textos.index] = textos.map(parseados).astype(float)
+    return resultado
+
+
+def _cantidad_extra(raw_qty):
+    if isinstance(raw_qty, (int, float)):
+        return raw_qty
     try:
-        estado_db = _db_files_state()
-        excel_set = set(excel_files)
-        archivos_obsoletos = []
-        for archivo_db in estado_db.keys():
-            if _is_virtual_wizard_file(archivo_db):
-                continue
-            low = archivo_db.lower() if isinstance(archivo_db, str) else ''
-            if (archivo_db not in excel_set) or ('old' in low):
-                archivos_obsoletos.append(archivo_db)
-        if archivos_obsoletos:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                cur.executemany("DELETE FROM productos_listas WHERE archivo=%s", [(a,) for a in archivos_obsoletos])
-                cur.executemany("DELETE FROM import_batches WHERE archivo=%s", [(a,) for a in archivos_obsoletos])
-                conn.commit()
-            print(f"[DEBUG sync_listas_to_db] Limpieza: {len(archivos_obsoletos)} archivo(s) obsoletos eliminados de la DB: {archivos_obsoletos}")
-    except Exception as exc:
-        print(f"[WARN sync_listas_to_db] No se pudieron limpiar archivos obsoletos de la DB: {exc}")
-    print("[DEBUG sync_listas_to_db] Obteniendo conexión PostgreSQL...")
-    with get_pg_conn() as conn, conn.cursor() as cur:
-        print("[DEBUG sync_listas_to_db] Conexión obtenida, iniciando procesamiento de archivos...")
-        for filename in excel_files:
-            print(f"[DEBUG sync_listas_to_db] --- Procesando archivo: {filename} ---")
-            print(f"[DEBUG sync_listas_to_db] --- Procesando archivo: {filename} ---")
-            provider_key = provider_key_from_filename(filename)
-            print(f"[DEBUG sync_listas_to_db] provider_key inicial: {provider_key}")
-            cfg = prov_cfg.get(provider_key)
-            if not cfg:
-                # Proveedor desconocido para el importador → intentar inferir usando nombres_base de proveedores
-                print(f"[DEBUG sync_listas_to_db] No hay cfg para {provider_key}, intentando inferir...")
-                try:
-                    inferred_base = inferir_nombre_base_archivo(filename, proveedores)
-                    inferred_key = provider_name_to_key(inferred_base)
-                    cfg = prov_cfg.get(inferred_key)
-                    if cfg:
-                        provider_key = inferred_key
-                        print(f"[DEBUG sync_listas_to_db] Proveedor inferido: {provider_key}")
-                    else:
-                        # No se pudo inferir, saltar archivo
-                        print(f"[DEBUG sync_listas_to_db] No se pudo inferir proveedor para {filename}, se omite")
-                        log_debug('sync_listas_to_db: proveedor no reconocido, se omite', filename, '-> key:', provider_key)
-                        continue
-                except Exception as _inf_err:
-                    print(f"[DEBUG sync_listas_to_db] Error infiriendo proveedor para {filename}: {_inf_err}")
-                    log_debug('sync_listas_to_db: error infiriendo proveedor para', filename, _inf_err)
-                    continue
-            else:
-                print(f"[DEBUG sync_listas_to_db] cfg encontrado para provider_key: {provider_key}")
-            
-            file_path = os.path.join(LISTAS_PATH, filename)
-            try:
-                mtime = os.path.getmtime(file_path)
-                print(f"[DEBUG sync_listas_to_db] mtime del archivo: {mtime}")
-            except Exception:
-                mtime = 0.0
-                print(f"[DEBUG sync_listas_to_db] No se pudo obtener mtime, usando 0.0")
+        qty_val_num = float(str(raw_qty).strip().replace(',', '.'))
+        return int(qty_val_num) if qty_val_num.is_integer() else qty_val_num
+    except Exception:
+        return str(raw_qty).strip()
 
-            # Leer todas las hojas respetando header
-            header = cfg.get('header', 0)
-            print(f"[DEBUG sync_listas_to_db] Leyendo Excel con header={header}...")
-            try:
-                all_sheets = pd.read_excel(file_path, sheet_name=None, header=header)
-                print(f"[DEBUG sync_listas_to_db] Excel leído exitosamente, hojas: {list(all_sheets.keys())}")
-            except Exception as exc:
-                print(f"[DEBUG sync_listas_to_db] ERROR leyendo {filename}: {exc}")
-                log_debug('sync_listas_to_db: error leyendo', filename, exc)
-                continue
 
-            # Crear batch y limpiar productos previos de este archivo (transacción)
-            print(f"[DEBUG sync_listas_to_db] Creando batch para {filename}...")
-            cur.execute(
-                "INSERT INTO import_batches (proveedor_key, archivo, mtime, status) VALUES (%s,%s,%s,%s) RETURNING id",
-                (provider_key, filename, mtime, 'running')
-            )
-            _row = cur.fetchone()
-            batch_id = (_row['id'] if isinstance(_row, dict) else _row[0]) if _row is not None else None
-            print(f"[DEBUG sync_listas_to_db] Batch creado con ID: {batch_id}")
-            total_insertados = 0
-            # Reemplazo por archivo
-            print(f"[DEBUG sync_listas_to_db] Eliminando productos previos de {filename}...")
-            cur.execute("DELETE FROM productos_listas WHERE archivo=%s", (filename,))
-            deleted_rows = cur.rowcount
-            print(f"[DEBUG sync_listas_to_db] Eliminados {deleted_rows} registros previos")
-
-            proveedor_display = get_proveedor_display_name(provider_key)
-            print(f"[DEBUG sync_listas_to_db] proveedor_display: {proveedor_display}")
-
-            for sheet_name, df in all_sheets.items():
-                print(f"[DEBUG sync_listas_to_db] Procesando hoja: {sheet_name}, filas: {len(df) if df is not None else 0}")
-                if df is None or df.empty:
-                    print(f"[DEBUG sync_listas_to_db] Hoja {sheet_name} está vacía, saltando...")
-                    continue
-                # Mantener nombres originales y también versión normalizada para búsqueda
-                df_columns = list(df.columns)
-                # Intentar mapear columnas según aliases
-                codigo_col = _find_first_col(df_columns, cfg.get('codigo', []))
-                nombre_col = _find_first_col(df_columns, cfg.get('nombre', []))
-                print(f"[DEBUG sync_listas_to_db] Columnas detectadas - codigo_col: {codigo_col}, nombre_col: {nombre_col}")
-                iva_col = _find_first_col(df_columns, cfg.get('iva', []))
-                precio_canon_col = _find_first_col(df_columns, cfg.get('precio_canon', []))
-                precios_extra_alias = cfg.get('precios_extra', []) or []
-                extra_cols = [c for c in df_columns if normalize_text(str(c)) in [normalize_text(x) for x in precios_extra_alias]]
-                cantidad_col = _find_first_col(df_columns, cfg.get('extras', [])) if cfg.get('extras') else None
-
-                if not nombre_col:
-                    print(f"[DEBUG sync_listas_to_db] Hoja {sheet_name}: no se encontró columna nombre, saltando...")
-                    continue
+def _por_valor_distinto(valores, fn):
+    """Aplica fn una vez por valor distinto de la columna (para columnas muy repetidas como IVA).
+    Devuelve un array de objetos con None en las celdas vacías.
+    """
+    presentes_mask = valores.notna().to_numpy()
+    presentes = valores[presentes_mask]
+    resultado = np.full(len(valores), None, dtype=object)
+    if not presentes.empty:
+        # la clave incluye el tipo: 5 y 5.0 son iguales como claves pero no dan el mismo resultado
+        calculados = {}
+        salida = []
+        for v in presentes:
+            clave = (type(v), v)
+            if clave not in calculados:
+                calculados[clave] = fn(v)
+            salida.append(calculados[clave])
+        resultado[presentes_mask] = salida
+    return resultado
+
+
+def procesar_hoja_listas(df, cfg: dict, provider_key: str, sheet_name):
+    """Convierte una hoja de lista de precios en filas de productos_listas operando columna por columna.
+    Devuelve None si la hoja no tiene columna de nombre; si no, una lista de tuplas
+    (codigo, codigo_digitos, codigo_normalizado, nombre, nombre_normalizado, precio, iva,
+     precios_json, extra_json, nombre_pulgadas, medidas_json, tokens) en el orden de la hoja.
+    """
+    df_columns = list(df.columns)
+    codigo_col = _find_first_col(df_columns, cfg.get('codigo', []))
+    nombre_col = _find_first_col(df_columns, cfg.get('nombre', []))
+    log_debug('procesar_hoja_listas:', sheet_name, 'codigo_col:', codigo_col, 'nombre_col:', nombre_col)
+    if not nombre_col:
+        return None
+    iva_col = _find_first_col(df_columns, cfg.get('iva', []))
+    precio_canon_col = _find_first_col(df_columns, cfg.get('precio_canon', []))
+    precios_extra_norm = [normalize_text(x) for x in (cfg.get('precios_extra', []) or [])]
+    extra_cols = [c for c in df_columns if normalize_text(str(c)) in precios_extra_norm]
+    cantidad_col = _find_first_col(df_columns, cfg.get('extras', [])) if cfg.get('extras') else None
+    categoria_col = _find_first_col(df_columns, ['categoria'])
+    if df.empty:
+        return []
+    columna = _valores_hoja(df)
 
-                # OPTIMIZACIÓN: Recopilar todos los datos en un batch antes de insertar
-                batch_data = []
-                filas_insertadas_hoja = 0
-                
-                for row_number, (_, fila) in enumerate(df.iterrows(), start=1):
-                    # Código (puede faltar)
-                    code = ''
-                    if codigo_col:
-                        raw_code = fila.get(codigo_col)
-                        if raw_code is not None and not pd.isna(raw_code):
-                            code = str(raw_code).strip()
-                            if code.endswith('.0'):
-                                code = code[:-2] or code
-
-                    # Nombre
-                    raw_name = fila.get(nombre_col)
-                    name = ''
-                    if raw_name is not None and not pd.isna(raw_name):
-                        name = str(raw_name).strip()
-
-                    # Si faltan ambos, se omite
-                    if not code and not name:
-                        continue
+    # Código (puede faltar): str().strip() y sin el '.0' que deja Excel en los números
+    if codigo_col:
+        codigos = _texto_columna(columna(codigo_col))
+        con_decimal = codigos.str.endswith('.0') & (codigos.str.len() > 2)
+        codigos = codigos.where(~con_decimal, codigos.str[:-2])
+    else:
+        codigos = pd.Series('', index=range(len(df)), dtype=object)
+    nombres = _texto_columna(columna(nombre_col))
+
+    # Filas sin código ni nombre se omiten; sin nombre usan el código, sin código uno interno estable
+    validas = (codigos != '') | (nombres != '')
+    nombres = nombres.where(nombres != '', codigos)
+    sin_codigo = codigos == ''
+    if sin_codigo.any():
+        prefijo = f"SIN-COD-{provider_key}-{normalize_text(sheet_name)}-"
+        numeros = pd.Series(np.arange(1, len(df) + 1), index=codigos.index).astype(str)
+        codigos = codigos.where(~sin_codigo, prefijo + numeros)
+
+    precios = _precios_columna(columna(precio_canon_col)) if precio_canon_col else None
+    ivas = _por_valor_distinto(columna(iva_col), _format_iva_text) if iva_col else None
+
+    # Otros precios visibles
+    if provider_key == 'brementools':
+        fuentes_precio = [(alias, _find_first_col(df_columns, [alias])) for alias in _PRECIOS_VISIBLES_BREMENTOOLS]
+        fuentes_precio = [(alias, col) for alias, col in fuentes_precio if col]
+    else:
+        fuentes_precio = [(str(col), col) for col in extra_cols]
+    precios_cols = {}
+    for _, col in fuentes_precio:
+        if col not in precios_cols:
+            precios_cols[col] = _precios_columna(columna(col)).to_numpy()
+    precios_extra = [(clave, precios_cols[col]) for clave, col in fuentes_precio]
+
+    # Extras mínimos: categoría y cantidad (BremenTools)
+    categorias = None
+    if categoria_col:
+        valores_cat = columna(categoria_col)
+        categorias = _texto_columna(valores_cat).to_numpy()
+        categorias[~valores_cat.notna().to_numpy()] = None
+    cantidades = None
+    if provider_key == 'brementools' and cantidad_col:
+        cantidades = _por_valor_distinto(columna(cantidad_col), _cantidad_extra)
+
+    idx = np.flatnonzero(validas.to_numpy())
+    codigos = codigos.to_numpy()[idx]
+    nombres = nombres.to_numpy()[idx]
+    codigos_s = pd.Series(codigos, dtype=object)
+    # str.isdigit también acepta dígitos no ASCII (², ³): esos pocos códigos se resuelven uno a uno
+    digitos = codigos_s.str.replace(r'[^0-9]', '', regex=True)
+    no_ascii = codigos_s.str.contains(r'[^\x00-\x7f]', regex=True)
+    if no_ascii.any():
+        digitos[no_ascii] = codigos_s[no_ascii].map(lambda c: ''.join(filter(str.isdigit, c)))
+    digitos = digitos.to_numpy()
+    precios_v = precios.to_numpy()[idx] if precios is not None else None
+    ivas_v = ivas[idx] if ivas is not None else None
+
+    filas = []
+    for k, i in enumerate(idx):
+        code = codigos[k]
+        name = nombres[k]
+        nombre_pulg, nombre_norm, medidas, tokens = atributos_busqueda_producto(name, code)
+        precio = None
+        if precios_v is not None:
+            precio = precios_v[k]
+            precio = None if precio != precio else float(precio)
+        precios_dict = {}
+        for clave, arr in precios_extra:
+            v = arr[i]
+            if v == v:
+                precios_dict[clave] = float(v)
+        extra = {}
+        if categorias is not None and categorias[i] is not None:
+            extra['Categoria'] = categorias[i]
+        if cantidades is not None and cantidades[i] is not None:
+            extra['Cantidad'] = cantidades[i]
+        filas.append((
+            code, digitos[k], normalize_text(code),
+            name, nombre_norm,
+            precio,
+            ivas_v[k] if ivas_v is not None else None,
+            json.dumps(precios_dict, ensure_ascii=False) if precios_dict else '{}',
+            json.dumps(extra, ensure_ascii=False) if extra else '{}',
+            nombre_pulg, json.dumps(medidas), tokens
+        ))
+    return filas
+
+
+# ---------------------------------------------------------------------------
+# Carga masiva de productos_listas: COPY a una tabla staging y reemplazo por archivo
+# ---------------------------------------------------------------------------
+PG_BULK_COPY = os.getenv('PG_BULK_COPY', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+
+_PRODUCTOS_COLS_CARGA = (
+    'proveedor_key', 'proveedor_nombre', 'archivo', 'hoja', 'mtime',
+    'codigo', 'codigo_digitos', 'codigo_normalizado',
+    'nombre', 'nombre_normalizado',
+    'precio', 'precio_fuente', 'iva', 'precios', 'extra_datos',
+    'nombre_pulgadas', 'medidas', 'tokens', 'batch_id',
+)
+_PRODUCTOS_COLS_JSONB = ('precios', 'extra_datos', 'medidas')
+# Columnas que calcula la carga (no el parseo): los dígitos del código sin ceros a la izquierda, con índice
+# propio para que la búsqueda exacta por código numérico no aplique regexp_replace sobre toda la tabla,
+# y la clave de código de barras (ver clave_codigo_barras)
+_PRODUCTOS_COLS_DERIVADAS = ('codigo_digitos_nl', 'clave_barras')
+_PRODUCTOS_COLS_ESCRITURA = _PRODUCTOS_COLS_CARGA + _PRODUCTOS_COLS_DERIVADAS
+
+
+# --- Claves de código de barras ---
+# extraer_codigo_de_barras convierte un EAN-13/UPC-A en variantes de código: fragmentos de 4 dígitos
+# y, para Crossmaster, el mismo fragmento con cada prefijo 992..998 (con y sin sufijo .1).
+# La carga guarda en clave_barras el fragmento al que responde cada producto, así todas las variantes
+# de un escaneo se resuelven con una igualdad sobre una columna indexada en vez de ~15 códigos.
+BARCODE_PREFIJOS_CROSSMASTER = ('992', '993', '994', '995', '996', '997', '998')
+_RE_BARRAS_FRAGMENTO = re.compile(r'[0-9]{4}')
+_RE_BARRAS_CROSSMASTER = re.compile(r'99[2-8][0-9]{4}')
+_RE_BARRAS_CROSSMASTER_1 = re.compile(r'99[2-8][0-9]{4}\.1')
+
+
+def clave_codigo_barras(codigo: str, digitos: str):
+    """Clave de barras de un producto (o None): la variante que lo encuentra con el mismo criterio
+    de buscar_productos_por_codigos_multiples (codigo o codigo_digitos iguales a la variante).
+    'ean:dddd' (fragmento), 'cm:dddd' (99Xdddd) o 'cm.1:dddd' (99Xdddd.1).
+    """
+    if _RE_BARRAS_FRAGMENTO.fullmatch(digitos or ''):
+        return 'ean:' + digitos
+    if _RE_BARRAS_CROSSMASTER.fullmatch(digitos or ''):
+        return 'cm:' + digitos[3:]
+    if _RE_BARRAS_CROSSMASTER_1.fullmatch(codigo or ''):
+        return 'cm.1:' + codigo[3:7]
+    return None
 
-                    # Si falta nombre pero hay código, usamos el código como nombre
-                    if not name and code:
-                        name = code
 
-                    # Si falta código pero hay nombre, generamos código interno estable
-                    if not code and name:
-                        code = f"SIN-COD-{provider_key}-{normalize_text(sheet_name)}-{row_number}"
+def claves_barras_de_variantes(codigos) -> tuple:
+    """Separa una lista de códigos en (claves de barras, resto).
+    Un fragmento de 4 dígitos equivale a su clave; los códigos Crossmaster solo se reemplazan por la clave
+    cuando están los siete prefijos del fragmento (como los genera extraer_codigo_de_barras), si no quedan
+    en el resto y se buscan como códigos sueltos.
+    """
+    claves = []
+    resto = []
+    grupos = {}
+    for c in codigos:
+        if _RE_BARRAS_FRAGMENTO.fullmatch(c):
+            claves.append('ean:' + c)
+        elif _RE_BARRAS_CROSSMASTER.fullmatch(c):
+            grupos.setdefault('cm:' + c[3:], set()).add(c)
+        elif _RE_BARRAS_CROSSMASTER_1.fullmatch(c):
+            grupos.setdefault('cm.1:' + c[3:7], set()).add(c)
+        else:
+            resto.append(c)
+    for clave, codigos_grupo in grupos.items():
+        if len(codigos_grupo) == len(BARCODE_PREFIJOS_CROSSMASTER):
+            claves.append(clave)
+        else:
+            resto.extend(sorted(codigos_grupo))
+    return list(dict.fromkeys(claves)), resto
 
-                    # Precio canónico
-                    price_val = None
-                    if precio_canon_col and pd.notna(fila.get(precio_canon_col)):
-                        price_val = parse_price_value(fila.get(precio_canon_col))
 
-                    # Nota: Importamos todos los productos, incluso sin precio
-                    # (antes había un 'if price_val is None: continue' que los saltaba)
+def _fila_escritura(fila) -> tuple:
+    """Fila de _PRODUCTOS_COLS_CARGA con las columnas derivadas al final (orden de _PRODUCTOS_COLS_ESCRITURA).
+    Sin dígitos significativos codigo_digitos_nl queda NULL: '0' o '' no deben coincidir con cualquier código.
+    """
+    digitos = fila[_PRODUCTOS_IDX['codigo_digitos']] or ''
+    codigo = fila[_PRODUCTOS_IDX['codigo']] or ''
+    return tuple(fila) + (digitos.lstrip('0') or None, clave_codigo_barras(codigo, digitos))
 
-                    # IVA textual si existe (guardar tal cual, sin procesar)
-                    iva_text = None
-                    if iva_col and pd.notna(fila.get(iva_col)):
-                        raw_iva = fila.get(iva_col)
-                        
-                        # Si es numérico, convertir a porcentaje
-                        if isinstance(raw_iva, (int, float)):
-                            # Si es menor a 1, probablemente es decimal (0.21 -> 21%)
-                            if raw_iva < 1:
-                                iva_value = raw_iva * 100
-                            else:
-                                iva_value = raw_iva
-                            
-                            # Si es un número entero, mostrar sin decimales
-                            if iva_value == int(iva_value):
-                                iva_text = str(int(iva_value)) + '%'
-                            else:
-                                # Si tiene decimales, mantenerlos
-                                iva_text = str(iva_value) + '%'
-                        else:
-                            # Si es string, intentar convertir a número y aplicar misma lógica
-                            try:
-                                iva_num = float(str(raw_iva).strip().replace('%', '').replace(',', '.'))
-                                if iva_num < 1:
-                                    iva_value = iva_num * 100
-                                else:
-                                    iva_value = iva_num
-                                
-                                if iva_value == int(iva_value):
-                                    iva_text = str(int(iva_value)) + '%'
-                                else:
-                                    iva_text = str(iva_value) + '%'
-                            except:
-                                # Si no se puede convertir, guardar tal cual
-                                iva_text = str(raw_iva).strip()
-
-                    # Otros precios visibles
-                    precios_dict = {}
-                    if provider_key == 'brementools':
-                        # Mantener visibles: de venta (canon), de lista, neto, neto unitario
-                        for alias in ['precio de lista', 'precio lista', 'precio neto', 'precioneto', 'precio neto unitario', 'precionetunitario']:
-                            col = _find_first_col(df_columns, [alias])
-                            if col and pd.notna(fila.get(col)):
-                                v = parse_price_value(fila.get(col))
-                                if v is not None:
-                                    precios_dict[alias] = v
-                    else:
-                        for col in extra_cols:
-                            if pd.notna(fila.get(col)):
-                                v = parse_price_value(fila.get(col))
-                                if v is not None:
-                                    precios_dict[str(col)] = v
-
-                    # Extras mínimos
-                    extra = {}
-                    # Capturar 'categoria' si existe en la hoja
-                    try:
-                        categoria_col = _find_first_col(df_columns, ['categoria'])
-                        if categoria_col and pd.notna(fila.get(categoria_col)):
-                            extra['Categoria'] = str(fila.get(categoria_col)).strip()
-                    except Exception:
-                        pass
-                    # Capturar cantidad (BremenTools)
-                    if provider_key == 'brementools' and cantidad_col:
-                        try:
-                            raw_qty = fila.get(cantidad_col)
-                            if pd.notna(raw_qty):
-                                qty_val = None
-                                if isinstance(raw_qty, (int, float)):
-                                    qty_val = raw_qty
-                                else:
-                                    try:
-                                        qty_val_num = float(str(raw_qty).strip().replace(',', '.'))
-                                        qty_val = int(qty_val_num) if qty_val_num.is_integer() else qty_val_num
-                                    except Exception:
-                                        qty_val = str(raw_qty).strip()
-                                if qty_val is not None:
-                                    extra['Cantidad'] = qty_val
-                        except Exception:
-                            pass
-                    codigo_digitos = ''.join(filter(str.isdigit, code))
-                    nombre_norm = normalize_text(formatear_pulgadas(name))
-                    codigo_norm = normalize_text(code)
-
-                    # Agregar a batch en lugar de insertar inmediatamente
-                    batch_data.append((
-                        provider_key, proveedor_display, filename, sheet_name, mtime,
-                        code, codigo_digitos, codigo_norm,
-                        name, nombre_norm,
-                        float(price_val) if price_val is not None else None,
-                        cfg.get('precio_canon', ['precio'])[0],
-                        iva_text,
-                        json.dumps(precios_dict, ensure_ascii=False),
-                        json.dumps(extra, ensure_ascii=False),
-                        batch_id
-                    ))
-                
-                # Insertar todos los datos de la hoja en un solo batch usando executemany
-                if batch_data:
-                    print(f"[DEBUG sync_listas_to_db] Insertando {len(batch_data)} filas en batch...")
-                    cur.executemany(
-                        """
-                        INSERT INTO productos_listas
-                        (proveedor_key, proveedor_nombre, archivo, hoja, mtime,
-                         codigo, codigo_digitos, codigo_normalizado,
-                         nombre, nombre_normalizado,
-                         precio, precio_fuente, iva, precios, extra_datos, batch_id)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s::jsonb,%s)
-                        """,
-                        batch_data
-                    )
-                    filas_insertadas_hoja = len(batch_data)
-                    total_insertados += filas_insertadas_hoja
-                    print(f"[DEBUG sync_listas_to_db] Batch insertado exitosamente: {filas_insertadas_hoja} filas")
-                
-                print(f"[DEBUG sync_listas_to_db] Hoja {sheet_name}: insertadas {filas_insertadas_hoja} filas")
 
-            # Cerrar batch
-            print(f"[DEBUG sync_listas_to_db] Cerrando batch {batch_id}, total insertados: {total_insertados}")
+def pg_reemplazar_productos_archivo(cur, archivo: str, filas: list):
+    """Reemplaza las filas de `archivo` en productos_listas por `filas` (tuplas en el orden de _PRODUCTOS_COLS_CARGA).
+    Las filas se cargan con COPY a una tabla temporal y recién después se hace DELETE + INSERT ... SELECT,
+    así el bloqueo sobre productos_listas dura lo mínimo. Todo queda en la transacción del cursor:
+    hasta el commit los lectores siguen viendo la versión anterior completa del archivo.
+    Devuelve (filas_borradas, filas_insertadas).
+    """
+    columnas = ', '.join(_PRODUCTOS_COLS_ESCRITURA)
+    if PG_BULK_COPY and filas:
+        # precio queda como double precision en staging: el INSERT ... SELECT aplica el mismo cast
+        # float8 -> numeric que un parámetro float, y el redondeo coincide con la carga fila a fila
+        columnas_staging = ', '.join(
+            'precio::double precision AS precio' if c == 'precio' else c for c in _PRODUCTOS_COLS_ESCRITURA
+        )
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS _staging_productos_listas ON COMMIT DROP AS "
+            f"SELECT {columnas_staging} FROM productos_listas WITH NO DATA"
+        )
+        cur.execute("TRUNCATE _staging_productos_listas")
+        inicio = time.perf_counter()
+        with cur.copy(f"COPY _staging_productos_listas ({columnas}) FROM STDIN") as copy:
+            for fila in filas:
+                copy.write_row(_fila_escritura(fila))
+        log_debug('pg_reemplazar_productos_archivo: COPY', archivo, len(filas), 'filas en',
+                  round((time.perf_counter() - inicio) * 1000, 1), 'ms')
+        cur.execute("DELETE FROM productos_listas WHERE archivo=%s", (archivo,))
+        borradas = cur.rowcount
+        cur.execute(
+            f"INSERT INTO productos_listas ({columnas}) SELECT {columnas} FROM _staging_productos_listas"
+        )
+        insertadas = cur.rowcount
+        cur.execute("TRUNCATE _staging_productos_listas")
+        return borradas, insertadas
+
+    cur.execute("DELETE FROM productos_listas WHERE archivo=%s", (archivo,))
+    borradas = cur.rowcount
+    if filas:
+        valores = ','.join('%s::jsonb' if c in _PRODUCTOS_COLS_JSONB else '%s' for c in _PRODUCTOS_COLS_ESCRITURA)
+        cur.executemany(f"INSERT INTO productos_listas ({columnas}) VALUES ({valores})", [_fila_escritura(f) for f in filas])
+    return borradas, len(filas)
+
+
+# ---------------------------------------------------------------------------
+# Importación por diferencias: dentro de cada archivo una fila se identifica por (proveedor_key, hoja, codigo)
+# (más un ordinal si el código se repite) y se compara por un hash de su contenido; solo se escriben las
+# filas nuevas, las modificadas y las que desaparecieron, en vez de borrar y reinsertar todo el archivo.
+# ---------------------------------------------------------------------------
+PG_DIFF_IMPORT = os.getenv('PG_DIFF_IMPORT', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+
+_PRODUCTOS_IDX = {c: i for i, c in enumerate(_PRODUCTOS_COLS_CARGA)}
+# archivo, mtime y batch_id cambian en cada carga sin que cambie el producto
+_PRODUCTOS_IDX_HASH = tuple(
+    i for c, i in _PRODUCTOS_IDX.items() if c not in ('archivo', 'mtime', 'batch_id')
+)
+# Columnas que se reescriben al actualizar una fila existente
+_PRODUCTOS_COLS_UPDATE = tuple(c for c in _PRODUCTOS_COLS_ESCRITURA if c != 'archivo') + ('fila_hash',)
+
+
+def _fila_hash(fila) -> str:
+    return hashlib.md5(repr(tuple(fila[i] for i in _PRODUCTOS_IDX_HASH)).encode('utf-8')).hexdigest()
+
+
+def _diff_productos_archivo(anteriores_rows, filas: list) -> tuple:
+    """Compara las filas cargadas de un archivo (id, proveedor_key, hoja, codigo, fila_hash; ordenadas por id)
+    con las `filas` nuevas. Devuelve (nuevas [(fila, hash)], cambiadas [(id, fila, hash)], ids a borrar, sin_cambios).
+    """
+    i_prov, i_hoja, i_codigo = _PRODUCTOS_IDX['proveedor_key'], _PRODUCTOS_IDX['hoja'], _PRODUCTOS_IDX['codigo']
+    anteriores = {}
+    for row in anteriores_rows:
+        if isinstance(row, dict):
+            clave = (row['proveedor_key'], row['hoja'], row['codigo'])
+            anteriores.setdefault(clave, []).append((row['id'], row['fila_hash']))
+        else:
+            anteriores.setdefault((row[1], row[2], row[3]), []).append((row[0], row[4]))
+
+    vistos = {}
+    nuevas = []
+    cambiadas = []
+    sin_cambios = 0
+    for fila in filas:
+        clave = (fila[i_prov], fila[i_hoja], fila[i_codigo])
+        n = vistos.get(clave, 0)
+        vistos[clave] = n + 1
+        h = _fila_hash(fila)
+        previas = anteriores.get(clave)
+        if previas is not None and n < len(previas):
+            fila_id, h_anterior = previas[n]
+            if h_anterior == h:
+                sin_cambios += 1
+            else:
+                cambiadas.append((fila_id, fila, h))
+        else:
+            nuevas.append((fila, h))
+    borrar = [fila_id for clave, previas in anteriores.items() for fila_id, _ in previas[vistos.get(clave, 0):]]
+    return nuevas, cambiadas, borrar, sin_cambios
+
+
+def pg_aplicar_productos_archivo(cur, archivo: str, filas: list) -> dict:
+    """Deja en productos_listas exactamente las `filas` de `archivo` (tuplas en el orden de _PRODUCTOS_COLS_CARGA)
+    aplicando solo inserciones, actualizaciones y borrados. A las filas sin cambios solo se les actualiza
+    el mtime si el archivo cambió (columna sin índice: update HOT). Con PG_DIFF_IMPORT=0 reemplaza el archivo.
+    Devuelve {'insertadas', 'actualizadas', 'borradas', 'sin_cambios'}.
+    """
+    if not PG_DIFF_IMPORT:
+        borradas, insertadas = pg_reemplazar_productos_archivo(cur, archivo, filas)
+        return {'insertadas': insertadas, 'actualizadas': 0, 'borradas': borradas, 'sin_cambios': 0}
+
+    # Serializa cargas concurrentes del mismo archivo (p. ej. wizard y sync): ambas leerían el mismo estado previo
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (archivo,))
+    cur.execute(
+        "SELECT id, proveedor_key, hoja, codigo, fila_hash FROM productos_listas WHERE archivo=%s ORDER BY id",
+        (archivo,)
+    )
+    nuevas, cambiadas, borrar, sin_cambios = _diff_productos_archivo(cur.fetchall() or [], filas)
+
+    if borrar:
+        cur.execute("DELETE FROM productos_listas WHERE id = ANY(%s)", (borrar,))
+    columnas = ', '.join(_PRODUCTOS_COLS_ESCRITURA)
+    if PG_BULK_COPY and (nuevas or cambiadas):
+        columnas_staging = ', '.join(
+            'precio::double precision AS precio' if c == 'precio' else c for c in _PRODUCTOS_COLS_ESCRITURA
+        )
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS _staging_productos_diff ON COMMIT DROP AS "
+            f"SELECT id, 0 AS orden, {columnas_staging}, fila_hash FROM productos_listas WITH NO DATA"
+        )
+        cur.execute("TRUNCATE _staging_productos_diff")
+        with cur.copy(f"COPY _staging_productos_diff (id, orden, {columnas}, fila_hash) FROM STDIN") as copy:
+            for fila_id, fila, h in cambiadas:
+                copy.write_row((fila_id, 0) + _fila_escritura(fila) + (h,))
+            for orden, (fila, h) in enumerate(nuevas):
+                copy.write_row((None, orden) + _fila_escritura(fila) + (h,))
+        if cambiadas:
+            cur.execute(
+                f"UPDATE productos_listas p SET ({', '.join(_PRODUCTOS_COLS_UPDATE)}, updated_at) = "
+                f"({', '.join('s.' + c for c in _PRODUCTOS_COLS_UPDATE)}, NOW()) "
+                f"FROM _staging_productos_diff s WHERE s.id IS NOT NULL AND p.id = s.id"
+            )
+        if nuevas:
+            cur.execute(
+                f"INSERT INTO productos_listas ({columnas}, fila_hash) "
+                f"SELECT {columnas}, fila_hash FROM _staging_productos_diff WHERE id IS NULL ORDER BY orden"
+            )
+        cur.execute("TRUNCATE _staging_productos_diff")
+    else:
+        if cambiadas:
+            asignaciones = ', '.join(
+                f"{c}=%s::jsonb" if c in _PRODUCTOS_COLS_JSONB else f"{c}=%s" for c in _PRODUCTOS_COLS_UPDATE
+            )
+            i_archivo = _PRODUCTOS_IDX['archivo']
+            cur.executemany(
+                f"UPDATE productos_listas SET {asignaciones}, updated_at=NOW() WHERE id=%s",
+                [tuple(v for i, v in enumerate(_fila_escritura(fila)) if i != i_archivo) + (h, fila_id)
+                 for fila_id, fila, h in cambiadas]
+            )
+        if nuevas:
+            valores = ','.join('%s::jsonb' if c in _PRODUCTOS_COLS_JSONB else '%s' for c in _PRODUCTOS_COLS_ESCRITURA)
+            cur.executemany(
+                f"INSERT INTO productos_listas ({columnas}, fila_hash) VALUES ({valores}, %s)",
+                [_fila_escritura(fila) + (h,) for fila, h in nuevas]
+            )
+    if sin_cambios:
+        # La fecha de la lista se muestra por fila: se actualiza también en las filas que no cambiaron
+        mtime = filas[0][_PRODUCTOS_IDX['mtime']]
+        cur.execute(
+            "UPDATE productos_listas SET mtime=%s WHERE archivo=%s AND mtime IS DISTINCT FROM %s",
+            (mtime, archivo, mtime)
+        )
+    cambios = {'insertadas': len(nuevas), 'actualizadas': len(cambiadas), 'borradas': len(borrar), 'sin_cambios': sin_cambios}
+    log_debug('pg_aplicar_productos_archivo:', archivo, cambios)
+    return cambios
+
+
+def pg_completar_lote(cur, batch_id, total_filas: int, cambios: dict):
+    """Marca el lote de import_batches como completado con los conteos de la carga."""
+    cur.execute(
+        """
+        UPDATE import_batches
+        SET status=%s, completed_at=NOW(), total_rows=%s,
+            filas_insertadas=%s, filas_actualizadas=%s, filas_borradas=%s, filas_sin_cambios=%s
+        WHERE id=%s
+        """,
+        ('completed', total_filas, cambios.get('insertadas'), cambios.get('actualizadas'),
+         cambios.get('borradas'), cambios.get('sin_cambios'), batch_id)
+    )
+
+
+# ---------------------------------------------------------------------------
+# productos_listas en SQLite (LISTAS_SQLITE): la misma carga por diferencias que en PostgreSQL y las
+# búsquedas por código, patrón y texto; el texto y el patrón de dígitos usan la tabla FTS5 trigram.
+# ---------------------------------------------------------------------------
+_SQLITE_COLS_PRODUCTO = ', '.join(('id',) + tuple(c for c in _PRODUCTOS_COLS_CARGA if c != 'batch_id'))
+
+
+def _fila_sqlite(fila) -> tuple:
+    """Fila en el orden de _PRODUCTOS_COLS_ESCRITURA con los valores que guarda SQLite: precio redondeado
+    como NUMERIC(14,4) (mismos resultados que PostgreSQL) y tokens como JSON.
+    """
+    fila = list(_fila_escritura(fila))
+    i_precio, i_tokens = _PRODUCTOS_IDX['precio'], _PRODUCTOS_IDX['tokens']
+    if fila[i_precio] is not None:
+        fila[i_precio] = _precio_como_numeric(fila[i_precio])
+    if fila[i_tokens] is not None and not isinstance(fila[i_tokens], str):
+        fila[i_tokens] = json.dumps(list(fila[i_tokens]), ensure_ascii=False)
+    return tuple(fila)
+
+
+def sqlite_aplicar_productos_archivo(cur, archivo: str, filas: list) -> dict:
+    """Versión SQLite de pg_aplicar_productos_archivo. La transacción del cursor ya tiene el lock de escritura
+    (BEGIN IMMEDIATE), así dos cargas del mismo archivo no parten del mismo estado previo.
+    """
+    columnas = ', '.join(_PRODUCTOS_COLS_ESCRITURA)
+    insertar = f"INSERT INTO productos_listas ({columnas}, fila_hash) VALUES ({', '.join('?' * (len(_PRODUCTOS_COLS_ESCRITURA) + 1))})"
+    if not PG_DIFF_IMPORT:
+        cur.execute("DELETE FROM productos_listas WHERE archivo=?", (archivo,))
+        borradas = cur.rowcount
+        cur.executemany(insertar, [_fila_sqlite(fila) + (_fila_hash(fila),) for fila in filas])
+        return {'insertadas': len(filas), 'actualizadas': 0, 'borradas': borradas, 'sin_cambios': 0}
+
+    cur.execute(
+        "SELECT id, proveedor_key, hoja, codigo, fila_hash FROM productos_listas WHERE archivo=? ORDER BY id",
+        (archivo,)
+    )
+    nuevas, cambiadas, borrar, sin_cambios = _diff_productos_archivo(cur.fetchall(), filas)
+    if borrar:
+        cur.executemany("DELETE FROM productos_listas WHERE id=?", [(fila_id,) for fila_id in borrar])
+    if cambiadas:
+        i_archivo = _PRODUCTOS_IDX['archivo']
+        asignaciones = ', '.join(f"{c}=?" for c in _PRODUCTOS_COLS_UPDATE)
+        cur.executemany(
+            f"UPDATE productos_listas SET {asignaciones}, updated_at=CURRENT_TIMESTAMP WHERE id=?",
+            [tuple(v for i, v in enumerate(_fila_sqlite(fila)) if i != i_archivo) + (h, fila_id)
+             for fila_id, fila, h in cambiadas]
+        )
+    if nuevas:
+        cur.executemany(insertar, [_fila_sqlite(fila) + (h,) for fila, h in nuevas])
+    if sin_cambios:
+        mtime = filas[0][_PRODUCTOS_IDX['mtime']]
+        cur.execute("UPDATE productos_listas SET mtime=? WHERE archivo=? AND mtime IS NOT ?", (mtime, archivo, mtime))
+    cambios = {'insertadas': len(nuevas), 'actualizadas': len(cambiadas), 'borradas': len(borrar), 'sin_cambios': sin_cambios}
+    log_debug('sqlite_aplicar_productos_archivo:', archivo, cambios)
+    return cambios
+
+
+def _cambios_modifican_filas(cambios: dict) -> bool:
+    return bool(cambios.get('insertadas') or cambios.get('actualizadas') or cambios.get('borradas'))
+
+
+def listas_db_aplicar_archivo(proveedor_key: str, archivo: str, mtime: float, armar_filas) -> tuple:
+    """Registra un lote en import_batches y deja en productos_listas las filas de `archivo`, en una sola
+    transacción de PostgreSQL o, con LISTAS_SQLITE, de SQLite. `armar_filas(batch_id)` devuelve las filas
+    en el orden de _PRODUCTOS_COLS_CARGA. Devuelve (filas, conteos de la importación por diferencias).
+    Si la carga cambió filas, los códigos de barras aprendidos se descartan en la misma transacción: todos, no solo
+    los del proveedor, porque una fila nueva de otro proveedor puede volver ambiguo un código que era único.
+    """
+    if LISTAS_SQLITE:
+        with get_sqlite_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO import_batches (proveedor_key, archivo, mtime, status) VALUES (?,?,?,?)",
+                (proveedor_key, archivo, mtime, 'running')
+            )
+            batch_id = cur.lastrowid
+            filas = armar_filas(batch_id)
+            cambios = sqlite_aplicar_productos_archivo(cur, archivo, filas)
+            if _cambios_modifican_filas(cambios):
+                cur.execute("DELETE FROM codigos_barras_aprendidos")
             cur.execute(
-                "UPDATE import_batches SET status=%s, completed_at=NOW(), total_rows=%s WHERE id=%s",
-                ('completed', total_insertados, batch_id)
+                """
+                UPDATE import_batches
+                SET status=?, completed_at=CURRENT_TIMESTAMP, total_rows=?,
+                    filas_insertadas=?, filas_actualizadas=?, filas_borradas=?, filas_sin_cambios=?
+                WHERE id=?
+                """,
+                ('completed', len(filas), cambios.get('insertadas'), cambios.get('actualizadas'),
+                 cambios.get('borradas'), cambios.get('sin_cambios'), batch_id)
+            )
+        return filas, cambios
+
+    with get_pg_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO import_batches (proveedor_key, archivo, mtime, status) VALUES (%s,%s,%s,%s) RETURNING id",
+            (proveedor_key, archivo, mtime, 'running')
+        )
+        _row = cur.fetchone()
+        batch_id = (_row['id'] if isinstance(_row, dict) else _row[0]) if _row is not None else None
+        filas = armar_filas(batch_id)
+        cambios = pg_aplicar_productos_archivo(cur, archivo, filas)
+        pg_completar_lote(cur, batch_id, len(filas), cambios)
+        if _cambios_modifican_filas(cambios):
+            cur.execute("DELETE FROM codigos_barras_aprendidos")
+    return filas, cambios
+
+
+def listas_db_borrar_archivos(archivos: list):
+    """Elimina de productos_listas e import_batches todo lo cargado desde esos archivos."""
+    params = [(a,) for a in archivos]
+    if LISTAS_SQLITE:
+        with get_sqlite_conn() as conn:
+            conn.executemany(
+                "DELETE FROM codigos_barras_aprendidos WHERE proveedor_key IN "
+                "(SELECT DISTINCT proveedor_key FROM productos_listas WHERE archivo=?)", params
             )
+            conn.executemany("DELETE FROM productos_listas WHERE archivo=?", params)
+            conn.executemany("DELETE FROM import_batches WHERE archivo=?", params)
+        return
+    with get_pg_conn() as conn, conn.cursor() as cur:
+        cur.executemany(
+            "DELETE FROM codigos_barras_aprendidos WHERE proveedor_key IN "
+            "(SELECT DISTINCT proveedor_key FROM productos_listas WHERE archivo=%s)", params
+        )
+        cur.executemany("DELETE FROM productos_listas WHERE archivo=%s", params)
+        cur.executemany("DELETE FROM import_batches WHERE archivo=%s", params)
+        conn.commit()
+
+
+def _sqlite_fila_producto(row) -> dict:
+    """Fila de SQLite con las mismas claves (y tipos) que los SELECT de productos_listas en PostgreSQL."""
+    fila = dict(row)
+    if isinstance(fila.get('tokens'), str):
+        fila['tokens'] = json.loads(fila['tokens'])
+    return fila
+
+
+def _sqlite_consultar_productos(where: str, params: list, orden: str, limite: int = None) -> list:
+    sql = f"SELECT {_SQLITE_COLS_PRODUCTO} FROM productos_listas WHERE {where} ORDER BY {orden}"
+    if limite:
+        sql += " LIMIT ?"
+        params = list(params) + [int(limite)]
+    with get_sqlite_conn() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [_sqlite_fila_producto(r) for r in rows]
+
+
+def _fts_frase(texto: str) -> str:
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def sqlite_buscar_codigos(codigos=(), digitos=(), digitos_sin_ceros=(), prov_key_filter: str = '', claves_barras=()) -> list:
+    """Mismo criterio que catalogo_buscar_codigos, con los índices de codigo / codigo_digitos de SQLite."""
+    condiciones = []
+    params = []
+    for columna, valores in (('codigo', codigos), ('codigo_digitos', digitos),
+                             ('codigo_digitos_nl', digitos_sin_ceros), ('clave_barras', claves_barras)):
+        valores = [v for v in dict.fromkeys(valores) if v]
+        if valores:
+            condiciones.append(f"{columna} IN ({', '.join('?' * len(valores))})")
+            params.extend(valores)
+    if not condiciones:
+        return []
+    where = f"({' OR '.join(condiciones)})"
+    if prov_key_filter:
+        where += " AND proveedor_key = ?"
+        params.append(prov_key_filter)
+    return _sqlite_consultar_productos(where, params, "proveedor_key, codigo, archivo, hoja, nombre, mtime DESC")
+
+
+def sqlite_buscar_patron_digitos(patron: str, prov_key_filter: str = '', limite: int = 500) -> list:
+    """codigo_digitos LIKE '%patron%'; con 3 o más dígitos se resuelve con el índice trigram."""
+    if _SQLITE_LISTAS_FTS['activo'] and len(patron) >= 3:
+        where = "id IN (SELECT rowid FROM productos_listas_fts WHERE productos_listas_fts MATCH ?)"
+        params = ['codigo_digitos : ' + _fts_frase(patron)]
+    else:
+        where = "codigo_digitos LIKE ?"
+        params = [f"%{patron}%"]
+    if prov_key_filter:
+        where += " AND proveedor_key = ?"
+        params.append(prov_key_filter)
+    return _sqlite_consultar_productos(where, params, "proveedor_key, codigo", limite)
+
+
+def sqlite_buscar_texto(token_groups, proveedor_filter: str = None, limite: int = None) -> list:
+    """Filas cuyo nombre/código normalizado contiene alguna variante de cada grupo (mismo criterio que el LIKE).
+    Los grupos con variantes de 3 o más caracteres van a una sola consulta FTS5; el trigram no indexa
+    subcadenas más cortas, así que esos grupos se filtran con LIKE sobre los candidatos.
+    """
+    frases = []
+    condiciones = []
+    params = []
+    for grupo in token_groups:
+        if not grupo:
+            continue
+        if _SQLITE_LISTAS_FTS['activo'] and all(len(v) >= 3 for v in grupo):
+            frases.append('(' + ' OR '.join(_fts_frase(v) for v in grupo) + ')')
+            continue
+        condiciones.append('(' + ' OR '.join(['nombre_normalizado LIKE ? OR codigo_normalizado LIKE ?'] * len(grupo)) + ')')
+        for v in grupo:
+            params.extend([f"%{v}%", f"%{v}%"])
+    if frases:
+        condiciones.insert(0, "id IN (SELECT rowid FROM productos_listas_fts WHERE productos_listas_fts MATCH ?)")
+        params.insert(0, '{nombre_normalizado codigo_normalizado} : (' + ' AND '.join(frases) + ')')
+    if proveedor_filter:
+        condiciones.append("proveedor_key = ?")
+        params.append(proveedor_filter)
+    where = ' AND '.join(condiciones) if condiciones else '1'
+    return _sqlite_consultar_productos(where, params, "proveedor_nombre, nombre_normalizado", limite)
+
+
+# ---------------------------------------------------------------------------
+# Sincronización en paralelo: parseo en un pool de procesos, carga por archivo en el proceso principal
+# ---------------------------------------------------------------------------
+_sync_workers_env = os.getenv('SYNC_WORKERS', '').strip()
+SYNC_WORKERS = int(_sync_workers_env) if _sync_workers_env.isdigit() else (os.cpu_count() or 1)
+
+_SYNC_PROGRESO = {
+    'en_curso': False,
+    'inicio': None,
+    'fin': None,
+    'duracion_ms': None,
+    'workers': 0,
+    'archivos': {},  # archivo -> {estado, filas, lectura_ms, proceso_ms, carga_ms, error}
+}
+_SYNC_PROGRESO_LOCK = threading.Lock()
+
+
+def _sync_progreso_iniciar(archivos):
+    with _SYNC_PROGRESO_LOCK:
+        _SYNC_PROGRESO.update({
+            'en_curso': True,
+            'inicio': now_local().strftime('%Y-%m-%d %H:%M:%S'),
+            'fin': None,
+            'duracion_ms': None,
+            '_t0': time.perf_counter(),
+            'archivos': {a: {'estado': 'pendiente'} for a in archivos},
+        })
+
+
+def _sync_progreso_archivo(archivo, **datos):
+    with _SYNC_PROGRESO_LOCK:
+        _SYNC_PROGRESO['archivos'].setdefault(archivo, {}).update(datos)
+
+
+def _sync_progreso_finalizar():
+    with _SYNC_PROGRESO_LOCK:
+        t0 = _SYNC_PROGRESO.pop('_t0', None)
+        _SYNC_PROGRESO['en_curso'] = False
+        _SYNC_PROGRESO['fin'] = now_local().strftime('%Y-%m-%d %H:%M:%S')
+        if t0 is not None:
+            _SYNC_PROGRESO['duracion_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def sync_listas_progreso():
+    """Estado de la última sincronización de listas (por archivo, con tiempos)."""
+    with _SYNC_PROGRESO_LOCK:
+        estado = {k: v for k, v in _SYNC_PROGRESO.items() if not k.startswith('_')}
+        estado['archivos'] = {a: dict(d) for a, d in _SYNC_PROGRESO['archivos'].items()}
+    archivos = estado['archivos'].values()
+    estado['total'] = len(estado['archivos'])
+    estado['completados'] = sum(1 for d in archivos if d.get('estado') in ('ok', 'error'))
+    return estado
+
+
+def _parsear_archivo_listas(ruta: str, provider_key: str, cfg: dict):
+    """Lee un Excel de lista y lo convierte en filas (corre dentro de un proceso del pool).
+    Devuelve {'hojas': [(hoja, filas)], 'lectura_ms', 'proceso_ms', 'error'}.
+    """
+    resultado = {'hojas': [], 'lectura_ms': 0.0, 'proceso_ms': 0.0, 'error': None}
+    inicio = time.perf_counter()
+    try:
+        all_sheets = pd.read_excel(ruta, sheet_name=None, header=cfg.get('header', 0))
+    except Exception as exc:
+        resultado['error'] = str(exc)
+        return resultado
+    resultado['lectura_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    inicio = time.perf_counter()
+    try:
+        for sheet_name, df in all_sheets.items():
+            if df is None or df.empty:
+                continue
+            filas = procesar_hoja_listas(df, cfg, provider_key, sheet_name)
+            if filas is None:
+                log_debug('_parsear_archivo_listas: hoja sin columna nombre, se omite', ruta, sheet_name)
+                continue
+            resultado['hojas'].append((sheet_name, filas))
+    except Exception as exc:
+        resultado['hojas'] = []
+        resultado['error'] = f'{type(exc).__name__}: {exc}'
+    resultado['proceso_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+def _parsear_archivos_listas(trabajos):
+    """Genera (trabajo, parseado) a medida que termina el parseo de cada archivo.
+    Con más de un archivo y SYNC_WORKERS > 1 usa un pool de procesos; si el pool no se puede
+    crear (o se rompe) sigue en el proceso actual con los archivos que falten.
+    Los workers se crean con spawn en todas las plataformas: un fork dentro de waitress copiaría locks tomados por
+    otros hilos (pool de PostgreSQL, catálogo, progreso de la sincronización, logging) y el hijo podría bloquearse.
+    """
+    pendientes = list(trabajos)
+    workers = min(SYNC_WORKERS, len(pendientes))
+    with _SYNC_PROGRESO_LOCK:
+        _SYNC_PROGRESO['workers'] = workers if workers > 1 else 1
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futuros = {}
+                for t in pendientes:
+                    futuros[pool.submit(_parsear_archivo_listas, t['ruta'], t['provider_key'], t['cfg'])] = t
+                    _sync_progreso_archivo(t['archivo'], estado='parseando')
+                for futuro in as_completed(futuros):
+                    t = futuros[futuro]
+                    parseado = futuro.result()
+                    pendientes.remove(t)
+                    yield t, parseado
+            return
+        except Exception as exc:
+            print(f'[WARN] sync_listas_to_db: pool de procesos no disponible ({exc}), se sigue en serie', flush=True)
+            with _SYNC_PROGRESO_LOCK:
+                _SYNC_PROGRESO['workers'] = 1
+    for t in pendientes:
+        _sync_progreso_archivo(t['archivo'], estado='parseando')
+        yield t, _parsear_archivo_listas(t['ruta'], t['provider_key'], t['cfg'])
+
+
+def _resolver_proveedor_archivo(filename: str, prov_cfg: dict) -> tuple:
+    """(provider_key, cfg del importador) para un Excel de LISTAS_PATH; cfg es None si no se reconoce.
+    Si el nombre no corresponde a un proveedor configurado, intenta inferirlo con los nombres_base.
+    """
+    provider_key = provider_key_from_filename(filename)
+    cfg = prov_cfg.get(provider_key)
+    if cfg:
+        return provider_key, cfg
+    inferred_key = provider_name_to_key(inferir_nombre_base_archivo(filename, proveedores))
+    cfg = prov_cfg.get(inferred_key)
+    return (inferred_key, cfg) if cfg else (provider_key, None)
+
+
+def _filas_carga_archivo(trabajo: dict, hojas: list, batch_id=None) -> list:
+    """Filas de las hojas parseadas en el orden de _PRODUCTOS_COLS_CARGA."""
+    filename = trabajo['archivo']
+    provider_key = trabajo['provider_key']
+    proveedor_display = trabajo['proveedor_display']
+    mtime = trabajo['mtime']
+    precio_fuente = trabajo['cfg'].get('precio_canon', ['precio'])[0]
+    filas_carga = []
+    for sheet_name, filas in hojas:
+        filas_carga.extend(
+            (provider_key, proveedor_display, filename, sheet_name, mtime) + fila[:5]
+            + (fila[5], precio_fuente) + fila[6:] + (batch_id,)
+            for fila in filas
+        )
+    return filas_carga
+
+
+def _cargar_archivo_listas(trabajo: dict, hojas: list) -> tuple:
+    """Registra el lote y aplica las filas del archivo en productos_listas (una transacción).
+    Devuelve (filas del archivo, conteos de la importación por diferencias).
+    """
+    filename = trabajo['archivo']
+    mtime = trabajo['mtime']
+
+    def _armar_filas(batch_id):
+        print(f"[DEBUG sync_listas_to_db] Batch creado con ID: {batch_id} para {filename}")
+        for sheet_name, filas in hojas:
+            print(f"[DEBUG sync_listas_to_db] Hoja {sheet_name}: {len(filas)} filas preparadas")
+        return _filas_carga_archivo(trabajo, hojas, batch_id)
+
+    # Solo se escriben las diferencias con lo cargado antes (o reemplazo completo con PG_DIFF_IMPORT=0)
+    batch_data, cambios = listas_db_aplicar_archivo(trabajo['provider_key'], filename, mtime, _armar_filas)
+    total_insertados = len(batch_data)
+    print(f"[DEBUG sync_listas_to_db] {filename}: {cambios}")
+    if LISTAS_SNAPSHOTS and snapshot_escribir(filename, mtime, batch_data):
+        snapshot_borrar(filename, conservar=_snapshot_ruta(filename, mtime))
+    return total_insertados, cambios
+
+
+def sync_listas_to_db(archivos: list = None):
+    """Lee archivos Excel de LISTAS_PATH y carga productos a PostgreSQL (o a SQLite con LISTAS_SQLITE).
+    Aplica por archivo solo las filas que cambiaron (en una transacción) y registra lote en import_batches.
+    Con `archivos` solo se reimportan esos nombres (re-import incremental): los que ya no están
+    en disco, o pasaron a OLD, se eliminan de la DB.
+    Devuelve un dict resumen.
+    """
+    pedidos = set(archivos) if archivos is not None else None
+    print(f"[DEBUG sync_listas_to_db] === INICIO DE SINCRONIZACIÓN === {sorted(pedidos) if pedidos is not None else 'todas las listas'}")
+    resumen = {'procesados': 0, 'insertados': 0, 'archivos': []}
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
+        print("[DEBUG sync_listas_to_db] ERROR: PostgreSQL no disponible")
+        return {'error': 'PostgreSQL no disponible.'}
+    print(f"[DEBUG sync_listas_to_db] {'SQLite' if LISTAS_SQLITE else 'PostgreSQL'} disponible, LISTAS_PATH={LISTAS_PATH}")
+
+    prov_cfg = _listas_provider_configs()
+    try:
+        excel_files = sorted(
+            f for f in os.listdir(LISTAS_PATH)
+            if f.lower().endswith(('.xlsx', '.xls'))
+            and 'old' not in f.lower()
+            and not _is_temp_wizard_excel(f)
+        )
+        print(f"[DEBUG sync_listas_to_db] Archivos Excel encontrados: {len(excel_files)} -> {excel_files}")
+    except Exception as exc:
+        print(f"[DEBUG sync_listas_to_db] ERROR al listar {LISTAS_PATH}: {exc}")
+        return {'error': f'No se pudo listar {LISTAS_PATH}: {exc}'}
+    excel_set = set(excel_files)
+    if pedidos is not None:
+        excel_files = [f for f in excel_files if f in pedidos]
+
+    # Limpiar archivos obsoletos en DB (que ya no existen en disco o quedaron OLD)
+    try:
+        # En un re-import parcial solo se miran los archivos pedidos (sin agregar sobre productos_listas)
+        estado_db = _db_files_state() if pedidos is None else dict.fromkeys(pedidos)
+        archivos_obsoletos = []
+        for archivo_db in estado_db.keys():
+            if _is_virtual_wizard_file(archivo_db):
+                continue
+            low = archivo_db.lower() if isinstance(archivo_db, str) else ''
+            if (archivo_db not in excel_set) or ('old' in low):
+                archivos_obsoletos.append(archivo_db)
+        if archivos_obsoletos:
+            listas_db_borrar_archivos(archivos_obsoletos)
+            print(f"[DEBUG sync_listas_to_db] Limpieza: {len(archivos_obsoletos)} archivo(s) obsoletos eliminados de la DB: {archivos_obsoletos}")
+            if LISTAS_SNAPSHOTS:
+                for archivo_obsoleto in archivos_obsoletos:
+                    snapshot_borrar(archivo_obsoleto)
+    except Exception as exc:
+        print(f"[WARN sync_listas_to_db] No se pudieron limpiar archivos obsoletos de la DB: {exc}")
+    # Resolver proveedor y configuración de cada archivo (rápido, en este hilo)
+    trabajos = []
+    omitidos = {}  # archivos que no se pueden cargar: no deben volver a disparar un sync mientras no cambien
+    for filename in excel_files:
+        print(f"[DEBUG sync_listas_to_db] --- Preparando archivo: {filename} ---")
+        try:
+            # Proveedor desconocido para el importador → se intenta inferir usando nombres_base de proveedores
+            provider_key, cfg = _resolver_proveedor_archivo(filename, prov_cfg)
+        except Exception as _inf_err:
+            print(f"[DEBUG sync_listas_to_db] Error infiriendo proveedor para {filename}: {_inf_err}")
+            log_debug('sync_listas_to_db: error infiriendo proveedor para', filename, _inf_err)
+            omitidos[filename] = _mtime_o_none(os.path.join(LISTAS_PATH, filename))
+            continue
+        if not cfg:
+            # No se pudo inferir, saltar archivo
+            print(f"[DEBUG sync_listas_to_db] No se pudo inferir proveedor para {filename}, se omite")
+            log_debug('sync_listas_to_db: proveedor no reconocido, se omite', filename, '-> key:', provider_key)
+            omitidos[filename] = _mtime_o_none(os.path.join(LISTAS_PATH, filename))
+            continue
+        print(f"[DEBUG sync_listas_to_db] cfg encontrado para provider_key: {provider_key}")
+
+        file_path = os.path.join(LISTAS_PATH, filename)
+        try:
+            mtime = os.path.getmtime(file_path)
+            print(f"[DEBUG sync_listas_to_db] mtime del archivo: {mtime}")
+        except Exception:
+            mtime = 0.0
+            print(f"[DEBUG sync_listas_to_db] No se pudo obtener mtime, usando 0.0")
+        trabajos.append({
+            'archivo': filename,
+            'ruta': file_path,
+            'provider_key': provider_key,
+            'proveedor_display': get_proveedor_display_name(provider_key),
+            'cfg': cfg,
+            'mtime': mtime,
+        })
+
+    # Parseo en paralelo (pool de procesos) y carga de cada archivo apenas termina su parseo,
+    # en su propia transacción: los lectores ven cada archivo viejo o nuevo, nunca a medias.
+    _sync_progreso_iniciar([t['archivo'] for t in trabajos])
+    try:
+        for trabajo, parseado in _parsear_archivos_listas(trabajos):
+            filename = trabajo['archivo']
+            if parseado.get('error'):
+                print(f"[DEBUG sync_listas_to_db] ERROR leyendo {filename}: {parseado['error']}")
+                log_debug('sync_listas_to_db: error leyendo', filename, parseado['error'])
+                _sync_progreso_archivo(filename, estado='error', error=parseado['error'])
+                omitidos[filename] = trabajo['mtime']
+                continue
+            _sync_progreso_archivo(filename, estado='cargando', lectura_ms=parseado['lectura_ms'],
+                                   proceso_ms=parseado['proceso_ms'])
+            try:
+                inicio_carga = time.perf_counter()
+                total_insertados, cambios = _cargar_archivo_listas(trabajo, parseado['hojas'])
+                carga_ms = round((time.perf_counter() - inicio_carga) * 1000, 1)
+            except Exception as exc:
+                print(f"[ERROR sync_listas_to_db] Falló la carga de {filename}: {exc}", flush=True)
+                _sync_progreso_archivo(filename, estado='error', error=str(exc))
+                resumen.setdefault('errores', []).append({'archivo': filename, 'error': str(exc)})
+                continue
+            _sync_progreso_archivo(filename, estado='ok', filas=total_insertados, carga_ms=carga_ms)
 
             resumen['procesados'] += 1
             resumen['insertados'] += total_insertados
-            resumen['archivos'].append({'archivo': filename, 'filas': total_insertados, 'proveedor': provider_key})
-            print(f"[DEBUG sync_listas_to_db] Archivo {filename} completado: {total_insertados} productos")
+            resumen['archivos'].append({
+                'archivo': filename,
+                'filas': total_insertados,
+                'proveedor': trabajo['provider_key'],
+                'lectura_ms': parseado['lectura_ms'],
+                'proceso_ms': parseado['proceso_ms'],
+                'carga_ms': carga_ms,
+                'cambios': cambios,
+            })
+            print(f"[DEBUG sync_listas_to_db] Archivo {filename} completado: {total_insertados} productos "
+                  f"(lectura {parseado['lectura_ms']} ms, proceso {parseado['proceso_ms']} ms, carga {carga_ms} ms)")
+    finally:
+        _sync_progreso_finalizar()
 
     # Importar productos manuales a la misma tabla (proveedor_key='manual')
     print("[DEBUG sync_listas_to_db] === Procesando productos_manual.xlsx ===")
     try:
-        productos_manual, err = load_manual_products()
+        if pedidos is not None and not any(f.lower().startswith('productos_manual') for f in pedidos):
+            productos_manual, err = None, None
+        else:
+            productos_manual, err = load_manual_products()
         print(f"[DEBUG sync_listas_to_db] productos_manual cargados: {len(productos_manual) if productos_manual else 0}, error: {err}")
         if productos_manual:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                # Buscar el archivo real (puede tener fecha agregada)
-                filename = 'productos_manual.xlsx'  # valor por defecto
-                file_path = os.path.join(LISTAS_PATH, filename)
-                try:
-                    archivos = os.listdir(LISTAS_PATH)
-                    candidatos = []
-                    for fname in archivos:
-                        if fname.lower().startswith('productos_manual') and fname.lower().endswith(('.xlsx', '.xls')):
-                            if 'old' not in fname.lower():
-                                candidatos.append(fname)
-                    if candidatos:
-                        candidatos_con_mtime = []
-                        for fname in candidatos:
-                            fpath = os.path.join(LISTAS_PATH, fname)
-                            try:
-                                mt = os.path.getmtime(fpath)
-                                candidatos_con_mtime.append((fpath, mt, fname))
-                            except Exception:
-                                pass
-                        if candidatos_con_mtime:
-                            candidatos_con_mtime.sort(key=lambda x: x[1], reverse=True)
-                            file_path = candidatos_con_mtime[0][0]
-                            filename = candidatos_con_mtime[0][2]
-                except Exception:
-                    pass
-                
-                try:
-                    mtime = os.path.getmtime(file_path)
-                except Exception:
-                    mtime = 0.0
-                cur.execute(
-                    "INSERT INTO import_batches (proveedor_key, archivo, mtime, status) VALUES (%s,%s,%s,%s) RETURNING id",
-                    ('manual', filename, mtime, 'running')
-                )
-                _row2 = cur.fetchone()
-                batch_id = (_row2['id'] if isinstance(_row2, dict) else _row2[0]) if _row2 is not None else None
-                cur.execute("DELETE FROM productos_listas WHERE archivo=%s", (filename,))
-                deleted_manual = cur.rowcount
-                print(f"[DEBUG sync_listas_to_db] productos_manual: eliminados {deleted_manual} registros previos")
-                
-                # OPTIMIZACIÓN: Recopilar todos los datos en un batch antes de insertar
-                batch_data_manual = []
-                for p in productos_manual:
-                    code = str(p.get('codigo', '')).strip()
-                    name = str(p.get('nombre', '')).strip()
-                    price = p.get('precio')
-                    if not code or not name:
-                        continue
-                    if price is None:
-                        continue
-                    codigo_digitos = ''.join(filter(str.isdigit, code))
-                    nombre_norm = normalize_text(formatear_pulgadas(name))
-                    codigo_norm = normalize_text(code)
-                    precios_dict = {'precio': float(price)}
-                    
-                    batch_data_manual.append((
-                        'manual', 'Manual', filename, '-', mtime,
-                        code, codigo_digitos, codigo_norm,
-                        name, nombre_norm,
-                        float(price), 'precio', json.dumps(precios_dict, ensure_ascii=False), json.dumps({}, ensure_ascii=False), batch_id
-                    ))
-                
-                # Insertar todos los productos manuales en un solo batch
-                total_insertados = 0
-                if batch_data_manual:
-                    print(f"[DEBUG sync_listas_to_db] productos_manual: insertando {len(batch_data_manual)} filas en batch...")
-                    cur.executemany(
-                        """
-                        INSERT INTO productos_listas
-                        (proveedor_key, proveedor_nombre, archivo, hoja, mtime,
-                         codigo, codigo_digitos, codigo_normalizado,
-                         nombre, nombre_normalizado,
-                         precio, precio_fuente, precios, extra_datos, batch_id)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::jsonb,%s::jsonb,%s)
-                        """,
-                        batch_data_manual
-                    )
-                    total_insertados = len(batch_data_manual)
-                    print(f"[DEBUG sync_listas_to_db] productos_manual: batch insertado exitosamente")
+            # Buscar el archivo real (puede tener fecha agregada)
+            filename = 'productos_manual.xlsx'  # valor por defecto
+            file_path = os.path.join(LISTAS_PATH, filename)
+            try:
+                archivos = os.listdir(LISTAS_PATH)
+                candidatos = []
+                for fname in archivos:
+                    if fname.lower().startswith('productos_manual') and fname.lower().endswith(('.xlsx', '.xls')):
+                        if 'old' not in fname.lower():
+                            candidatos.append(fname)
+                if candidatos:
+                    candidatos_con_mtime = []
+                    for fname in candidatos:
+                        fpath = os.path.join(LISTAS_PATH, fname)
+                        try:
+                            mt = os.path.getmtime(fpath)
+                            candidatos_con_mtime.append((fpath, mt, fname))
+                        except Exception:
+                            pass
+                    if candidatos_con_mtime:
+                        candidatos_con_mtime.sort(key=lambda x: x[1], reverse=True)
+                        file_path = candidatos_con_mtime[0][0]
+                        filename = candidatos_con_mtime[0][2]
+            except Exception:
+                pass
+            
+            try:
+                mtime = os.path.getmtime(file_path)
+            except Exception:
+                mtime = 0.0
+            # OPTIMIZACIÓN: Recopilar todos los datos en un batch antes de insertar
+            batch_data_manual = []
+            for p in productos_manual:
+                code = str(p.get('codigo', '')).strip()
+                name = str(p.get('nombre', '')).strip()
+                price = p.get('precio')
+                if not code or not name:
+                    continue
+                if price is None:
+                    continue
+                codigo_digitos = ''.join(filter(str.isdigit, code))
+                nombre_pulg, nombre_norm, medidas, tokens = atributos_busqueda_producto(name, code)
+                codigo_norm = normalize_text(code)
+                precios_dict = {'precio': float(price)}
                 
-                cur.execute(
-                    "UPDATE import_batches SET status=%s, completed_at=NOW(), total_rows=%s WHERE id=%s",
-                    ('completed', total_insertados, batch_id)
-                )
-                resumen['procesados'] += 1
-                resumen['insertados'] += total_insertados
-                resumen['archivos'].append({'archivo': filename, 'filas': total_insertados, 'proveedor': 'manual'})
-                print(f"[DEBUG sync_listas_to_db] productos_manual completado: {total_insertados} productos insertados")
+                batch_data_manual.append((
+                    'manual', 'Manual', filename, '-', mtime,
+                    code, codigo_digitos, codigo_norm,
+                    name, nombre_norm,
+                    float(price), 'precio', None,
+                    json.dumps(precios_dict, ensure_ascii=False), json.dumps({}, ensure_ascii=False),
+                    nombre_pulg, json.dumps(medidas), tokens
+                ))
+            
+            # Aplicar los productos manuales en un solo paso (solo las diferencias)
+            print(f"[DEBUG sync_listas_to_db] productos_manual: cargando {len(batch_data_manual)} filas...")
+            batch_data_manual, cambios = listas_db_aplicar_archivo(
+                'manual', filename, mtime, lambda batch_id: [fila + (batch_id,) for fila in batch_data_manual]
+            )
+            total_insertados = len(batch_data_manual)
+            print(f"[DEBUG sync_listas_to_db] productos_manual: {cambios}")
+
+            resumen['procesados'] += 1
+            resumen['insertados'] += total_insertados
+            resumen['archivos'].append({'archivo': filename, 'filas': total_insertados, 'proveedor': 'manual', 'cambios': cambios})
+            print(f"[DEBUG sync_listas_to_db] productos_manual completado: {total_insertados} productos insertados")
         elif err:
             print(f"[DEBUG sync_listas_to_db] productos_manual error: {err}")
             log_debug('sync_listas_to_db: productos_manual error', err)
@@ -2888,28 +4184,40 @@ def sync_listas_to_db():
         log_debug('sync_listas_to_db: error importando manual', exc)
 
     print(f"[DEBUG sync_listas_to_db] === FIN DE SINCRONIZACIÓN === Resumen: {resumen}")
+    if omitidos:
+        resumen['omitidos'] = sorted(omitidos)
+    listas_estado_invalidar(omitidos, archivos=pedidos)
+    catalogo_refrescar()
     return resumen
 
 
+def _mtime_o_none(ruta: str):
+    try:
+        return os.path.getmtime(ruta)
+    except Exception:
+        return None
+
+
 def _excel_files_state():
     """Devuelve un dict {archivo: mtime} de los Excel vigentes en LISTAS_PATH.
     Ignora archivos con 'old' en el nombre y no-xlsx/xls.
     """
     estado = {}
     try:
-        for fname in os.listdir(LISTAS_PATH):
-            low = fname.lower()
-            if not (low.endswith('.xlsx') or low.endswith('.xls')):
-                continue
-            if 'old' in low:
-                continue
-            if _is_temp_wizard_excel(fname):
-                continue
-            fpath = os.path.join(LISTAS_PATH, fname)
-            try:
-                estado[fname] = os.path.getmtime(fpath)
-            except Exception:
-                pass
+        with os.scandir(LISTAS_PATH) as entradas:
+            for entrada in entradas:
+                fname = entrada.name
+                low = fname.lower()
+                if not (low.endswith('.xlsx') or low.endswith('.xls')):
+                    continue
+                if 'old' in low:
+                    continue
+                if _is_temp_wizard_excel(fname):
+                    continue
+                try:
+                    estado[fname] = entrada.stat().st_mtime
+                except Exception:
+                    pass
     except Exception as exc:
         log_debug('_excel_files_state: no se pudo listar', LISTAS_PATH, exc)
     return estado
@@ -2919,41 +4227,124 @@ def _db_files_state():
     """Consulta la DB y devuelve un dict {archivo: max_mtime_en_db}.
     Si no hay DB disponible, devuelve {}.
     """
-    if not (DATABASE_URL and psycopg):
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
         return {}
     estado = {}
     try:
-        with get_pg_conn() as conn, conn.cursor() as cur:
-            cur.execute("SELECT archivo, MAX(mtime) AS m FROM productos_listas GROUP BY archivo")
-            for row in (cur.fetchall() or []):
-                if isinstance(row, dict):
-                    archivo = row.get('archivo')
-                    m = row.get('m')
-                else:
-                    archivo, m = row[0], row[1]
-                if archivo:
-                    try:
-                        estado[archivo] = float(m) if m is not None else None
-                    except Exception:
-                        estado[archivo] = m
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                rows = conn.execute("SELECT archivo, MAX(mtime) AS m FROM productos_listas GROUP BY archivo").fetchall()
+        else:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.execute("SELECT archivo, MAX(mtime) AS m FROM productos_listas GROUP BY archivo")
+                rows = cur.fetchall() or []
+        for row in rows:
+            if isinstance(row, dict):
+                archivo = row.get('archivo')
+                m = row.get('m')
+            else:
+                archivo, m = row[0], row[1]
+            if archivo:
+                try:
+                    estado[archivo] = float(m) if m is not None else None
+                except Exception:
+                    estado[archivo] = m
     except Exception as exc:
         log_debug('_db_files_state: error consultando DB', exc)
     return estado
 
 
-def listas_db_desactualizadas(tolerancia_segundos: float = 1.0) -> bool:
-    """Compara mtimes de Excel en disco vs valores en productos_listas.
-    Devuelve True si falta algún archivo en DB o algún mtime difiere por más de tolerancia.
+def _db_manifest_state():
+    """{archivo: mtime} del último lote completado de cada archivo según import_batches.
+    Es una tabla chica (un registro por carga), a diferencia de agregar sobre productos_listas.
     """
-    if not (LISTAS_EN_DB and DATABASE_URL and psycopg):
-        return False
-    fs = _excel_files_state()
-    if not fs:
-        # No hay excels, no hay nada que sincronizar
-        return False
-    db = _db_files_state()
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
+        return {}
+    estado = {}
+    try:
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT archivo, mtime
+                    FROM import_batches
+                    WHERE id IN (SELECT MAX(id) FROM import_batches WHERE status = 'completed' GROUP BY archivo)
+                    """
+                ).fetchall()
+        else:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT DISTINCT ON (archivo) archivo, mtime
+                    FROM import_batches
+                    WHERE status = 'completed'
+                    ORDER BY archivo, id DESC
+                    """
+                )
+                rows = cur.fetchall() or []
+        for row in rows:
+            archivo = row['archivo'] if isinstance(row, dict) else row[0]
+            m = row['mtime'] if isinstance(row, dict) else row[1]
+            if archivo:
+                estado[archivo] = float(m) if m is not None else None
+    except Exception as exc:
+        log_debug('_db_manifest_state: error consultando import_batches', exc)
+        return None
+    return estado
+
+
+# Verificación de listas desactualizadas: el resultado vale LISTAS_ESTADO_TTL segundos y el manifiesto
+# de import_batches se relee cada LISTAS_MANIFEST_TTL (o al invalidarlo tras una carga en este proceso).
+LISTAS_ESTADO_TTL = float(os.getenv('LISTAS_ESTADO_TTL', '5'))
+LISTAS_MANIFEST_TTL = float(os.getenv('LISTAS_MANIFEST_TTL', '60'))
+_LISTAS_ESTADO = {
+    'verificado_en': None,  # monotonic de la última comparación disco vs DB
+    'desactualizadas': None,
+    'firma': None,  # (huella de LISTAS_PATH, versión del manifiesto) de esa comparación
+    'manifest': None,
+    'manifest_en': None,
+    'manifest_version': 0,
+    'omitidos': {},  # archivo -> mtime de Excel que el último sync no pudo cargar (proveedor desconocido, ilegible)
+    'verificaciones': 0,
+    'consultas_manifest': 0,
+}
+_LISTAS_ESTADO_LOCK = threading.Lock()
+
+
+def listas_estado_invalidar(omitidos: dict = None, archivos=None):
+    """Descarta la verificación y el manifiesto cacheados (llamar después de cargar o borrar listas).
+    `omitidos` ({archivo: mtime}) son los Excel que el sync no pudo cargar: mientras no cambien no
+    cuentan como desactualizados, así no se dispara un sync tras otro por el mismo archivo.
+    Con `archivos` (re-import parcial) solo se actualiza el estado de omitidos de esos archivos.
+    """
+    busqueda_cache_invalidar()
+    with _LISTAS_ESTADO_LOCK:
+        _LISTAS_ESTADO['verificado_en'] = None
+        _LISTAS_ESTADO['manifest'] = None
+        if omitidos is not None:
+            if archivos is None:
+                _LISTAS_ESTADO['omitidos'] = dict(omitidos)
+            else:
+                actuales = {a: m for a, m in _LISTAS_ESTADO['omitidos'].items() if a not in archivos}
+                actuales.update(omitidos)
+                _LISTAS_ESTADO['omitidos'] = actuales
+
+
+def listas_db_desactualizadas_en_cache():
+    """Último resultado de listas_db_desactualizadas() si sigue vigente (TTL), o None. Sin E/S."""
+    with _LISTAS_ESTADO_LOCK:
+        verificado_en = _LISTAS_ESTADO['verificado_en']
+        if verificado_en is not None and time.monotonic() - verificado_en < LISTAS_ESTADO_TTL:
+            return _LISTAS_ESTADO['desactualizadas']
+    return None
+
+
+def _comparar_listas_disco_db(fs: dict, db: dict, tolerancia_segundos: float, omitidos: dict = None) -> bool:
+    omitidos = omitidos or {}
     for archivo, mtime_fs in fs.items():
         mtime_db = db.get(archivo)
+        if mtime_db is None and archivo in omitidos and omitidos[archivo] == mtime_fs:
+            continue
         if mtime_db is None:
             log_debug('listas_db_desactualizadas: falta en DB', archivo)
             return True
@@ -2975,43 +4366,1377 @@ def listas_db_desactualizadas(tolerancia_segundos: float = 1.0) -> bool:
     return False
 
 
-def maybe_auto_sync_listas() -> dict | None:
-    """Si las listas en DB están desactualizadas respecto a los Excel, ejecuta sync_listas_to_db().
-    Devuelve el resumen del sync o None si no hizo nada o falló.
+def listas_db_desactualizadas(tolerancia_segundos: float = 1.0) -> bool:
+    """Compara mtimes de Excel en disco vs el manifiesto de lotes cargados (import_batches).
+    Devuelve True si falta algún archivo en DB, algún mtime difiere por más de tolerancia,
+    o en DB queda un archivo que ya no está en disco (borrado, renombrado o pasado a OLD).
+    Dentro de LISTAS_ESTADO_TTL devuelve el resultado anterior sin tocar disco ni DB.
+    """
+    if not LISTAS_DB:
+        return False
+    en_cache = listas_db_desactualizadas_en_cache()
+    if en_cache is not None:
+        return en_cache
+
+    fs = _excel_files_state()
+    huella_fs = tuple(sorted(fs.items()))
+    ahora = time.monotonic()
+    with _LISTAS_ESTADO_LOCK:
+        db = _LISTAS_ESTADO['manifest']
+        if db is not None and ahora - (_LISTAS_ESTADO['manifest_en'] or 0) >= LISTAS_MANIFEST_TTL:
+            db = None
+    if db is None:
+        db = _db_manifest_state()
+        if db is None:
+            # No se pudo leer el manifiesto: no asumir nada y reintentar en la próxima llamada
+            return False
+        with _LISTAS_ESTADO_LOCK:
+            _LISTAS_ESTADO['consultas_manifest'] += 1
+            if db != _LISTAS_ESTADO['manifest']:
+                _LISTAS_ESTADO['manifest_version'] += 1
+            _LISTAS_ESTADO['manifest'] = db
+            _LISTAS_ESTADO['manifest_en'] = ahora
+
+    with _LISTAS_ESTADO_LOCK:
+        firma = (huella_fs, _LISTAS_ESTADO['manifest_version'])
+        if firma == _LISTAS_ESTADO['firma'] and _LISTAS_ESTADO['desactualizadas'] is not None:
+            resultado = _LISTAS_ESTADO['desactualizadas']
+        else:
+            resultado = None
+        omitidos = _LISTAS_ESTADO['omitidos']
+    if resultado is None:
+        resultado = _comparar_listas_disco_db(fs, db, tolerancia_segundos, omitidos)
+    with _LISTAS_ESTADO_LOCK:
+        _LISTAS_ESTADO['firma'] = firma
+        _LISTAS_ESTADO['desactualizadas'] = resultado
+        _LISTAS_ESTADO['verificado_en'] = time.monotonic()
+        _LISTAS_ESTADO['verificaciones'] += 1
+    return resultado
+
+
+def _archivos_a_reimportar(archivos, tolerancia_segundos: float = 1.0) -> list:
+    """De `archivos`, los que difieren de lo cargado según import_batches: nuevos o modificados en disco,
+    o cargados en DB y ya borrados / pasados a OLD. Evita reimportar lo que otro disparo ya cargó.
+    """
+    fs = _excel_files_state()
+    db = _db_manifest_state()
+    if db is None:
+        return sorted(archivos)
+    with _LISTAS_ESTADO_LOCK:
+        omitidos = dict(_LISTAS_ESTADO['omitidos'])
+    pendientes = []
+    for archivo in sorted(archivos):
+        if _is_virtual_wizard_file(archivo):
+            continue
+        en_fs = {archivo: fs[archivo]} if archivo in fs else {}
+        en_db = {archivo: db[archivo]} if archivo in db else {}
+        if (en_fs or en_db) and _comparar_listas_disco_db(en_fs, en_db, tolerancia_segundos, omitidos):
+            pendientes.append(archivo)
+    return pendientes
+
+
+def listas_estado_stats():
+    with _LISTAS_ESTADO_LOCK:
+        verificado_en = _LISTAS_ESTADO['verificado_en']
+        return {
+            'desactualizadas': _LISTAS_ESTADO['desactualizadas'],
+            'verificado_hace_s': round(time.monotonic() - verificado_en, 1) if verificado_en is not None else None,
+            'archivos_en_manifest': len(_LISTAS_ESTADO['manifest'] or {}),
+            'archivos_omitidos': sorted(_LISTAS_ESTADO['omitidos']),
+            'verificaciones': _LISTAS_ESTADO['verificaciones'],
+            'consultas_manifest': _LISTAS_ESTADO['consultas_manifest'],
+        }
+
+
+# --- COLA DE SINCRONIZACIÓN EN SEGUNDO PLANO ---
+# Los handlers solo encolan; un único hilo worker ejecuta sync_listas_to_db().
+# Disparos repetidos mientras hay un trabajo en cola se fusionan en ese mismo trabajo.
+_SYNC_HISTORIAL_MAX = 20
+_SYNC_COLA = {
+    'pendiente': None,  # a lo sumo un trabajo en cola (los demás disparos se fusionan en él)
+    'actual': None,  # trabajo en ejecución
+    'ultimo': None,  # último trabajo terminado (incluye verificaciones sin cambios)
+    'ultima_sincronizacion': None,  # último trabajo que efectivamente ejecutó la sincronización
+    'historial': {},  # id -> trabajo (últimos _SYNC_HISTORIAL_MAX)
+    'hilo': None,
+}
+_SYNC_COLA_COND = threading.Condition()
+
+
+def _sync_job_copia(job):
+    if not job:
+        return None
+    return dict(job, motivos=list(job['motivos']), archivos=sorted(job['archivos']) if job['archivos'] is not None else None)
+
+
+def _sync_worker_asegurar():
+    hilo = _SYNC_COLA['hilo']
+    if hilo is None or not hilo.is_alive():
+        hilo = threading.Thread(target=_sync_worker, name='sync-listas', daemon=True)
+        _SYNC_COLA['hilo'] = hilo
+        hilo.start()
+
+
+def encolar_sync_listas(motivo: str = 'manual', forzar: bool = True, archivos: list = None) -> dict:
+    """Encola una sincronización de listas y vuelve enseguida (no espera a que corra).
+    Con forzar=False el worker primero verifica si las listas están desactualizadas.
+    Con `archivos` solo se reimportan esos Excel (forzar no aplica); lo usa el watcher de LISTAS_PATH.
+    Si ya hay un trabajo en cola se reutiliza ese (queda forzado si cualquiera de los disparos lo era,
+    y los archivos pedidos se acumulan).
+    Devuelve una copia del trabajo.
+    """
+    parcial = archivos is not None
+    if parcial:
+        forzar = False
+    verificar = not forzar and not parcial
+    with _SYNC_COLA_COND:
+        job = _SYNC_COLA['pendiente']
+        if job is not None:
+            job['forzar'] = job['forzar'] or forzar
+            job['verificar'] = job['verificar'] or verificar
+            if parcial:
+                job['archivos'] = (job['archivos'] or set()) | set(archivos)
+            job['disparos'] += 1
+            if motivo not in job['motivos']:
+                job['motivos'].append(motivo)
+            return _sync_job_copia(job)
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'motivos': [motivo],
+            'forzar': forzar,
+            'verificar': verificar,
+            'archivos': set(archivos) if parcial else None,
+            'disparos': 1,
+            'estado': 'en_cola',
+            'fase': None,
+            'encolado': now_local().strftime('%Y-%m-%d %H:%M:%S'),
+            'inicio': None,
+            'fin': None,
+            'duracion_ms': None,
+            'resumen': None,
+            'error': None,
+        }
+        _SYNC_COLA['pendiente'] = job
+        historial = _SYNC_COLA['historial']
+        historial[job['id']] = job
+        while len(historial) > _SYNC_HISTORIAL_MAX:
+            historial.pop(next(iter(historial)))
+        _sync_worker_asegurar()
+        _SYNC_COLA_COND.notify()
+        log_debug('encolar_sync_listas:', job['id'], motivo, 'forzar' if forzar else ('archivos' if parcial else 'verificar'), archivos or '')
+        return _sync_job_copia(job)
+
+
+def _sync_worker():
+    while True:
+        with _SYNC_COLA_COND:
+            while _SYNC_COLA['pendiente'] is None:
+                _SYNC_COLA_COND.wait()
+            job = _SYNC_COLA['pendiente']
+            _SYNC_COLA['pendiente'] = None
+            _SYNC_COLA['actual'] = job
+            job['estado'] = 'ejecutando'
+            job['inicio'] = now_local().strftime('%Y-%m-%d %H:%M:%S')
+        inicio = time.perf_counter()
+        sincronizo = False
+        try:
+            resumen = {'sin_cambios': True}
+            completo = job['forzar']
+            if not completo and job['archivos']:
+                # Re-import incremental: solo los archivos que siguen distintos de lo cargado
+                job['fase'] = 'verificando'
+                archivos = _archivos_a_reimportar(job['archivos'])
+                if archivos:
+                    job['fase'] = 'sincronizando'
+                    print(f"[INFO] sync-listas: trabajo {job['id']} ({', '.join(job['motivos'])}) reimportando {archivos}", flush=True)
+                    sincronizo = True
+                    resumen = sync_listas_to_db(archivos=archivos)
+            if not completo and job['verificar']:
+                job['fase'] = 'verificando'
+                completo = listas_db_desactualizadas()
+            if completo:
+                job['fase'] = 'sincronizando'
+                print(f"[INFO] sync-listas: trabajo {job['id']} ({', '.join(job['motivos'])}) iniciando", flush=True)
+                sincronizo = True
+                resumen = sync_listas_to_db()
+            job['resumen'] = resumen
+            if isinstance(resumen, dict) and resumen.get('error'):
+                job['error'] = resumen.get('error')
+                job['estado'] = 'error'
+            else:
+                job['estado'] = 'completado'
+        except Exception as exc:
+            job['error'] = f"{type(exc).__name__}: {exc}"
+            job['estado'] = 'error'
+            print(f"[ERROR] sync-listas: trabajo {job['id']} falló: {exc}", flush=True)
+            log_debug('_sync_worker: traceback', traceback.format_exc(limit=3))
+        finally:
+            with _SYNC_COLA_COND:
+                job['fase'] = None
+                job['fin'] = now_local().strftime('%Y-%m-%d %H:%M:%S')
+                job['duracion_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+                _SYNC_COLA['actual'] = None
+                _SYNC_COLA['ultimo'] = job
+                if sincronizo:
+                    _SYNC_COLA['ultima_sincronizacion'] = job
+            if sincronizo:
+                print(f"[INFO] sync-listas: trabajo {job['id']} {job['estado']} en {job['duracion_ms']} ms", flush=True)
+
+
+def sync_listas_estado(job_id: str = None) -> dict:
+    """Estado de la cola de sincronización: trabajo pedido (o el actual / en cola / último),
+    último resultado y progreso por archivo."""
+    with _SYNC_COLA_COND:
+        estado = {
+            'pendiente': _sync_job_copia(_SYNC_COLA['pendiente']),
+            'actual': _sync_job_copia(_SYNC_COLA['actual']),
+            'ultimo': _sync_job_copia(_SYNC_COLA['ultimo']),
+            'ultima_sincronizacion': _sync_job_copia(_SYNC_COLA['ultima_sincronizacion']),
+        }
+        if job_id:
+            estado['job'] = _sync_job_copia(_SYNC_COLA['historial'].get(job_id))
+    estado['progreso'] = sync_listas_progreso()
+    return estado
+
+
+def maybe_auto_sync_listas() -> dict | None:
+    """Pide en segundo plano una verificación (y sincronización si hace falta) de las listas en DB.
+    No bloquea: devuelve el trabajo encolado (o en el que se fusionó el pedido), o None si no aplica.
+    """
+    if not LISTAS_DB:
+        return None
+    # Camino rápido: verificación reciente sin cambios → no hay nada que encolar
+    if listas_db_desactualizadas_en_cache() is False:
+        return None
+    try:
+        return encolar_sync_listas('auto', forzar=False)
+    except Exception as exc:
+        log_debug('maybe_auto_sync_listas: no se pudo encolar', exc)
+    return None
+
+
+# --- WATCHER DE LISTAS_PATH ---
+# Detecta Excel nuevos, modificados, renombrados o borrados en LISTAS_PATH y encola el re-import solo de esos
+# archivos. Usa watchdog (inotify / ReadDirectoryChangesW) si está instalado; si no, compara el estado de la
+# carpeta cada LISTAS_WATCHER_INTERVALO segundos. Un archivo se encola cuando pasó LISTAS_WATCHER_DEBOUNCE
+# segundos sin eventos y su tamaño/mtime no cambió (copias largas o guardados de Excel en varios pasos).
+LISTAS_WATCHER = os.getenv('LISTAS_WATCHER', '0').strip().lower() in ('1', 'true', 'yes', 'y')
+LISTAS_WATCHER_DEBOUNCE = float(os.getenv('LISTAS_WATCHER_DEBOUNCE', '3'))
+LISTAS_WATCHER_INTERVALO = float(os.getenv('LISTAS_WATCHER_INTERVALO', '10'))  # s entre pasadas del modo polling
+
+try:
+    from watchdog.observers import Observer as _WatchdogObserver
+    from watchdog.events import FileSystemEventHandler as _WatchdogHandler
+except ImportError:  # Sin watchdog se usa el modo polling
+    _WatchdogObserver = None
+    _WatchdogHandler = object
+
+_LISTAS_WATCHER = {
+    'modo': None,  # 'watchdog' | 'polling' | None (apagado)
+    'hilo': None,
+    'observer': None,
+    'cambios': {},  # archivo -> (monotonic del último evento, firma (tamaño, mtime_ns) en ese momento)
+    'estado_fs': None,  # modo polling: {archivo: firma} de la última pasada
+    'eventos': 0,
+    'encolados': 0,
+    'ultimo_encolado': None,
+    'error': None,
+}
+_LISTAS_WATCHER_COND = threading.Condition()
+
+
+def _watcher_archivo_relevante(fname: str) -> bool:
+    low = (fname or '').lower()
+    if not low.endswith(('.xlsx', '.xls')):
+        return False
+    # Archivos de bloqueo de Excel/LibreOffice y temporales del wizard
+    if low.startswith(('~$', '.~lock', '.')) or _is_temp_wizard_excel(fname):
+        return False
+    return True
+
+
+def _watcher_firma(fname: str):
+    try:
+        st = os.stat(os.path.join(LISTAS_PATH, fname))
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _watcher_estado_carpeta() -> dict:
+    estado = {}
+    try:
+        with os.scandir(LISTAS_PATH) as entradas:
+            for entrada in entradas:
+                if not _watcher_archivo_relevante(entrada.name):
+                    continue
+                try:
+                    if entrada.is_file():
+                        st = entrada.stat()
+                        estado[entrada.name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    pass
+    except Exception as exc:
+        log_debug('_watcher_estado_carpeta: no se pudo listar', LISTAS_PATH, exc)
+        return None
+    return estado
+
+
+def listas_watcher_marcar(fname: str):
+    """Registra un cambio en LISTAS_PATH/fname; se encola tras el debounce."""
+    if not _watcher_archivo_relevante(fname):
+        return
+    firma = _watcher_firma(fname)
+    with _LISTAS_WATCHER_COND:
+        _LISTAS_WATCHER['cambios'][fname] = (time.monotonic(), firma)
+        _LISTAS_WATCHER['eventos'] += 1
+        _LISTAS_WATCHER_COND.notify()
+
+
+class _ListasWatcherHandler(_WatchdogHandler):
+    def on_any_event(self, event):
+        if getattr(event, 'is_directory', False):
+            return
+        for ruta in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if ruta and os.path.dirname(os.path.abspath(ruta)) == os.path.abspath(LISTAS_PATH):
+                listas_watcher_marcar(os.path.basename(ruta))
+
+
+def _watcher_listos(ahora: float) -> tuple:
+    """(archivos que cumplieron el debounce y están estables, segundos hasta el próximo vencimiento)."""
+    listos = []
+    espera = None
+    for fname, (marcado, firma) in list(_LISTAS_WATCHER['cambios'].items()):
+        restante = LISTAS_WATCHER_DEBOUNCE - (ahora - marcado)
+        if restante <= 0:
+            firma_actual = _watcher_firma(fname)
+            if firma_actual != firma:
+                # Se sigue escribiendo: reiniciar el debounce con la firma nueva
+                _LISTAS_WATCHER['cambios'][fname] = (ahora, firma_actual)
+                restante = LISTAS_WATCHER_DEBOUNCE
+            else:
+                del _LISTAS_WATCHER['cambios'][fname]
+                listos.append(fname)
+                continue
+        espera = restante if espera is None else min(espera, restante)
+    return listos, espera
+
+
+def _listas_watcher_loop():
+    while True:
+        try:
+            if _LISTAS_WATCHER['modo'] == 'polling':
+                estado = _watcher_estado_carpeta()
+                if estado is not None:
+                    anterior = _LISTAS_WATCHER['estado_fs']
+                    if anterior is not None:
+                        for fname in set(anterior) | set(estado):
+                            if anterior.get(fname) != estado.get(fname):
+                                listas_watcher_marcar(fname)
+                    _LISTAS_WATCHER['estado_fs'] = estado
+            with _LISTAS_WATCHER_COND:
+                listos, espera = _watcher_listos(time.monotonic())
+                if not listos:
+                    if _LISTAS_WATCHER['modo'] == 'polling':
+                        espera = LISTAS_WATCHER_INTERVALO if espera is None else min(espera, LISTAS_WATCHER_INTERVALO)
+                    _LISTAS_WATCHER_COND.wait(espera)
+                    continue
+            job = encolar_sync_listas('watcher', archivos=listos)
+            with _LISTAS_WATCHER_COND:
+                _LISTAS_WATCHER['encolados'] += 1
+                _LISTAS_WATCHER['ultimo_encolado'] = {'archivos': listos, 'job': job['id'], 'hora': now_local().strftime('%Y-%m-%d %H:%M:%S')}
+            print(f"[INFO] listas-watcher: cambios en {listos} → trabajo {job['id']}", flush=True)
+        except Exception as exc:
+            _LISTAS_WATCHER['error'] = f"{type(exc).__name__}: {exc}"
+            print(f"[WARN] listas-watcher: {exc}", flush=True)
+            time.sleep(max(LISTAS_WATCHER_INTERVALO, 1))
+
+
+def listas_watcher_iniciar():
+    """Arranca el watcher de LISTAS_PATH (una sola vez por proceso). Devuelve el modo usado o None."""
+    with _LISTAS_WATCHER_COND:
+        if _LISTAS_WATCHER['hilo'] is not None:
+            return _LISTAS_WATCHER['modo']
+        modo = 'polling'
+        if _WatchdogObserver is not None:
+            try:
+                observer = _WatchdogObserver()
+                observer.schedule(_ListasWatcherHandler(), LISTAS_PATH, recursive=False)
+                observer.daemon = True
+                observer.start()
+                _LISTAS_WATCHER['observer'] = observer
+                modo = 'watchdog'
+            except Exception as exc:
+                print(f"[WARN] listas-watcher: watchdog no disponible ({exc}), se usa polling", flush=True)
+        if modo == 'polling':
+            _LISTAS_WATCHER['estado_fs'] = _watcher_estado_carpeta()
+        _LISTAS_WATCHER['modo'] = modo
+        hilo = threading.Thread(target=_listas_watcher_loop, name='listas-watcher', daemon=True)
+        _LISTAS_WATCHER['hilo'] = hilo
+        hilo.start()
+    print(f"[INFO] listas-watcher: observando {LISTAS_PATH} ({modo})", flush=True)
+    return modo
+
+
+def listas_watcher_stats():
+    with _LISTAS_WATCHER_COND:
+        return {
+            'modo': _LISTAS_WATCHER['modo'],
+            'pendientes': sorted(_LISTAS_WATCHER['cambios']),
+            'eventos': _LISTAS_WATCHER['eventos'],
+            'encolados': _LISTAS_WATCHER['encolados'],
+            'ultimo_encolado': _LISTAS_WATCHER['ultimo_encolado'],
+            'error': _LISTAS_WATCHER['error'],
+        }
+
+
+# Solo en el proceso principal: los workers del pool de parseo (spawn en Windows) también importan este módulo
+if LISTAS_WATCHER and LISTAS_DB and _PROCESO_PRINCIPAL:
+    try:
+        listas_watcher_iniciar()
+    except Exception as exc:
+        print(f"[WARN] listas-watcher: no se pudo iniciar: {exc}", flush=True)
+
+
+# --- SNAPSHOTS COLUMNARES DE LISTAS ---
+# Cada Excel importado se guarda también como un archivo binario por columnas
+# (LISTAS_SNAPSHOTS_DIR/<archivo>.<versión>.lsnap, la versión es el mtime del Excel en ms)
+# que se abre con mmap: textos como tabla de strings (offsets int64 + bytes UTF-8), precio como float64 e
+# índices ordenados por código / dígitos para búsqueda binaria. Sin PostgreSQL, las búsquedas por código
+# usan estos snapshots en lugar de volver a leer los XLSX (se regeneran solos cuando cambia el Excel).
+LISTAS_SNAPSHOTS = os.getenv('LISTAS_SNAPSHOTS', '0').strip().lower() in ('1', 'true', 'yes', 'y')
+LISTAS_SNAPSHOTS_DIR = os.getenv('LISTAS_SNAPSHOTS_DIR', '').strip() or os.path.join(LISTAS_PATH, '_snapshots')
+LISTAS_SNAPSHOTS_TTL = float(os.getenv('LISTAS_SNAPSHOTS_TTL', '10'))  # s entre verificaciones de Excel cambiados
+
+_SNAPSHOT_MAGIC = b'LSNAP001'
+_SNAPSHOT_COLS_TEXTO = tuple(c for c in _PRODUCTOS_COLS_CARGA if c not in ('archivo', 'mtime', 'precio', 'batch_id'))
+
+_SNAPSHOTS = {
+    'segmentos': {},  # archivo -> segmento (misma forma que los del catálogo, columnas sobre mmap)
+    'listo': False,
+    'verificado_en': None,
+    'actualizando': False,
+    'escritos': 0,
+    'error': None,
+}
+_SNAPSHOTS_LOCK = threading.Lock()
+
+
+def _snapshot_ruta(archivo: str, mtime: float) -> str:
+    """Cada versión del Excel va en su propio archivo: uno nuevo nunca pisa al que un segmento tiene abierto con
+    mmap (en Windows un archivo mapeado no se puede reemplazar ni borrar)."""
+    return os.path.join(LISTAS_SNAPSHOTS_DIR, f'{archivo}.{int(round(float(mtime) * 1000))}.lsnap')
+
+
+def _snapshots_en_directorio() -> dict:
+    """archivo -> [(versión, ruta)] de los snapshots del directorio, de la versión más nueva a la más vieja.
+    Los de antes de versionar (<archivo>.lsnap) quedan con versión -1."""
+    por_archivo = {}
+    try:
+        nombres = os.listdir(LISTAS_SNAPSHOTS_DIR)
+    except FileNotFoundError:
+        return por_archivo
+    for nombre in nombres:
+        if not nombre.endswith('.lsnap'):
+            continue
+        base = nombre[:-len('.lsnap')]
+        archivo, _, version = base.rpartition('.')
+        if not (archivo and version.isdigit()):
+            archivo, version = base, '-1'
+        por_archivo.setdefault(archivo, []).append((int(version), os.path.join(LISTAS_SNAPSHOTS_DIR, nombre)))
+    for versiones in por_archivo.values():
+        versiones.sort(reverse=True)
+    return por_archivo
+
+
+def _precio_como_numeric(precio):
+    """El precio como lo devuelve productos_listas.precio (NUMERIC(14,4)): float8 -> 15 dígitos -> 4 decimales."""
+    if precio is None:
+        return np.nan
+    return float(Decimal('%.15g' % precio).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP))
+
+
+def snapshot_escribir(archivo: str, mtime: float, filas: list) -> bool:
+    """Guarda las filas de un archivo (orden de _PRODUCTOS_COLS_CARGA) como snapshot columnar.
+    Escritura atómica (archivo temporal + os.replace) a la ruta de esta versión: los lectores con el mmap de la
+    anterior no se ven afectados.
+    """
+    idx = _PRODUCTOS_IDX
+    n = len(filas)
+    secciones = []  # (nombre, bytes)
+    textos = {}
+    for c in _SNAPSHOT_COLS_TEXTO:
+        i = idx[c]
+        valores = []
+        for fila in filas:
+            v = fila[i]
+            if v is None:
+                v = ''
+            elif c == 'tokens':
+                v = ' '.join(v)
+            elif not isinstance(v, str):
+                v = str(v)
+            valores.append(v)
+        textos[c] = valores
+        codificados = [v.encode('utf-8') for v in valores]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        if n:
+            np.cumsum([len(b) for b in codificados], out=offsets[1:])
+        secciones.append((c + '.off', offsets.tobytes()))
+        secciones.append((c + '.txt', b''.join(codificados)))
+    i_precio = idx['precio']
+    precios = np.array([_precio_como_numeric(fila[i_precio]) for fila in filas], dtype=np.float64)
+    secciones.append(('precio', precios.tobytes()))
+    # Índices: filas ordenadas por clave (las claves vacías no se indexan, igual que en el catálogo)
+    for nombre, col, clave in (('idx_codigo', 'codigo', None), ('idx_digitos', 'codigo_digitos', None),
+                               ('idx_digitos_nl', 'codigo_digitos', lambda v: v.lstrip('0'))):
+        claves = textos[col] if clave is None else [clave(v) for v in textos[col]]
+        orden = sorted((j for j in range(n) if claves[j] or nombre == 'idx_codigo'), key=claves.__getitem__)
+        secciones.append((nombre, np.array(orden, dtype=np.int32).tobytes()))
+
+    cabecera = {'archivo': archivo, 'mtime': mtime, 'filas': n, 'creado': time.time(), 'secciones': {}}
+    # Offsets de sección alineados a 8 bytes; la cabecera se rellena para que su largo no cambie los offsets
+    largo_cabecera = 4096
+    while True:
+        pos = 16 + largo_cabecera
+        for nombre, datos in secciones:
+            cabecera['secciones'][nombre] = [pos, len(datos)]
+            pos += (len(datos) + 7) // 8 * 8
+        cabecera_bytes = json.dumps(cabecera, ensure_ascii=False).encode('utf-8')
+        if len(cabecera_bytes) <= largo_cabecera:
+            break
+        largo_cabecera *= 2
+    try:
+        os.makedirs(LISTAS_SNAPSHOTS_DIR, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=LISTAS_SNAPSHOTS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(_SNAPSHOT_MAGIC)
+            fh.write(largo_cabecera.to_bytes(8, 'little'))
+            fh.write(cabecera_bytes.ljust(largo_cabecera, b' '))
+            for _, datos in secciones:
+                fh.write(datos)
+                fh.write(b'\0' * ((-len(datos)) % 8))
+        os.replace(temporal, _snapshot_ruta(archivo, mtime))
+        _SNAPSHOTS['escritos'] += 1
+        return True
+    except Exception as exc:
+        print(f'[WARN] snapshot_escribir: {archivo}: {exc}', flush=True)
+        return False
+
+
+def snapshot_borrar(archivo: str, conservar: str = None):
+    """Borra los snapshots de `archivo` salvo la ruta `conservar`. Los que siguen mapeados (Windows) quedan para
+    la próxima pasada de snapshots_actualizar."""
+    for _, ruta in _snapshots_en_directorio().get(archivo, []):
+        if ruta == conservar:
+            continue
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            log_debug('snapshot_borrar: no se pudo borrar', ruta, exc)
+
+
+class _ColumnaSnapshot:
+    """Columna de texto sobre el mmap: la fila i se decodifica recién al pedirla."""
+    __slots__ = ('_mm', '_base', '_off', '_conv')
+
+    def __init__(self, mm, base, offsets, conv=None):
+        self._mm = mm
+        self._base = base
+        self._off = offsets
+        self._conv = conv
+
+    def __len__(self):
+        return len(self._off) - 1
+
+    def __getitem__(self, i):
+        v = self._mm[self._base + int(self._off[i]):self._base + int(self._off[i + 1])].decode('utf-8')
+        return self._conv(v) if self._conv else v
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class _IndiceSnapshot:
+    """clave -> filas por búsqueda binaria sobre una permutación ordenada (interfaz .get() de un dict)."""
+    __slots__ = ('_orden', '_clave')
+
+    def __init__(self, orden, clave):
+        self._orden = orden
+        self._clave = clave
+
+    def get(self, clave, defecto=()):
+        orden = self._orden
+        pos = bisect_left(orden, clave, key=lambda j: self._clave(int(j)))
+        filas = []
+        while pos < len(orden) and self._clave(int(orden[pos])) == clave:
+            filas.append(int(orden[pos]))
+            pos += 1
+        return filas or defecto
+
+
+def _snapshot_medidas(texto):
+    return tuple((float(v), u) for v, u in json.loads(texto)) if texto and texto != '[]' else ()
+
+
+def _snapshot_abrir(ruta: str):
+    """Abre un snapshot como segmento del catálogo (columnas y índices sobre mmap). None si es inválido."""
+    with open(ruta, 'rb') as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:8] != _SNAPSHOT_MAGIC:
+        mm.close()
+        return None
+    largo_cabecera = int.from_bytes(mm[8:16], 'little')
+    cabecera = json.loads(mm[16:16 + largo_cabecera].decode('utf-8'))
+    secciones = cabecera['secciones']
+    n = cabecera['filas']
+
+    def arreglo(nombre, dtype):
+        pos, largo = secciones[nombre]
+        return np.frombuffer(mm, dtype=dtype, count=largo // np.dtype(dtype).itemsize, offset=pos)
+
+    cols = {}
+    for c in _SNAPSHOT_COLS_TEXTO:
+        cols[c] = _ColumnaSnapshot(mm, secciones[c + '.txt'][0], arreglo(c + '.off', np.int64),
+                                   _snapshot_medidas if c == 'medidas' else None)
+    cols['precio'] = arreglo('precio', np.float64)
+    cols['mtime'] = np.full(n, float(cabecera['mtime']))
+    cols['id'] = range(n)
+    digitos = cols['codigo_digitos']
+    return {
+        'archivo': cabecera['archivo'],
+        'batch_id': None,
+        'mtime_fuente': cabecera['mtime'],
+        'n': n,
+        'cols': cols,
+        'por_codigo': _IndiceSnapshot(arreglo('idx_codigo', np.int32), cols['codigo'].__getitem__),
+        'por_digitos': _IndiceSnapshot(arreglo('idx_digitos', np.int32), digitos.__getitem__),
+        'por_digitos_nl': _IndiceSnapshot(arreglo('idx_digitos_nl', np.int32), lambda i: digitos[i].lstrip('0')),
+        'postings': {},
+        'trigramas_digitos': None,  # se arma en la primera búsqueda por patrón
+        'por_clave_barras': None,  # ídem, en la primera búsqueda por código de barras
+        'bytes': len(mm),
+        '_mmap': mm,
+        '_ruta': ruta,
+    }
+
+
+def _snapshot_cerrar(seg: dict):
+    """Libera un segmento que no llegó a publicarse: sin las columnas que apuntan al mmap, se puede cerrar."""
+    mm = seg.get('_mmap')
+    seg.clear()
+    try:
+        mm.close()
+    except Exception as exc:
+        log_debug('_snapshot_cerrar: mmap todavía en uso, lo cierra el GC', exc)
+
+
+def snapshots_actualizar() -> dict:
+    """Pone al día los snapshots con los Excel de LISTAS_PATH y recarga los segmentos.
+    Sin PostgreSQL parsea (con el mismo importador que el sync) los Excel nuevos o modificados;
+    con PostgreSQL los escribe el sync y acá solo se cargan. Devuelve un resumen.
+    """
+    resumen = {'generados': [], 'eliminados': [], 'errores': []}
+    fs = _excel_files_state()
+    generar = not LISTAS_DB
+    prov_cfg = _listas_provider_configs() if generar else {}
+    actuales = dict(_SNAPSHOTS['segmentos'])
+    en_directorio = _snapshots_en_directorio()
+    nuevos = {}
+    for archivo, mtime in fs.items():
+        seg = actuales.get(archivo)
+        if seg is None and en_directorio.get(archivo):
+            ruta = en_directorio[archivo][0][1]
+            try:
+                seg = _snapshot_abrir(ruta)
+            except Exception as exc:
+                log_debug('snapshots_actualizar: snapshot ilegible', ruta, exc)
+                seg = None
+            if seg is not None and abs(float(seg['mtime_fuente']) - float(mtime)) > 1.0:
+                _snapshot_cerrar(seg)
+                seg = None
+        if seg is not None and abs(float(seg['mtime_fuente']) - float(mtime)) <= 1.0:
+            nuevos[archivo] = seg
+            continue
+        if not generar:
+            continue
+        try:
+            provider_key, cfg = _resolver_proveedor_archivo(archivo, prov_cfg)
+        except Exception:
+            cfg = None
+        if not cfg:
+            continue
+        trabajo = {'archivo': archivo, 'ruta': os.path.join(LISTAS_PATH, archivo), 'provider_key': provider_key,
+                   'proveedor_display': get_proveedor_display_name(provider_key), 'cfg': cfg, 'mtime': mtime}
+        parseado = _parsear_archivo_listas(trabajo['ruta'], provider_key, cfg)
+        if parseado.get('error'):
+            resumen['errores'].append({'archivo': archivo, 'error': parseado['error']})
+            continue
+        if snapshot_escribir(archivo, mtime, _filas_carga_archivo(trabajo, parseado['hojas'])):
+            ruta = _snapshot_ruta(archivo, mtime)
+            try:
+                seg = _snapshot_abrir(ruta)
+            except Exception as exc:
+                seg = None
+                log_debug('snapshots_actualizar: no se pudo abrir el snapshot recién escrito', ruta, exc)
+            if seg is None:
+                resumen['errores'].append({'archivo': archivo, 'error': 'snapshot ilegible después de escribirlo'})
+                continue
+            nuevos[archivo] = seg
+            resumen['generados'].append(archivo)
+            barcode_aprendido_olvidar(todos=True)
+    _SNAPSHOTS['segmentos'] = nuevos
+    if generar:
+        # Ya publicados los segmentos nuevos: versiones viejas y snapshots de Excel que ya no están (borrados o
+        # pasados a OLD). Lo que siga mapeado por una búsqueda en curso (Windows) se borra en otra pasada.
+        en_uso = {seg.get('_ruta') for seg in nuevos.values()}
+        for archivo, versiones in _snapshots_en_directorio().items():
+            for _, ruta in versiones:
+                if ruta in en_uso:
+                    continue
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+                except Exception as exc:
+                    log_debug('snapshots_actualizar: no se pudo borrar (se reintenta)', ruta, exc)
+                    continue
+                if archivo not in fs and archivo not in resumen['eliminados']:
+                    resumen['eliminados'].append(archivo)
+    _SNAPSHOTS['listo'] = True
+    _SNAPSHOTS['error'] = None
+    if resumen['generados'] or resumen['eliminados']:
+        print(f"[INFO] snapshots: {len(resumen['generados'])} generados, {len(resumen['eliminados'])} eliminados", flush=True)
+    return resumen
+
+
+def _snapshots_actualizar_en_segundo_plano():
+    with _SNAPSHOTS_LOCK:
+        if _SNAPSHOTS['actualizando']:
+            return
+        _SNAPSHOTS['actualizando'] = True
+        _SNAPSHOTS['verificado_en'] = time.monotonic()
+
+    def _correr():
+        try:
+            snapshots_actualizar()
+        except Exception as exc:
+            _SNAPSHOTS['error'] = str(exc)
+            print(f'[WARN] snapshots_actualizar: {exc}', flush=True)
+        finally:
+            _SNAPSHOTS['actualizando'] = False
+
+    threading.Thread(target=_correr, name='snapshots-listas', daemon=True).start()
+
+
+def snapshots_segmentos():
+    """Segmentos de los snapshots para buscar sin PostgreSQL, o None si no están activos o todavía no cargaron."""
+    if not LISTAS_SNAPSHOTS or LISTAS_DB:
+        return None
+    verificado_en = _SNAPSHOTS['verificado_en']
+    if verificado_en is None or time.monotonic() - verificado_en > LISTAS_SNAPSHOTS_TTL:
+        _snapshots_actualizar_en_segundo_plano()
+    return _SNAPSHOTS['segmentos'] if _SNAPSHOTS['listo'] else None
+
+
+def snapshots_stats():
+    if not LISTAS_SNAPSHOTS:
+        return {'activo': False}
+    segmentos = _SNAPSHOTS['segmentos']
+    return {
+        'activo': True,
+        'listo': _SNAPSHOTS['listo'],
+        'directorio': LISTAS_SNAPSHOTS_DIR,
+        'archivos': len(segmentos),
+        'filas': sum(seg['n'] for seg in segmentos.values()),
+        'mb': round(sum(seg['bytes'] for seg in segmentos.values()) / (1024 * 1024), 2),
+        'escritos': _SNAPSHOTS['escritos'],
+        'error': _SNAPSHOTS['error'],
+    }
+
+
+if LISTAS_SNAPSHOTS and not LISTAS_DB and _PROCESO_PRINCIPAL:
+    _snapshots_actualizar_en_segundo_plano()
+
+
+# --- CATÁLOGO RESIDENTE EN MEMORIA ---
+# Copia compacta (por columnas) de productos_listas para responder búsquedas sin ir a la DB.
+# Se organiza en un segmento por archivo, versionado por el id de import_batches que lo cargó,
+# así después de cada sync solo se recargan los archivos que cambiaron.
+# Cada segmento tiene un índice invertido token -> filas (nombre_normalizado + codigo_normalizado);
+# un vocabulario global ordenado permite resolver prefijos y subcadenas de los tokens de búsqueda.
+CATALOGO_EN_MEMORIA = os.getenv('CATALOGO_EN_MEMORIA', '0').strip().lower() in ('1', 'true', 'yes', 'y')
+CATALOGO_REFRESH_TTL = float(os.getenv('CATALOGO_REFRESH_TTL', '30'))  # s entre verificaciones de lotes nuevos (otros procesos)
+
+_CATALOGO_COLS_TEXTO = (
+    'proveedor_key', 'proveedor_nombre', 'hoja', 'codigo', 'codigo_digitos', 'codigo_normalizado',
+    'nombre', 'nombre_normalizado', 'nombre_pulgadas', 'iva', 'precios', 'extra_datos'
+)
+# Columnas con pocos valores distintos: se internan para no duplicar strings
+_CATALOGO_COLS_REPETIDAS = ('proveedor_key', 'proveedor_nombre', 'hoja', 'iva')
+
+_CATALOGO = {
+    'segmentos': {},  # archivo -> segmento
+    'vocab': None,  # vocabulario global, construido para un dict de segmentos concreto
+    'listo': False,
+    'ultima_verificacion': 0.0,
+    'refrescos': 0,
+    'ultimo_refresh': None,
+    'error': None,
+}
+_CATALOGO_LOCK = threading.Lock()
+
+
+def _catalogo_construir_segmento(archivo, batch_id, filas):
+    """Arma un segmento columnar a partir de filas (dicts) de productos_listas."""
+    cols = {c: [] for c in _CATALOGO_COLS_TEXTO}
+    precios_num = array('d')
+    mtimes = array('d')
+    ids = array('q')
+    medidas_col = []
+    por_codigo = {}
+    por_digitos = {}
+    por_digitos_nl = {}
+    por_clave_barras = {}
+    postings = {}
+    for i, r in enumerate(filas):
+        for c in _CATALOGO_COLS_TEXTO:
+            v = r.get(c)
+            if v is None:
+                v = ''
+            elif not isinstance(v, str):
+                v = json.dumps(v, ensure_ascii=False) if c in ('precios', 'extra_datos') else str(v)
+            if c in _CATALOGO_COLS_REPETIDAS:
+                v = sys.intern(v)
+            cols[c].append(v)
+        # nombre_pulgadas solo se guarda si difiere del nombre; medidas como tuplas (vacía compartida)
+        if r.get('nombre_pulgadas') is None:
+            cols['nombre_pulgadas'][i] = formatear_pulgadas(cols['nombre'][i])
+        if cols['nombre_pulgadas'][i] == cols['nombre'][i]:
+            cols['nombre_pulgadas'][i] = ''
+        medidas = r.get('medidas')
+        if isinstance(medidas, str):
+            medidas = json.loads(medidas)
+        if medidas is None:
+            _, _, medidas, _ = atributos_busqueda_producto(r.get('nombre') or '', r.get('codigo') or '')
+        medidas_col.append(tuple((float(v), u) for v, u in medidas) if medidas else ())
+        precio = r.get('precio')
+        precios_num.append(float(precio) if precio is not None else math.nan)
+        mtimes.append(float(r.get('mtime') or 0.0))
+        ids.append(int(r.get('id') or 0))
+        codigo = cols['codigo'][i]
+        digitos = cols['codigo_digitos'][i]
+        por_codigo.setdefault(codigo, []).append(i)
+        if digitos:
+            por_digitos.setdefault(digitos, []).append(i)
+            nl = digitos.lstrip('0')
+            if nl:
+                por_digitos_nl.setdefault(nl, []).append(i)
+        clave = clave_codigo_barras(codigo, digitos)
+        if clave:
+            por_clave_barras.setdefault(clave, []).append(i)
+        for token in set(cols['nombre_normalizado'][i].split()) | set(cols['codigo_normalizado'][i].split()):
+            lista = postings.get(token)
+            if lista is None:
+                lista = postings[token] = array('I')
+            lista.append(i)
+    cols['precio'] = precios_num
+    cols['mtime'] = mtimes
+    cols['id'] = ids
+    cols['medidas'] = medidas_col
+    seg = {
+        'archivo': archivo,
+        'batch_id': batch_id,
+        'n': len(ids),
+        'cols': cols,
+        'por_codigo': por_codigo,
+        'por_digitos': por_digitos,
+        'por_digitos_nl': por_digitos_nl,
+        'por_clave_barras': por_clave_barras,
+        'postings': postings,
+        'trigramas_digitos': _catalogo_indice_trigramas(cols['codigo_digitos']),
+    }
+    seg['bytes'] = _catalogo_medir_segmento(seg)
+    return seg
+
+
+def _catalogo_indice_trigramas(digitos_col):
+    """Índice n-grama de codigo_digitos: cada subcadena de 3 dígitos -> filas que la contienen (una vez por fila)."""
+    indice = {}
+    for i, digitos in enumerate(digitos_col):
+        if len(digitos) < 3:
+            continue
+        for trigrama in {digitos[j:j + 3] for j in range(len(digitos) - 2)}:
+            lista = indice.get(trigrama)
+            if lista is None:
+                lista = indice[trigrama] = array('I')
+            lista.append(i)
+    return indice
+
+
+def _catalogo_indice_barras(seg):
+    """clave de barras -> filas del segmento (los snapshots lo arman en la primera consulta)."""
+    indice = seg.get('por_clave_barras')
+    if indice is None:
+        indice = {}
+        cols = seg['cols']
+        for i, (codigo, digitos) in enumerate(zip(cols['codigo'], cols['codigo_digitos'])):
+            clave = clave_codigo_barras(codigo, digitos)
+            if clave:
+                indice.setdefault(clave, []).append(i)
+        seg['por_clave_barras'] = indice
+    return indice
+
+
+def _catalogo_filas_patron(seg, patron):
+    """Filas del segmento cuyo codigo_digitos contiene el patrón.
+    Con 3 o más dígitos se verifican solo las filas del trigrama menos frecuente del patrón;
+    patrones más cortos recorren la columna.
+    """
+    digitos_col = seg['cols']['codigo_digitos']
+    if len(patron) < 3:
+        return [i for i, digitos in enumerate(digitos_col) if patron in digitos]
+    indice = seg.get('trigramas_digitos')
+    if indice is None:
+        indice = seg['trigramas_digitos'] = _catalogo_indice_trigramas(digitos_col)
+    candidatos = min((indice.get(patron[j:j + 3], ()) for j in range(len(patron) - 2)), key=len)
+    if len(patron) == 3:
+        return list(candidatos)
+    return [i for i in candidatos if patron in digitos_col[i]]
+
+
+def _catalogo_medir_segmento(seg):
+    """Estimación de memoria del segmento (strings compartidos se cuentan una vez)."""
+    vistos = set()
+    total = 0
+    for valor in seg['cols'].values():
+        total += sys.getsizeof(valor)
+        if isinstance(valor, list):
+            for s in valor:
+                if id(s) not in vistos:
+                    vistos.add(id(s))
+                    total += sys.getsizeof(s)
+    for nombre in ('por_codigo', 'por_digitos', 'por_digitos_nl', 'por_clave_barras', 'postings', 'trigramas_digitos'):
+        indice = seg.get(nombre) or {}
+        total += sys.getsizeof(indice)
+        for clave, lista in indice.items():
+            total += sys.getsizeof(lista)
+            if nombre == 'postings' and id(clave) not in vistos:
+                vistos.add(id(clave))
+                total += sys.getsizeof(clave)
+    return total
+
+
+def _catalogo_construir_vocab(segmentos):
+    """Vocabulario global ordenado de todos los tokens, en un solo string separado por saltos de línea
+    para buscar subcadenas a velocidad de C y mapear cada coincidencia a su token por offset.
+    """
+    tokens = set()
+    for seg in segmentos.values():
+        tokens.update(seg['postings'].keys())
+    tokens = sorted(tokens)
+    offsets = array('q')
+    pos = 0
+    for t in tokens:
+        offsets.append(pos)
+        pos += len(t) + 1
+    return {
+        'segmentos': segmentos,
+        'tokens': tokens,
+        'texto': '\n'.join(tokens),
+        'offsets': offsets,
+        'expansiones': {},
+    }
+
+
+def _catalogo_expandir_variante(vocab, variante):
+    """Tokens del vocabulario que contienen la variante (mismo criterio que LIKE '%v%')."""
+    cache = vocab['expansiones']
+    encontrados = cache.get(variante)
+    if encontrados is not None:
+        return encontrados
+    tokens = vocab['tokens']
+    offsets = vocab['offsets']
+    texto = vocab['texto']
+    encontrados = []
+    ultimo = -1
+    inicio = texto.find(variante)
+    while inicio != -1:
+        idx = bisect_right(offsets, inicio) - 1
+        if idx != ultimo:
+            encontrados.append(tokens[idx])
+            ultimo = idx
+        # saltar al token siguiente: las demás apariciones en el mismo token no aportan
+        siguiente = offsets[idx + 1] if idx + 1 < len(offsets) else len(texto)
+        inicio = texto.find(variante, max(inicio + 1, siguiente))
+    if len(cache) > 5000:
+        cache.clear()
+    cache[variante] = encontrados
+    return encontrados
+
+
+def _catalogo_fila(seg, i):
+    """Materializa la fila i del segmento con las mismas claves que los SELECT de productos_listas."""
+    cols = seg['cols']
+    precio = cols['precio'][i]
+    fila = {c: cols[c][i] for c in _CATALOGO_COLS_TEXTO}
+    fila['archivo'] = seg['archivo']
+    fila['precio'] = None if precio != precio else precio
+    fila['mtime'] = cols['mtime'][i]
+    fila['id'] = cols['id'][i]
+    fila['medidas'] = cols['medidas'][i]
+    if not fila['nombre_pulgadas']:
+        fila['nombre_pulgadas'] = fila['nombre']
+    if not fila['iva']:
+        fila['iva'] = None
+    return fila
+
+
+def _catalogo_manifest_pg(cur):
+    """{archivo: id del último lote completado} según import_batches (tabla chica)."""
+    cur.execute(
+        "SELECT archivo, MAX(id) AS batch_id FROM import_batches WHERE status='completed' GROUP BY archivo"
+    )
+    manifest = {}
+    for row in cur.fetchall() or []:
+        archivo = row['archivo'] if isinstance(row, dict) else row[0]
+        batch_id = row['batch_id'] if isinstance(row, dict) else row[1]
+        if archivo:
+            manifest[archivo] = batch_id
+    return manifest
+
+
+def catalogo_refrescar(completo: bool = False):
+    """Sincroniza el catálogo residente con productos_listas.
+    Incremental: solo recarga archivos cuyo último lote completado cambió y descarta los que ya no están.
+    """
+    if not (CATALOGO_EN_MEMORIA and LISTAS_EN_DB and DATABASE_URL and psycopg):
+        return None
+    with _CATALOGO_LOCK:
+        inicio = time.perf_counter()
+        actuales = _CATALOGO['segmentos']
+        if not _CATALOGO['listo']:
+            completo = True
+        try:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                manifest = _catalogo_manifest_pg(cur)
+                if completo:
+                    # Incluye archivos sin lote registrado (cargas antiguas)
+                    cur.execute("SELECT DISTINCT archivo FROM productos_listas")
+                    versiones = {(r['archivo'] if isinstance(r, dict) else r[0]): None for r in cur.fetchall() or []}
+                    versiones.update(manifest)
+                    a_cargar = [a for a in versiones if a]
+                    nuevos = {}
+                else:
+                    versiones = manifest
+                    a_cargar = [a for a, b in manifest.items() if a not in actuales or actuales[a]['batch_id'] != b]
+                    nuevos = {
+                        a: seg for a, seg in actuales.items()
+                        if a in manifest or seg['batch_id'] is None
+                    }
+                eliminados = len([a for a in actuales if a not in nuevos and a not in a_cargar])
+
+                filas_por_archivo = {a: [] for a in a_cargar}
+                if a_cargar:
+                    cur.execute(
+                        """
+                        SELECT id, proveedor_key, proveedor_nombre, archivo, hoja, codigo, codigo_digitos,
+                               codigo_normalizado, nombre, nombre_normalizado, nombre_pulgadas, precio, iva,
+                               precios::text AS precios, extra_datos::text AS extra_datos,
+                               medidas::text AS medidas, mtime
+                        FROM productos_listas
+                        WHERE archivo = ANY(%s)
+                        ORDER BY archivo, id
+                        """,
+                        (a_cargar,)
+                    )
+                    for r in cur:
+                        filas_por_archivo[r['archivo']].append(r)
+            for archivo, filas in filas_por_archivo.items():
+                if filas:
+                    nuevos[archivo] = _catalogo_construir_segmento(archivo, versiones.get(archivo), filas)
+                else:
+                    nuevos.pop(archivo, None)
+            _CATALOGO['vocab'] = _catalogo_construir_vocab(nuevos)
+            _CATALOGO['segmentos'] = nuevos
+            _CATALOGO['listo'] = True
+            if a_cargar or eliminados:
+                busqueda_cache_invalidar()
+            _CATALOGO['error'] = None
+            _CATALOGO['refrescos'] += 1
+            _CATALOGO['ultimo_refresh'] = {
+                'en': now_local().strftime('%Y-%m-%d %H:%M:%S'),
+                'ms': round((time.perf_counter() - inicio) * 1000, 1),
+                'completo': completo,
+                'archivos_recargados': len(a_cargar),
+                'archivos_eliminados': eliminados,
+            }
+            log_debug('catalogo_refrescar:', _CATALOGO['ultimo_refresh'])
+            return _CATALOGO['ultimo_refresh']
+        except Exception as exc:
+            _CATALOGO['error'] = str(exc)
+            print(f'[WARN] catalogo_refrescar: {exc}', flush=True)
+            return None
+        finally:
+            _CATALOGO['ultima_verificacion'] = time.monotonic()
+
+
+def catalogo_refrescar_en_segundo_plano(completo: bool = False):
+    if not CATALOGO_EN_MEMORIA or _CATALOGO_LOCK.locked():
+        return
+    _CATALOGO['ultima_verificacion'] = time.monotonic()
+    threading.Thread(target=catalogo_refrescar, kwargs={'completo': completo}, daemon=True).start()
+
+
+def _catalogo_segmentos():
+    """Segmentos del catálogo si está cargado, o None para que el llamador use la DB.
+    Sin PostgreSQL, los snapshots columnares de las listas (si están activos) hacen de catálogo.
+    """
+    if not CATALOGO_EN_MEMORIA or not _CATALOGO['listo']:
+        return snapshots_segmentos()
+    if CATALOGO_REFRESH_TTL > 0 and time.monotonic() - _CATALOGO['ultima_verificacion'] > CATALOGO_REFRESH_TTL:
+        catalogo_refrescar_en_segundo_plano()
+    return _CATALOGO['segmentos']
+
+
+def _catalogo_orden_codigo(fila):
+    return (fila['proveedor_key'], fila['codigo'], fila['archivo'], fila['hoja'], fila['nombre'], -fila['mtime'])
+
+
+def catalogo_buscar_codigos(codigos=(), digitos=(), digitos_sin_ceros=(), prov_key_filter: str = '', claves_barras=()):
+    """Filas cuyo codigo, codigo_digitos, dígitos sin ceros a la izquierda o clave de barras coinciden.
+    Devuelve None si el catálogo no está disponible (con LISTAS_SQLITE busca en SQLite).
+    """
+    segmentos = _catalogo_segmentos()
+    if segmentos is None:
+        return sqlite_buscar_codigos(codigos, digitos, digitos_sin_ceros, prov_key_filter, claves_barras) if LISTAS_SQLITE else None
+    filas = []
+    for seg in segmentos.values():
+        encontrados = set()
+        for indice, claves in (('por_codigo', codigos), ('por_digitos', digitos), ('por_digitos_nl', digitos_sin_ceros),
+                               ('por_clave_barras', claves_barras)):
+            if not claves:
+                continue
+            mapa = seg[indice] if indice != 'por_clave_barras' else _catalogo_indice_barras(seg)
+            for clave in claves:
+                encontrados.update(mapa.get(clave, ()))
+        if not encontrados:
+            continue
+        prov_col = seg['cols']['proveedor_key']
+        for i in encontrados:
+            if prov_key_filter and prov_col[i] != prov_key_filter:
+                continue
+            filas.append(_catalogo_fila(seg, i))
+    filas.sort(key=_catalogo_orden_codigo)
+    return filas
+
+
+def catalogo_buscar_patron_digitos(patron: str, prov_key_filter: str = '', limite: int = 500):
+    segmentos = _catalogo_segmentos()
+    if segmentos is None:
+        return sqlite_buscar_patron_digitos(patron, prov_key_filter, limite) if LISTAS_SQLITE else None
+    filas = []
+    for seg in segmentos.values():
+        prov_col = seg['cols']['proveedor_key']
+        for i in _catalogo_filas_patron(seg, patron):
+            if not prov_key_filter or prov_col[i] == prov_key_filter:
+                filas.append(_catalogo_fila(seg, i))
+    filas.sort(key=lambda f: (f['proveedor_key'], f['codigo']))
+    return filas[:limite]
+
+
+def catalogo_buscar_texto(token_groups, proveedor_filter: str = None, limite: int = None):
+    """Candidatos cuyo nombre/código normalizado contiene alguna variante de cada grupo (mismo criterio que el LIKE).
+    Cada grupo se resuelve como unión de listas de posteo y los grupos se intersectan (el más chico primero).
+    Devuelve None si el catálogo no está disponible (con LISTAS_SQLITE busca en SQLite).
+    """
+    segmentos = _catalogo_segmentos()
+    vocab = _CATALOGO['vocab']
+    if segmentos is None or vocab is None:
+        return sqlite_buscar_texto(token_groups, proveedor_filter, limite) if LISTAS_SQLITE else None
+    grupos = [g for g in token_groups if g]
+    tokens_por_grupo = []
+    for g in grupos:
+        tokens = set()
+        for variante in g:
+            tokens.update(_catalogo_expandir_variante(vocab, variante))
+        if not tokens:
+            return []
+        tokens_por_grupo.append(tokens)
+
+    filas = []
+    for seg in vocab['segmentos'].values():
+        postings = seg['postings']
+        if tokens_por_grupo:
+            conjuntos = []
+            for tokens in tokens_por_grupo:
+                ids = set()
+                for t in tokens:
+                    lista = postings.get(t)
+                    if lista is not None:
+                        ids.update(lista)
+                if not ids:
+                    break
+                conjuntos.append(ids)
+            if len(conjuntos) < len(tokens_por_grupo):
+                continue
+            conjuntos.sort(key=len)
+            candidatos = conjuntos[0].intersection(*conjuntos[1:])
+        else:
+            candidatos = range(seg['n'])
+        prov_col = seg['cols']['proveedor_key']
+        for i in candidatos:
+            if proveedor_filter and prov_col[i] != proveedor_filter:
+                continue
+            filas.append(_catalogo_fila(seg, i))
+    filas.sort(key=lambda f: (f['proveedor_nombre'], f['nombre_normalizado']))
+    if limite:
+        filas = filas[:limite]
+    return filas
+
+
+def catalogo_stats():
+    """Estado del catálogo residente para /health."""
+    if not CATALOGO_EN_MEMORIA:
+        return {'activo': False}
+    segmentos = _CATALOGO['segmentos']
+    return {
+        'activo': True,
+        'listo': _CATALOGO['listo'],
+        'archivos': len(segmentos),
+        'filas': sum(seg['n'] for seg in segmentos.values()),
+        'tokens': len(_CATALOGO['vocab']['tokens']) if _CATALOGO['vocab'] else 0,
+        'memoria_mb': round(sum(seg['bytes'] for seg in segmentos.values()) / (1024 * 1024), 2),
+        'refrescos': _CATALOGO['refrescos'],
+        'ultimo_refresh': _CATALOGO['ultimo_refresh'],
+        'error': _CATALOGO['error'],
+    }
+
+
+if CATALOGO_EN_MEMORIA and LISTAS_EN_DB and DATABASE_URL and psycopg and _PROCESO_PRINCIPAL:
+    catalogo_refrescar_en_segundo_plano(completo=True)
+
+
+# --- Caché de resultados de búsqueda por texto ---
+# Las mismas búsquedas ("llave 13mm", "jgo boc") se repiten todo el día. El resultado completo (ya filtrado y
+# ordenado) se guarda por la forma canónica de la consulta y el filtro de proveedor, y vale mientras
+# import_batches no registre otro lote completado ni se borre alguno: la versión (cantidad, último id de lotes
+# completados) se relee a lo sumo cada BUSQUEDA_CACHE_VERIFICACION segundos, y enseguida tras una carga o un
+# borrado en este proceso (busqueda_cache_invalidar).
+BUSQUEDA_CACHE_MAX = int(os.getenv('BUSQUEDA_CACHE_MAX', '256'))  # búsquedas en memoria (LRU); 0 desactiva
+BUSQUEDA_CACHE_TTL = float(os.getenv('BUSQUEDA_CACHE_TTL', '600'))  # s de vida de un resultado
+BUSQUEDA_CACHE_VERIFICACION = float(os.getenv('BUSQUEDA_CACHE_VERIFICACION', '2'))  # s entre lecturas de import_batches
+
+_BUSQUEDA_CACHE = OrderedDict()  # clave -> (versión de import_batches, monotonic de creación, resultado)
+_BUSQUEDA_CACHE_LOCK = threading.Lock()
+_BUSQUEDA_CACHE_ESTADO = {'version': None, 'verificado_en': None}
+_BUSQUEDA_CACHE_STATS = {'aciertos': 0, 'fallos': 0, 'vencidos': 0, 'invalidaciones': 0, 'descartes': 0}
+
+
+def busqueda_cache_clave(query: str, *extra) -> tuple:
+    """Clave canónica de una búsqueda por texto: los grupos de tokens de _build_db_like_token_groups, más el
+    texto normalizado y las medidas de la consulta, que el ordenamiento usa tal cual (los grupos solos juntan
+    "llave" con "llaves" y "12.5mm" con "125mm"). `extra`: filtro de proveedor y lo que cambie el resultado.
     """
-    print("[DEBUG maybe_auto_sync_listas] Verificando si se necesita sincronización...")
-    if not (LISTAS_EN_DB and DATABASE_URL and psycopg):
-        print("[DEBUG maybe_auto_sync_listas] Condiciones no cumplidas (LISTAS_EN_DB o DATABASE_URL)")
-        return None
+    grupos = tuple(tuple(g) for g in _build_db_like_token_groups(query))
+    return (grupos, ' '.join(_query_texto_sin_medidas(query).split()), tuple(_extract_medidas(query))) + extra
+
+
+def _import_batches_version():
+    """(lotes completados, último id completado) de import_batches, o None si no hay DB de listas."""
+    sql = "SELECT COUNT(*) AS lotes, MAX(id) AS ultimo FROM import_batches WHERE status = 'completed'"
     try:
-        desactualizadas = listas_db_desactualizadas()
-        print(f"[DEBUG maybe_auto_sync_listas] listas_db_desactualizadas() = {desactualizadas}")
-        if desactualizadas:
-            print('[DEBUG maybe_auto_sync_listas] Iniciando sincronización automática...')
-            log_debug('maybe_auto_sync_listas: iniciando sincronización automática…')
-            resumen = sync_listas_to_db()
-            print(f'[DEBUG maybe_auto_sync_listas] Sincronización completada, resumen: {resumen}')
-            log_debug('maybe_auto_sync_listas: resumen', resumen)
-            return resumen if isinstance(resumen, dict) else None
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                row = conn.execute(sql).fetchone()
+        elif DATABASE_URL and psycopg:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.execute(sql)
+                row = cur.fetchone()
         else:
-            print("[DEBUG maybe_auto_sync_listas] DB está actualizada, no se requiere sincronización")
+            return None
+        return (row['lotes'], row['ultimo'])
     except Exception as exc:
-        print(f"[DEBUG maybe_auto_sync_listas] ERROR durante auto-sync: {exc}")
-        log_debug('maybe_auto_sync_listas: error durante auto-sync', exc)
-    return None
+        log_debug('_import_batches_version: error consultando import_batches', exc)
+        return None
 
 
-def buscar_productos_manual_db(query: str, page: int, per_page: int):
-    """Busca productos del proveedor manual en PostgreSQL con paginación.
-    Devuelve (resultados:list[dict], total:int).
+def busqueda_cache_version():
+    """Versión vigente de import_batches; si cambió desde la última lectura, vacía la caché."""
+    with _BUSQUEDA_CACHE_LOCK:
+        verificado_en = _BUSQUEDA_CACHE_ESTADO['verificado_en']
+        if verificado_en is not None and time.monotonic() - verificado_en < BUSQUEDA_CACHE_VERIFICACION:
+            return _BUSQUEDA_CACHE_ESTADO['version']
+    version = _import_batches_version()
+    with _BUSQUEDA_CACHE_LOCK:
+        if version != _BUSQUEDA_CACHE_ESTADO['version']:
+            if _BUSQUEDA_CACHE:
+                _BUSQUEDA_CACHE_STATS['invalidaciones'] += 1
+            _BUSQUEDA_CACHE.clear()
+            _BUSQUEDA_CACHE_ESTADO['version'] = version
+        _BUSQUEDA_CACHE_ESTADO['verificado_en'] = time.monotonic() if version is not None else None
+    return version
+
+
+def busqueda_cache_invalidar():
+    """Vacía la caché y hace releer import_batches en la próxima búsqueda (llamar después de cargar o borrar
+    listas, o cuando cambió el catálogo en memoria, que puede actualizarse después que import_batches)."""
+    with _BUSQUEDA_CACHE_LOCK:
+        if _BUSQUEDA_CACHE:
+            _BUSQUEDA_CACHE_STATS['invalidaciones'] += 1
+            _BUSQUEDA_CACHE.clear()
+        _BUSQUEDA_CACHE_ESTADO['verificado_en'] = None
+
+
+def busqueda_cache_obtener(clave: tuple, calcular):
+    """Resultado cacheado para `clave` o, si no está o venció, el de `calcular()` (que se guarda).
+    Los resultados se comparten entre pedidos: los llamadores no deben modificarlos.
     """
-    if not (DATABASE_URL and psycopg):
-        return [], 0
+    version = busqueda_cache_version() if BUSQUEDA_CACHE_MAX > 0 else None
+    if version is None:
+        return calcular()
+    with _BUSQUEDA_CACHE_LOCK:
+        entrada = _BUSQUEDA_CACHE.get(clave)
+        if entrada is not None:
+            if entrada[0] == version and time.monotonic() - entrada[1] <= BUSQUEDA_CACHE_TTL:
+                _BUSQUEDA_CACHE.move_to_end(clave)
+                _BUSQUEDA_CACHE_STATS['aciertos'] += 1
+                return entrada[2]
+            del _BUSQUEDA_CACHE[clave]
+            _BUSQUEDA_CACHE_STATS['vencidos'] += 1
+        _BUSQUEDA_CACHE_STATS['fallos'] += 1
+    resultado = calcular()
+    with _BUSQUEDA_CACHE_LOCK:
+        # Si entretanto cambió la versión, el resultado puede ser de antes del cambio: no se guarda
+        if _BUSQUEDA_CACHE_ESTADO['version'] == version:
+            _BUSQUEDA_CACHE[clave] = (version, time.monotonic(), resultado)
+            _BUSQUEDA_CACHE.move_to_end(clave)
+            while len(_BUSQUEDA_CACHE) > BUSQUEDA_CACHE_MAX:
+                _BUSQUEDA_CACHE.popitem(last=False)
+                _BUSQUEDA_CACHE_STATS['descartes'] += 1
+    return resultado
+
+
+def busqueda_cache_stats():
+    with _BUSQUEDA_CACHE_LOCK:
+        return dict(_BUSQUEDA_CACHE_STATS, busquedas=len(_BUSQUEDA_CACHE), max=BUSQUEDA_CACHE_MAX,
+                    ttl=BUSQUEDA_CACHE_TTL, version=_BUSQUEDA_CACHE_ESTADO['version'])
+
+
+def _buscar_productos_manual_ordenados(query: str, fetch_limit: int) -> list:
+    """Productos del proveedor manual que coinciden con `query`, ya ordenados por relevancia (desde la caché
+    de búsquedas: no modificar la lista ni sus productos)."""
+    return busqueda_cache_obtener(
+        busqueda_cache_clave(query, 'manual', fetch_limit),
+        lambda: _buscar_productos_manual_sin_cache(query, fetch_limit)
+    )
+
+
+def _buscar_productos_manual_sin_cache(query: str, fetch_limit: int) -> list:
     query = (query or '').strip()
     token_groups = _build_db_like_token_groups(query)
-    offset = max(0, (max(1, int(page)) - 1) * max(1, int(per_page)))
-    per_page = max(1, int(per_page))
-    fetch_limit = max(500, min(12000, per_page * 40))
 
     where = ["proveedor_key = 'manual'"]
     params = []
@@ -3026,11 +5751,12 @@ def buscar_productos_manual_db(query: str, page: int, per_page: int):
         where.append(f"({' OR '.join(or_parts)})")
     where_sql = ' AND '.join(where) if where else 'TRUE'
 
-    try:
+    rows = catalogo_buscar_texto(token_groups, 'manual', limite=None if token_groups else fetch_limit)
+    if rows is None:
         with get_pg_conn() as conn, conn.cursor() as cur:
             cur.execute(
                 f"""
-                SELECT codigo, nombre, precio
+                SELECT codigo, nombre, precio, nombre_normalizado, codigo_normalizado, medidas, tokens
                 FROM productos_listas
                 WHERE {where_sql}
                 ORDER BY nombre_normalizado ASC
@@ -3038,42 +5764,59 @@ def buscar_productos_manual_db(query: str, page: int, per_page: int):
                 """,
                 params + [fetch_limit]
             )
-            resultados = []
-            for r in cur.fetchall():
-                if isinstance(r, dict):
-                    codigo = r.get('codigo')
-                    nombre = r.get('nombre')
-                    precio = r.get('precio')
-                else:
-                    codigo, nombre, precio = r[0], r[1], r[2]
-                if not producto_coincide_busqueda(nombre or '', codigo or '', query):
-                    continue
-                resultados.append({
-                    'codigo': str(codigo) if codigo is not None else '',
-                    'nombre': nombre or '',
-                    'precio': float(precio) if precio is not None else None,
-                    'proveedor': 'Manual'
-                })
-            resultados = ordenar_resultados_por_relevancia(resultados, query)
-            total = len(resultados)
-            return resultados[offset:offset + per_page], total
+            rows = cur.fetchall()
+    consulta = compilar_consulta(query)
+    resultados = []
+    atributos = []
+    for r in rows:
+        codigo = r.get('codigo')
+        nombre = r.get('nombre')
+        precio = r.get('precio')
+        attrs = atributos_desde_fila(r)
+        if not producto_coincide_busqueda(nombre or '', codigo or '', consulta, attrs):
+            continue
+        atributos.append(attrs)
+        resultados.append({
+            'codigo': str(codigo) if codigo is not None else '',
+            'nombre': nombre or '',
+            'precio': float(precio) if precio is not None else None,
+            'proveedor': 'Manual'
+        })
+    return ordenar_resultados_por_relevancia(resultados, consulta, atributos)
+
+
+def buscar_productos_manual_db(query: str, page: int, per_page: int):
+    """Busca productos del proveedor manual en la DB de listas (PostgreSQL o SQLite) con paginación.
+    Devuelve (resultados:list[dict], total:int).
+    """
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
+        return [], 0
+    offset = max(0, (max(1, int(page)) - 1) * max(1, int(per_page)))
+    per_page = max(1, int(per_page))
+    fetch_limit = max(500, min(12000, per_page * 40))
+    try:
+        resultados = _buscar_productos_manual_ordenados(query, fetch_limit)
+        total = len(resultados)
+        return resultados[offset:offset + per_page], total
     except Exception as exc:
         log_debug('buscar_productos_manual_db: error', exc)
         return [], 0
 
 
-def buscar_productos_avanzados_db(query: str, page: int, per_page: int, proveedor_filter: str = None):
-    """Busca productos de TODOS los proveedores en PostgreSQL con paginación.
-    Devuelve (resultados:list[dict], total:int).
-    Cada resultado incluye: codigo, nombre, precio (canonical), precios (JSONB), proveedor_key, proveedor_nombre, precio_valido.
+def _buscar_productos_avanzados_ordenados(query: str, proveedor_filter: str = None, fetch_limit: int = 15000) -> list:
+    """Todos los resultados de la búsqueda avanzada en la DB de listas, ya ordenados por relevancia.
+    `fetch_limit` acota los candidatos que se traen de PostgreSQL/SQLite antes de filtrar y ordenar.
+    La lista sale de la caché de búsquedas: no modificarla ni modificar sus productos.
     """
-    if not (DATABASE_URL and psycopg):
-        return [], 0
+    return busqueda_cache_obtener(
+        busqueda_cache_clave(query, 'avanzada', proveedor_filter or '', fetch_limit),
+        lambda: _buscar_productos_avanzados_sin_cache(query, proveedor_filter, fetch_limit)
+    )
+
+
+def _buscar_productos_avanzados_sin_cache(query: str, proveedor_filter: str, fetch_limit: int) -> list:
     query = (query or '').strip()
     token_groups = _build_db_like_token_groups(query)
-    offset = max(0, (max(1, int(page)) - 1) * max(1, int(per_page)))
-    per_page = max(1, int(per_page))
-    fetch_limit = max(800, min(15000, per_page * 50))
 
     where = []
     params = []
@@ -3083,139 +5826,152 @@ def buscar_productos_avanzados_db(query: str, page: int, per_page: int, proveedo
         where.append("proveedor_key = %s")
         params.append(proveedor_filter)
     
-    # Búsqueda por grupos de tokens (OR dentro del grupo, AND entre grupos)
-    # Incluye también extra_datos para mejorar matcheo de términos técnicos.
+    # Búsqueda por grupos de tokens (OR dentro del grupo, AND entre grupos), en nombre o código como
+    # producto_coincide_busqueda; cada medida de la consulta tiene que estar entre las del producto.
     for group in token_groups:
         if not group:
             continue
         or_parts = []
         for t in group:
-            or_parts.append(
-                "(nombre_normalizado LIKE %s OR codigo_normalizado LIKE %s OR COALESCE(extra_datos::text,'') ILIKE %s)"
-            )
+            or_parts.append("(nombre_normalizado LIKE %s OR codigo_normalizado LIKE %s)")
             like = f"%{t}%"
-            params.extend([like, like, like])
+            params.extend([like, like])
         where.append(f"({' OR '.join(or_parts)})")
+    for valor, unidad in _extract_medidas(query):
+        where.append(
+            "(medidas IS NULL OR EXISTS (SELECT 1 FROM jsonb_array_elements(medidas) m"
+            " WHERE m->>1 = %s AND abs((m->>0)::float8 - %s) <= 0.011))"
+        )
+        params.extend([unidad, float(valor)])
     
     where_sql = ' AND '.join(where) if where else 'TRUE'
 
-    try:
+    ordenado_en_db = False
+    rows = catalogo_buscar_texto(token_groups, proveedor_filter, limite=None if token_groups else fetch_limit)
+    if rows is None:
+        # El puntaje de relevancia se calcula en PostgreSQL: el LIMIT se queda con los mejores candidatos
+        # (no con los primeros por orden alfabético) y vuelven ya en el orden final.
+        puntaje_sql, puntaje_params = puntaje_relevancia_sql(query)
+        orden_puntaje = f"{puntaje_sql} DESC, " if puntaje_sql else ''
         with get_pg_conn() as conn, conn.cursor() as cur:
-            # Obtener candidatos para re-ranking por relevancia
             cur.execute(
                 f"""
-                SELECT codigo, nombre, precio, precios, proveedor_key, proveedor_nombre, extra_datos, iva
+                SELECT codigo, nombre, precio, precios, proveedor_key, proveedor_nombre, extra_datos, iva,
+                       nombre_normalizado, codigo_normalizado, medidas, tokens
                 FROM productos_listas
                 WHERE {where_sql}
-                ORDER BY proveedor_nombre ASC, nombre_normalizado ASC
+                ORDER BY {orden_puntaje}nombre_normalizado COLLATE "C" ASC, proveedor_nombre ASC
                 LIMIT %s
                 """,
-                params + [fetch_limit]
+                params + puntaje_params + [fetch_limit]
             )
-            resultados = []
-            for r in cur.fetchall():
-                if isinstance(r, dict):
-                    codigo = r.get('codigo')
-                    nombre = r.get('nombre')
-                    precio = r.get('precio')
-                    precios = r.get('precios')
-                    proveedor_key = r.get('proveedor_key')
-                    proveedor_nombre = r.get('proveedor_nombre')
-                    extra_datos = r.get('extra_datos')
-                    iva = r.get('iva')
-                else:
-                    codigo, nombre, precio, precios, proveedor_key, proveedor_nombre, extra_datos, iva = r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7]
+            rows = cur.fetchall()
+        ordenado_en_db = True
+    consulta = compilar_consulta(query)
+    resultados = []
+    atributos = []
+    for r in rows:
+        attrs = atributos_desde_fila(r)
+        if not producto_coincide_busqueda(r.get('nombre') or '', r.get('codigo') or '', consulta, attrs):
+            continue
+        atributos.append(attrs)
+        resultados.append(_producto_fila_avanzado(r))
+    # Filas importadas antes de precalcular atributos: el puntaje de la DB no vale para ellas
+    if ordenado_en_db and all(atributos):
+        return resultados
+    return ordenar_resultados_por_relevancia(resultados, consulta, atributos)
 
-                if not producto_coincide_busqueda(nombre or '', codigo or '', query):
-                    continue
-                
-                # Parsear JSONB si viene como string
-                if isinstance(precios, str):
-                    try:
-                        precios = json.loads(precios)
-                    except:
-                        precios = {}
-                if isinstance(extra_datos, str):
-                    try:
-                        extra_datos = json.loads(extra_datos)
-                    except:
-                        extra_datos = {}
-                
-                precio_valido = precio is not None and precio > 0
-                
-                # Construir dict de precios con nombre apropiado según proveedor
-                precios_a_mostrar = {}
-                if precio is not None and precio > 0:
-                    # Convertir Decimal a float para compatibilidad con template
-                    precio_float = float(precio) if hasattr(precio, '__float__') else precio
-                    # Determinar el nombre del precio canónico según el proveedor
-                    if proveedor_key == 'brementools':
-                        precios_a_mostrar['Precio de Venta'] = precio_float
-                    elif proveedor_key == 'crossmaster':
-                        precios_a_mostrar['Precio Lista'] = precio_float
-                    elif proveedor_key == 'berger':
-                        precios_a_mostrar['Precio'] = precio_float
-                    elif proveedor_key == 'chiesa':
-                        precios_a_mostrar['Pr.Unit'] = precio_float
-                    elif proveedor_key == 'cachan':
-                        precios_a_mostrar['Precio'] = precio_float
-                    elif proveedor_key == 'manual':
-                        precios_a_mostrar['Precio'] = precio_float
-                    else:
-                        precios_a_mostrar['Precio'] = precio_float
-                
-                # Agregar precios adicionales del JSONB
-                if precios:
-                    for k, v in precios.items():
-                        if v is not None and v != '':
-                            # Convertir a float si es necesario
-                            v_float = float(v) if hasattr(v, '__float__') else v
-                            # Normalizar el nombre de la clave para comparación
-                            k_lower = str(k).lower().strip().replace('  ', ' ')
-                            # Usar nombres exactos para precios específicos
-                            if k_lower in ['precio neto', 'precioneto']:
-                                k_display = 'Precio Neto'
-                            elif k_lower in ['precio neto unitario', 'precionetunitario']:
-                                k_display = 'Precio Neto Unitario'
-                            elif k_lower in ['precio de lista', 'precio lista', 'preciolista', 'preciodelista']:
-                                k_display = 'Precio de Lista'
-                            else:
-                                # Capitalizar nombres de precios adicionales
-                                k_display = k.title() if isinstance(k, str) else str(k)
-                            
-                            if k_display not in precios_a_mostrar:
-                                precios_a_mostrar[k_display] = v_float
-                
-                # Precios calculados especiales por proveedor
-                precios_calculados = {}
-                if proveedor_key == 'chiesa' and (precio is not None):
-                    try:
-                        base = float(precio) if hasattr(precio, '__float__') else precio
-                        precios_calculados['Costo (-4% extra)'] = round(base * 0.96, 4)
-                        precios_calculados['Costo (+4% extra)'] = round(base * 1.04, 4)
-                    except Exception:
-                        pass
-
-                resultados.append({
-                    'codigo': str(codigo) if codigo is not None else '',
-                    'nombre': nombre or '',
-                    'precio': float(precio) if precio is not None else None,
-                    'precio_valido': precio_valido,
-                    'precios': precios_a_mostrar,
-                    'proveedor': proveedor_nombre or proveedor_key or '',
-                    'proveedor_key': proveedor_key or '',
-                    'extra_datos': extra_datos or {},
-                    'iva': iva or 'N/A',
-                    'precios_calculados': precios_calculados,
-                    'fuente': 'DB'
-                })
-            resultados = ordenar_resultados_por_relevancia(resultados, query)
-            total = len(resultados)
-            return resultados[offset:offset + per_page], total
+
+def buscar_productos_avanzados_db(query: str, page: int, per_page: int, proveedor_filter: str = None):
+    """Busca productos de TODOS los proveedores en la DB de listas (PostgreSQL o SQLite) con paginación.
+    Devuelve (resultados:list[dict], total:int).
+    Cada resultado incluye: codigo, nombre, precio (canonical), precios (JSONB), proveedor_key, proveedor_nombre, precio_valido.
+    """
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
+        return [], 0
+    offset = max(0, (max(1, int(page)) - 1) * max(1, int(per_page)))
+    per_page = max(1, int(per_page))
+    fetch_limit = max(800, min(15000, per_page * 50))
+    try:
+        resultados = _buscar_productos_avanzados_ordenados(query, proveedor_filter, fetch_limit)
+        total = len(resultados)
+        return resultados[offset:offset + per_page], total
     except Exception as exc:
         log_debug('buscar_productos_avanzados_db: error', exc)
         return [], 0
 
+
+# --- Búsqueda avanzada paginada con cursor ---
+# La primera página de una búsqueda toma la lista completa ordenada por relevancia (de la caché de búsquedas)
+# y la guarda con un cursor; las páginas siguientes cortan esa lista sin volver a la DB ni re-ordenar.
+# Un cursor sigue sirviendo la misma lista hasta vencer, aunque cambien las listas, para que la paginación
+# no se corra; una búsqueda nueva sin cursor sí ve los cambios (ver busqueda_cache_invalidar).
+BUSQUEDA_CURSOR_TTL = float(os.getenv('BUSQUEDA_CURSOR_TTL', '300'))  # s de vida de un cursor
+BUSQUEDA_CURSORES_MAX = int(os.getenv('BUSQUEDA_CURSORES_MAX', '64'))  # búsquedas ordenadas en memoria
+
+_BUSQUEDA_CURSORES = OrderedDict()  # cursor -> {'clave', 'resultados', 'creado'}
+_BUSQUEDA_CURSORES_LOCK = threading.Lock()
+_BUSQUEDA_CURSORES_STATS = {'busquedas': 0, 'paginas_desde_cursor': 0, 'vencidos': 0}
+
+
+def _busqueda_cursor_vigente(cursor: str, ahora: float):
+    entrada = _BUSQUEDA_CURSORES.get(cursor) if cursor else None
+    if entrada is None:
+        return None
+    if ahora - entrada['creado'] > BUSQUEDA_CURSOR_TTL:
+        del _BUSQUEDA_CURSORES[cursor]
+        _BUSQUEDA_CURSORES_STATS['vencidos'] += 1
+        return None
+    _BUSQUEDA_CURSORES.move_to_end(cursor)
+    return entrada
+
+
+def buscar_productos_avanzados_paginado(query: str, page: int = 1, per_page: int = 20, proveedor_filter: str = None,
+                                         cursor: str = None, fetch_limit: int = 15000):
+    """Como buscar_productos_avanzados_db pero con cursor. Devuelve (resultados de la página, total, cursor).
+    Con un `cursor` vigente de la misma búsqueda la página sale de la lista ya ordenada; si venció o es de
+    otra búsqueda se ignora y se busca de nuevo. El cursor devuelto se pasa en los pedidos de las páginas siguientes.
+    """
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
+        return [], 0, None
+    page = max(1, int(page or 1))
+    per_page = max(1, int(per_page or 20))
+    clave = (' '.join(normalize_text(query or '').split()), proveedor_filter or '', fetch_limit)
+    ahora = time.monotonic()
+    entrada = None
+    with _BUSQUEDA_CURSORES_LOCK:
+        entrada = _busqueda_cursor_vigente(cursor, ahora)
+        if entrada is not None and entrada['clave'] != clave:
+            entrada = None
+        if entrada is not None:
+            _BUSQUEDA_CURSORES_STATS['paginas_desde_cursor'] += 1
+
+    if entrada is None:
+        try:
+            resultados = _buscar_productos_avanzados_ordenados(query, proveedor_filter, fetch_limit)
+        except Exception as exc:
+            log_debug('buscar_productos_avanzados_paginado: error', exc)
+            return [], 0, None
+        cursor = uuid.uuid4().hex[:16]
+        entrada = {'clave': clave, 'resultados': resultados, 'creado': time.monotonic()}
+        with _BUSQUEDA_CURSORES_LOCK:
+            _BUSQUEDA_CURSORES_STATS['busquedas'] += 1
+            if BUSQUEDA_CURSORES_MAX > 0:
+                _BUSQUEDA_CURSORES[cursor] = entrada
+                while len(_BUSQUEDA_CURSORES) > BUSQUEDA_CURSORES_MAX:
+                    _BUSQUEDA_CURSORES.popitem(last=False)
+
+    resultados = entrada['resultados']
+    offset = (page - 1) * per_page
+    return resultados[offset:offset + per_page], len(resultados), cursor
+
+
+def busqueda_cursores_stats():
+    with _BUSQUEDA_CURSORES_LOCK:
+        return dict(_BUSQUEDA_CURSORES_STATS, cursores=len(_BUSQUEDA_CURSORES), max=BUSQUEDA_CURSORES_MAX,
+                    ttl=BUSQUEDA_CURSOR_TTL)
+
+
 app.jinja_env.globals.update(generar_nombre_visible=generar_nombre_visible, formatear_precio=formatear_precio)
 
 # --- FUNCIONES DB ---
@@ -3502,7 +6258,7 @@ def humanizar_tiempo_desde(timestamp_segundos):
         return "-"
 
 # --- LÓGICA DE CÁLCULO ---
-proveedores = load_proveedores()
+proveedores = load_proveedores() if _PROCESO_PRINCIPAL else {}
 
 def core_math(precio, iva, descuentos, ganancias):
     precio_actual = precio
@@ -3557,6 +6313,7 @@ def index():
     ventas_busqueda_total_paginas = 0
     ventas_busqueda_total_resultados = 0
     ventas_busqueda_resultados = []
+    ventas_busqueda_cursor = None
     ventas_producto_seleccionado = None
     ventas_producto_complemento = None
     excel_import_wizard = None
@@ -3587,7 +6344,7 @@ def index():
 
     def preparar_busqueda(query, page):
         nonlocal ventas_busqueda_query, ventas_busqueda_page, ventas_busqueda_total_paginas
-        nonlocal ventas_busqueda_total_resultados, ventas_busqueda_resultados
+        nonlocal ventas_busqueda_total_resultados, ventas_busqueda_resultados, ventas_busqueda_cursor
         query = (query or "").strip()
         try:
             page = int(page)
@@ -3599,9 +6356,14 @@ def index():
         ventas_busqueda_query = query
         ventas_busqueda_page = page
         coincidencias = []
-        if LISTAS_EN_DB and DATABASE_URL and psycopg:
-            # Buscar en PostgreSQL (TODOS los proveedores, no solo manual)
-            resultados_db, total_db = buscar_productos_avanzados_db(query, page, per_page, proveedor_filter=None)
+        if LISTAS_DB:
+            # Buscar en la DB (TODOS los proveedores, no solo manual). Cambiar de página o volver a enviar
+            # cualquier formulario de ventas con la misma búsqueda reutiliza la lista ordenada del cursor.
+            resultados_db, total_db, ventas_busqueda_cursor = buscar_productos_avanzados_paginado(
+                query, page, per_page, proveedor_filter=None,
+                cursor=(request.form.get("ventas_cursor") or "").strip() or None,
+                fetch_limit=max(800, min(15000, per_page * 50))
+            )
             ventas_busqueda_total_resultados = int(total_db)
             ventas_busqueda_total_paginas = max(1, math.ceil(ventas_busqueda_total_resultados / per_page)) if total_db else 0
             ventas_busqueda_resultados = resultados_db
@@ -3691,16 +6453,36 @@ def index():
                 # Esto incluye los productos cargados por el importador guiado (WIZARD-*),
                 # incluso cuando LISTAS_EN_DB esté desactivado para el flujo tradicional Excel->DB.
                 total_db = 0
-                if DATABASE_URL and psycopg:
+                resultados_desde_db = False
+                if (DATABASE_URL and psycopg) or LISTAS_SQLITE:
                     print(f'[DEBUG consulta_producto] Buscando en DB: termino="{termino_busqueda}", proveedor="{proveedor_key_filter}"', flush=True)
                     try:
-                        # Traer TODOS los resultados (máximo 5000) para paginación del lado del cliente
-                        resultados_db, total_db = buscar_productos_avanzados_db(
+                        # Paginación en el servidor: solo se trae la página pedida; la lista ordenada queda guardada
+                        # con un cursor y las páginas siguientes (o cambiar la cantidad por página) no vuelven a buscar.
+                        # Con filtro de resultados se traen todos (máximo 5000) para filtrarlos antes de paginar.
+                        busqueda_cursor = (request.values.get("busqueda_cursor") or "").strip() or None
+                        if filtro_resultados:
+                            pagina_db, por_pagina_db = 1, 5000
+                        else:
+                            pagina_db, por_pagina_db = busqueda_page_value, busqueda_per_page_value
+                        resultados_db, total_db, busqueda_cursor = buscar_productos_avanzados_paginado(
                             termino_busqueda,
-                            page=1,
-                            per_page=5000,  # Traer hasta 5000 resultados
-                            proveedor_filter=proveedor_key_filter if proveedor_key_filter else None
+                            page=pagina_db,
+                            per_page=por_pagina_db,
+                            proveedor_filter=proveedor_key_filter if proveedor_key_filter else None,
+                            cursor=busqueda_cursor
                         )
+                        if not filtro_resultados and total_db and not resultados_db:
+                            # Página fuera de rango (p. ej. menos resultados que antes): ir a la última
+                            busqueda_page_value = max(1, math.ceil(total_db / busqueda_per_page_value))
+                            resultados_db, total_db, busqueda_cursor = buscar_productos_avanzados_paginado(
+                                termino_busqueda,
+                                page=busqueda_page_value,
+                                per_page=busqueda_per_page_value,
+                                proveedor_filter=proveedor_key_filter if proveedor_key_filter else None,
+                                cursor=busqueda_cursor
+                            )
+                        resultados_desde_db = bool(resultados_db)
                         
                         print(f'[DEBUG consulta_producto] Resultados de DB: {total_db} productos encontrados', flush=True)
                         
@@ -3800,7 +6582,7 @@ def index():
 
                         file_path = os.path.join(LISTAS_PATH, filename)
                         try:
-                            all_sheets = pd.read_excel(file_path, sheet_name=None, header=header_row_index)
+                            all_sheets = leer_excel_cacheado(file_path, header=header_row_index)
                         except Exception as exc:
                             mensaje = f"❌ ERROR PROCESANDO {filename}: {exc}"
                             continue
@@ -3854,13 +6636,13 @@ def index():
                                 )
                                 productos_encontrados.append(producto)
                 
-                # Si estamos en fallback Excel (sin DB) y aún no se filtró, aplicar paginado en memoria
-                if (not (LISTAS_EN_DB and DATABASE_URL and psycopg)) or total_db == 0:
-                    if productos_encontrados:
-                        productos_encontrados = ordenar_resultados_por_relevancia(productos_encontrados, termino_busqueda)
+                # Si estamos en fallback Excel (sin DB), ordenar y, si no hay filtro, aplicar paginado en memoria
+                if not resultados_desde_db and productos_encontrados:
+                    productos_encontrados = ordenar_resultados_por_relevancia(productos_encontrados, termino_busqueda)
+                    total_db = len(productos_encontrados)
+                    if not filtro_resultados:
                         start_idx = (busqueda_page_value - 1) * busqueda_per_page_value
                         end_idx = start_idx + busqueda_per_page_value
-                        total_db = len(productos_encontrados)
                         productos_encontrados = productos_encontrados[start_idx:end_idx]
 
                 # Aplicar filtro adicional si se especificó
@@ -3882,14 +6664,8 @@ def index():
                     productos_encontrados = productos_filtrados[start_idx:end_idx]
                     total_db = total_filtrado
 
-                # Si no se aplicó filtro y usamos DB, total_db ya viene de la consulta
-                if not filtro_resultados:
-                    if LISTAS_EN_DB and DATABASE_URL and psycopg:
-                        total = total_db
-                    else:
-                        total = len(productos_encontrados)
-                else:
-                    total = total_db
+                # total_db ya es el total de la consulta (o del fallback, o de los filtrados), no el de la página
+                total = total_db
 
                 if not productos_encontrados and not mensaje:
                     mensaje = f"ℹ️ NO SE ENCONTRARON RESULTADOS PARA '{termino_busqueda}'."
@@ -3898,11 +6674,12 @@ def index():
 
                 # Calcular totales de paginación para template
                 try:
-                    import math
                     busqueda_total_paginas = max(1, math.ceil(max(0, int(total)) / busqueda_per_page_value))
                 except Exception:
                     busqueda_total_paginas = 1
                 busqueda_total_resultados = int(total)
+                # productos_encontrados ya es solo la página pedida (el template no vuelve a paginar)
+                busqueda_paginado_servidor = True
                 # Guardar en variables de contexto más adelante
                 locals().update({
                     'busqueda_page_value': busqueda_page_value,
@@ -4778,10 +7555,23 @@ def index():
                             row_batch = cur.fetchone()
                             batches_borrados = (list(row_batch.values())[0] if isinstance(row_batch, dict) else (row_batch[0] if row_batch else 0))
                             cur.execute("DELETE FROM import_batches")
+                            cur.execute("DELETE FROM codigos_barras_aprendidos")
                             conn.commit()
+                        listas_estado_invalidar()
+                        catalogo_refrescar(completo=True)
                     except Exception as exc:
                         db_error = exc
                         log_debug("borrar_todas_listas: error limpiando DB", exc)
+                elif LISTAS_SQLITE:
+                    try:
+                        with get_sqlite_conn() as conn:
+                            productos_borrados = conn.execute("DELETE FROM productos_listas").rowcount
+                            batches_borrados = conn.execute("DELETE FROM import_batches").rowcount
+                            conn.execute("DELETE FROM codigos_barras_aprendidos")
+                        listas_estado_invalidar()
+                    except Exception as exc:
+                        db_error = exc
+                        log_debug("borrar_todas_listas: error limpiando SQLite", exc)
 
                 if db_error:
                     mensaje = f"⚠️ Se borraron {archivos_borrados} archivo(s) Excel, pero falló limpiar la base: {db_error}"
@@ -4805,10 +7595,10 @@ def index():
                         except Exception:
                             pass
                 mensaje = f"✅ {eliminados} LISTA(S) OLD ELIMINADA(S)." if eliminados else "ℹ️ NO HABÍA LISTAS OLD PARA BORRAR."
-                if eliminados and LISTAS_EN_DB and DATABASE_URL and psycopg:
+                if eliminados and LISTAS_DB:
                     try:
-                        sync_res = sync_listas_to_db()
-                        log_debug('borrar_listas_old: sync después de borrar OLD', sync_res)
+                        sync_res = encolar_sync_listas('borrar_listas_old')
+                        log_debug('borrar_listas_old: sync encolado después de borrar OLD', sync_res)
                     except Exception as exc:
                         log_debug('borrar_listas_old: error al resincronizar', exc)
                 active_tab = "gestion"
@@ -4821,10 +7611,10 @@ def index():
                 try:
                     os.remove(os.path.join(LISTAS_PATH, fname))
                     mensaje = f"✅ LISTA OLD '{fname}' ELIMINADA."
-                    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+                    if LISTAS_DB:
                         try:
-                            sync_res = sync_listas_to_db()
-                            log_debug('borrar_lista_old_individual: sync después de borrar', sync_res)
+                            sync_res = encolar_sync_listas('borrar_lista_old_individual')
+                            log_debug('borrar_lista_old_individual: sync encolado después de borrar', sync_res)
                         except Exception as exc:
                             log_debug('borrar_lista_old_individual: error al resincronizar', exc)
                 except Exception as e:
@@ -4839,10 +7629,10 @@ def index():
                 try:
                     os.remove(os.path.join(LISTAS_PATH, fname))
                     mensaje = f"✅ LISTA '{fname}' ELIMINADA."
-                    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+                    if LISTAS_DB:
                         try:
-                            sync_res = sync_listas_to_db()
-                            log_debug('borrar_lista_vigente: sync después de borrar', sync_res)
+                            sync_res = encolar_sync_listas('borrar_lista_vigente')
+                            log_debug('borrar_lista_vigente: sync encolado después de borrar', sync_res)
                         except Exception as exc:
                             log_debug('borrar_lista_vigente: error al resincronizar', exc)
                     active_tab = "gestion"
@@ -4947,7 +7737,7 @@ def index():
                 header_row_wizard = 0
 
             archivo_wizard = request.files.get('archivo_excel_wizard')
-            if not (DATABASE_URL and psycopg):
+            if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
                 mensaje = "⚠️ La importación guiada requiere PostgreSQL activo (DATABASE_URL + LISTAS_EN_DB=1)."
             else:
                 wizard_data, wizard_error = preparar_excel_import_wizard(
@@ -5109,6 +7899,8 @@ def index():
         "busqueda_per_page": locals().get("busqueda_per_page_value", 20),
         "busqueda_total_paginas": locals().get("busqueda_total_paginas", 1),
         "busqueda_total_resultados": locals().get("busqueda_total_resultados", (len(productos_encontrados) if productos_encontrados else 0)),
+        "busqueda_cursor": locals().get("busqueda_cursor"),
+        "busqueda_paginado_servidor": locals().get("busqueda_paginado_servidor", False),
         "proveedor_id_seleccionado": proveedor_id_seleccionado,
         "datos_seleccionados": datos_seleccionados,
         "historial": historial,
@@ -5130,6 +7922,7 @@ def index():
         "ventas_busqueda_total_paginas": ventas_busqueda_total_paginas,
         "ventas_busqueda_total_resultados": ventas_busqueda_total_resultados,
         "ventas_busqueda_resultados": ventas_busqueda_resultados,
+        "ventas_busqueda_cursor": ventas_busqueda_cursor,
         "ventas_producto_seleccionado": ventas_producto_seleccionado,
     "ventas_producto_complemento": ventas_producto_complemento,
         "ventas_resultados_por_pagina": per_page,
@@ -5171,19 +7964,226 @@ def download_lista(filename):
 @app.route('/admin/sync_listas', methods=['POST','GET'])
 @login_required
 def admin_sync_listas():
-    if not (DATABASE_URL and psycopg):
+    """Encola una sincronización completa y responde enseguida (202) con el trabajo.
+    El resultado se consulta en /admin/sync_listas/estado?job=<id>.
+    """
+    if not ((DATABASE_URL and psycopg) or LISTAS_SQLITE):
         return jsonify({'ok': False, 'error': 'PostgreSQL no disponible.'}), 400
     try:
-        resumen = sync_listas_to_db()
-        if isinstance(resumen, dict) and resumen.get('error'):
-            return jsonify({'ok': False, 'error': resumen.get('error'), 'resumen': resumen}), 400
-        return jsonify({'ok': True, 'resumen': resumen})
+        job = encolar_sync_listas('admin', forzar=True)
+        return jsonify({
+            'ok': True,
+            'job': job,
+            'estado_url': url_for('admin_sync_listas_estado', job=job['id']),
+        }), 202
     except Exception as exc:
         log_debug('admin_sync_listas: error', exc)
         err_text = f"{type(exc).__name__}: {exc}\n" + traceback.format_exc(limit=3)
         return jsonify({'ok': False, 'error': err_text}), 500
 
 
+@app.route('/admin/sync_listas/estado', methods=['GET'])
+@login_required
+def admin_sync_listas_estado():
+    job_id = request.args.get('job', '').strip() or None
+    estado = sync_listas_estado(job_id)
+    if job_id and estado.get('job') is None:
+        return jsonify({'ok': False, 'error': f'Trabajo {job_id} no encontrado.', **estado}), 404
+    return jsonify({'ok': True, **estado})
+
+
+# --- CÓDIGOS DE BARRAS APRENDIDOS ---
+# Cuando un escaneo resuelve a un único producto se guarda codigo_barras -> (proveedor_key, codigo):
+# el siguiente escaneo del mismo código va directo a ese producto, sin generar variantes ni buscarlas.
+# Con listas en DB viven en codigos_barras_aprendidos y con snapshots (sin DB) en memoria del proceso.
+# Cualquier carga que cambie filas los descarta todos: el producto nuevo puede ser de otro proveedor.
+BARCODE_APRENDIDOS = os.getenv('BARCODE_APRENDIDOS', '1').strip().lower() in ('1', 'true', 'yes', 'y')
+_BARCODE_APRENDIDOS_MEM = {}  # sin DB: codigo_barras -> (proveedor_key, codigo)
+_BARCODE_APRENDIDOS_LOCK = threading.Lock()
+_BARCODE_APRENDIDOS_STATS = {'aciertos': 0, 'fallos': 0, 'guardados': 0, 'descartados': 0}
+
+
+def barcode_aprendidos_activo() -> bool:
+    return BARCODE_APRENDIDOS and (LISTAS_DB or snapshots_segmentos() is not None)
+
+
+def barcode_aprendidos_obtener(codigos_barras) -> dict:
+    """{codigo_barras: (proveedor_key, codigo)} de los códigos de barras aprendidos (una sola consulta)."""
+    codigos_barras = [c for c in dict.fromkeys(codigos_barras) if c]
+    if not codigos_barras:
+        return {}
+    encontrados = {}
+    try:
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                rows = conn.execute(
+                    "SELECT codigo_barras, proveedor_key, codigo FROM codigos_barras_aprendidos "
+                    f"WHERE codigo_barras IN ({', '.join('?' * len(codigos_barras))})", codigos_barras
+                ).fetchall()
+            encontrados = {r[0]: (r[1], r[2]) for r in rows}
+        elif LISTAS_DB:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "SELECT codigo_barras, proveedor_key, codigo FROM codigos_barras_aprendidos WHERE codigo_barras = ANY(%s)",
+                    (codigos_barras,)
+                )
+                encontrados = {r['codigo_barras']: (r['proveedor_key'], r['codigo']) for r in cur.fetchall()}
+        else:
+            with _BARCODE_APRENDIDOS_LOCK:
+                encontrados = {c: _BARCODE_APRENDIDOS_MEM[c] for c in codigos_barras if c in _BARCODE_APRENDIDOS_MEM}
+    except Exception as exc:
+        log_debug('barcode_aprendidos_obtener: error', exc)
+        return {}
+    with _BARCODE_APRENDIDOS_LOCK:
+        _BARCODE_APRENDIDOS_STATS['aciertos'] += len(encontrados)
+        _BARCODE_APRENDIDOS_STATS['fallos'] += len(codigos_barras) - len(encontrados)
+    return encontrados
+
+
+def barcode_aprendido_obtener(codigo_barras: str):
+    """(proveedor_key, codigo) aprendido para el código de barras, o None."""
+    return barcode_aprendidos_obtener([codigo_barras]).get(codigo_barras)
+
+
+def barcode_aprendidos_guardar(aprendidos: dict):
+    """Guarda {codigo_barras: (proveedor_key, codigo)}."""
+    params = [(cb, pk, codigo) for cb, (pk, codigo) in aprendidos.items()]
+    if not params:
+        return
+    try:
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO codigos_barras_aprendidos (codigo_barras, proveedor_key, codigo) VALUES (?,?,?)",
+                    params
+                )
+        elif LISTAS_DB:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.executemany(
+                    """
+                    INSERT INTO codigos_barras_aprendidos (codigo_barras, proveedor_key, codigo) VALUES (%s,%s,%s)
+                    ON CONFLICT (codigo_barras) DO UPDATE
+                    SET proveedor_key = EXCLUDED.proveedor_key, codigo = EXCLUDED.codigo, created_at = NOW()
+                    """,
+                    params
+                )
+        else:
+            with _BARCODE_APRENDIDOS_LOCK:
+                _BARCODE_APRENDIDOS_MEM.update(aprendidos)
+        with _BARCODE_APRENDIDOS_LOCK:
+            _BARCODE_APRENDIDOS_STATS['guardados'] += len(params)
+    except Exception as exc:
+        log_debug('barcode_aprendidos_guardar: error', exc)
+
+
+def barcode_aprendido_guardar(codigo_barras: str, proveedor_key: str, codigo: str):
+    barcode_aprendidos_guardar({codigo_barras: (proveedor_key, codigo)})
+
+
+def barcode_aprendido_olvidar(codigo_barras: str = None, proveedor_key: str = None, todos: bool = False):
+    """Descarta un código de barras aprendido, todos los de un proveedor o (todos=True) todos."""
+    columna, valor = ('codigo_barras', codigo_barras) if codigo_barras else ('proveedor_key', proveedor_key)
+    if not valor and not todos:
+        return
+    where, params = ('', ()) if todos else (f" WHERE {columna}=%s", (valor,))
+    try:
+        if LISTAS_SQLITE:
+            with get_sqlite_conn() as conn:
+                conn.execute("DELETE FROM codigos_barras_aprendidos" + where.replace('%s', '?'), params)
+        elif LISTAS_DB:
+            with get_pg_conn() as conn, conn.cursor() as cur:
+                cur.execute("DELETE FROM codigos_barras_aprendidos" + where, params)
+        else:
+            with _BARCODE_APRENDIDOS_LOCK:
+                if todos:
+                    _BARCODE_APRENDIDOS_MEM.clear()
+                elif codigo_barras:
+                    _BARCODE_APRENDIDOS_MEM.pop(codigo_barras, None)
+                else:
+                    for clave in [k for k, v in _BARCODE_APRENDIDOS_MEM.items() if v[0] == proveedor_key]:
+                        del _BARCODE_APRENDIDOS_MEM[clave]
+        with _BARCODE_APRENDIDOS_LOCK:
+            _BARCODE_APRENDIDOS_STATS['descartados'] += 1
+    except Exception as exc:
+        log_debug('barcode_aprendido_olvidar: error', exc)
+
+
+def buscar_producto_aprendido(proveedor_key: str, codigo: str) -> list:
+    """Filas (formato de buscar_productos_por_codigos_multiples) del producto aprendido."""
+    return [
+        r for r in buscar_productos_por_codigos_multiples([codigo], proveedor_key)
+        if r.get('proveedor_key') == proveedor_key and r.get('codigo') == codigo
+    ]
+
+
+def barcode_aprendidos_stats():
+    with _BARCODE_APRENDIDOS_LOCK:
+        return dict(_BARCODE_APRENDIDOS_STATS, activo=BARCODE_APRENDIDOS, en_memoria=len(_BARCODE_APRENDIDOS_MEM))
+
+
+def codigos_barras_ambiguos(limite: int = 500) -> list:
+    """Claves de código de barras que corresponden a más de un producto (proveedor + código distintos).
+    Un escaneo que cae en una de estas claves devuelve varios productos y hay que elegir a mano.
+    Devuelve [{'clave', 'productos': [{'proveedor_key', 'codigo'}]}], las más repetidas primero.
+    """
+    por_clave = {}
+    segmentos = _catalogo_segmentos()
+    if segmentos is not None:
+        for seg in segmentos.values():
+            cols = seg['cols']
+            for clave, filas in _catalogo_indice_barras(seg).items():
+                destino = por_clave.setdefault(clave, set())
+                for i in filas:
+                    destino.add((cols['proveedor_key'][i], cols['codigo'][i]))
+    elif LISTAS_SQLITE:
+        with get_sqlite_conn() as conn:
+            rows = conn.execute(
+                """
+                SELECT DISTINCT clave_barras, proveedor_key, codigo FROM productos_listas
+                WHERE clave_barras IN (
+                    SELECT clave_barras FROM productos_listas WHERE clave_barras IS NOT NULL
+                    GROUP BY clave_barras HAVING COUNT(DISTINCT proveedor_key || '|' || codigo) > 1
+                )
+                """
+            ).fetchall()
+        for r in rows:
+            por_clave.setdefault(r[0], set()).add((r[1], r[2]))
+    elif LISTAS_DB:
+        with get_pg_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT DISTINCT clave_barras, proveedor_key, codigo FROM productos_listas
+                WHERE clave_barras IN (
+                    SELECT clave_barras FROM productos_listas WHERE clave_barras IS NOT NULL
+                    GROUP BY clave_barras HAVING COUNT(DISTINCT (proveedor_key, codigo)) > 1
+                )
+                """
+            )
+            for r in cur.fetchall():
+                por_clave.setdefault(r['clave_barras'], set()).add((r['proveedor_key'], r['codigo']))
+    ambiguos = [
+        {'clave': clave, 'productos': [{'proveedor_key': k, 'codigo': c} for k, c in sorted(productos)]}
+        for clave, productos in por_clave.items() if len(productos) > 1
+    ]
+    ambiguos.sort(key=lambda a: (-len(a['productos']), a['clave']))
+    return ambiguos[:limite]
+
+
+@app.route('/admin/codigos_barras/ambiguos', methods=['GET'])
+@login_required
+def admin_codigos_barras_ambiguos():
+    try:
+        limite = int(request.args.get('limite', 500))
+    except ValueError:
+        limite = 500
+    try:
+        ambiguos = codigos_barras_ambiguos(limite)
+        return jsonify({'ok': True, 'total': len(ambiguos), 'ambiguos': ambiguos})
+    except Exception as exc:
+        log_debug('admin_codigos_barras_ambiguos: error', exc)
+        return jsonify({'ok': False, 'error': str(exc)}), 500
+
+
 def extraer_codigo_de_barras(codigo_barras: str, proveedor_filtro: str = '') -> list:
     """
     Extrae múltiples variantes de código de producto desde un código de barras.
@@ -5230,13 +8230,13 @@ def extraer_codigo_de_barras(codigo_barras: str, proveedor_filtro: str = '') ->
             # Patrón 1: Con sufijo .1 (posiciones 7-10, índices 6-9)
             if longitud >= 10:
                 segmento1 = codigo_limpio[6:10]  # Posiciones 7-10
-                for prefijo in ['992', '993', '994', '995', '996', '997', '998']:
+                for prefijo in BARCODE_PREFIJOS_CROSSMASTER:
                     variantes.append(f"{prefijo}{segmento1}.1")
             
             # Patrón 2: Sin sufijo (posiciones 8-11, índices 7-10)
             if longitud >= 11:
                 segmento2 = codigo_limpio[7:11]  # Posiciones 8-11
-                for prefijo in ['992', '993', '994', '995', '996', '997', '998']:
+                for prefijo in BARCODE_PREFIJOS_CROSSMASTER:
                     variantes.append(f"{prefijo}{segmento2}")
         
         # Si no es 12 dígitos, aplicar lógica estándar después
@@ -5270,11 +8270,11 @@ def extraer_codigo_de_barras(codigo_barras: str, proveedor_filtro: str = '') ->
             # También probar lógica Crossmaster automáticamente
             if longitud >= 10:
                 segmento1 = codigo_limpio[6:10]
-                for prefijo in ['992', '993', '994', '995', '996', '997', '998']:
+                for prefijo in BARCODE_PREFIJOS_CROSSMASTER:
                     variantes.append(f"{prefijo}{segmento1}.1")
             if longitud >= 11:
                 segmento2 = codigo_limpio[7:11]
-                for prefijo in ['992', '993', '994', '995', '996', '997', '998']:
+                for prefijo in BARCODE_PREFIJOS_CROSSMASTER:
                     variantes.append(f"{prefijo}{segmento2}")
         
         elif longitud == 10:
@@ -5307,6 +8307,103 @@ def extraer_codigo_de_barras(codigo_barras: str, proveedor_filtro: str = '') ->
     return variantes_unicas
 
 
+def resolver_codigos_barras(codigos_barras: list, proveedor: str = '') -> dict:
+    """Resuelve un lote de códigos con el criterio de /busqueda_codigos (aprendido, código tal cual y, si no hubo
+    resultados, variantes de código de barras), pero con una sola búsqueda para todos los candidatos del lote.
+    La coincidencia por código usa el criterio de buscar_productos_por_codigos_multiples; el código tal cual, si es
+    numérico, también coincide ignorando ceros a la izquierda, como en buscar_productos_por_codigo_exacto.
+    Devuelve {codigo: {'fuente': 'aprendido' | 'codigo' | 'variantes' | None, 'resultados': [...]}}.
+    """
+    planes = {}
+    for cb in dict.fromkeys(c.strip() for c in codigos_barras if c and c.strip()):
+        if len(cb) < 4:
+            continue
+        filtro = proveedor
+        if MODO_BARCODE_INTELIGENTE and not proveedor and cb.isdigit() and len(cb) == 12:
+            filtro = 'Crossmaster'
+        es_codigo_barras = cb.isdigit() and len(cb) >= 12
+        planes[cb] = {
+            'filtro_key': provider_name_to_key(filtro) if filtro else '',
+            'es_codigo_barras': es_codigo_barras,
+            'variantes': extraer_codigo_de_barras(cb, filtro) if es_codigo_barras else [],
+        }
+
+    aprendidos = {}
+    if barcode_aprendidos_activo():
+        prov_key = provider_name_to_key(proveedor) if proveedor else ''
+        aprendidos = {
+            cb: par for cb, par in barcode_aprendidos_obtener([cb for cb, p in planes.items() if p['es_codigo_barras']]).items()
+            if not prov_key or par[0] == prov_key
+        }
+
+    resueltos = {cb: {'fuente': None, 'resultados': []} for cb in planes}
+    pendientes = list(planes)
+    while pendientes:
+        candidatos = set()
+        sin_ceros = set()
+        for cb in pendientes:
+            if cb in aprendidos:
+                candidatos.add(aprendidos[cb][1])
+                continue
+            candidatos.update([cb] + planes[cb]['variantes'])
+            if cb.isdigit():
+                sin_ceros.add(cb.lstrip('0'))
+        por_codigo = {}
+        por_digitos = {}
+        por_digitos_nl = {}
+        for r in buscar_productos_por_codigos_multiples(sorted(candidatos), proveedor, sorted(sin_ceros)):
+            codigo = r.get('codigo') or ''
+            digitos = ''.join(filter(str.isdigit, codigo))
+            por_codigo.setdefault(codigo, []).append(r)
+            por_digitos.setdefault(digitos, []).append(r)
+            if digitos.lstrip('0'):
+                por_digitos_nl.setdefault(digitos.lstrip('0'), []).append(r)
+
+        def coincidencias(codigos, prov_key, ignorar_ceros=False):
+            filas = []
+            vistos = set()
+            for c in codigos:
+                candidatas = por_codigo.get(c, []) + (por_digitos.get(c, []) if c.replace('.', '').isdigit() else [])
+                if ignorar_ceros and c.isdigit():
+                    candidatas += por_digitos_nl.get(c.lstrip('0'), [])
+                for r in candidatas:
+                    clave = (r.get('codigo'), r.get('proveedor_key'))
+                    if clave in vistos or (prov_key and r.get('proveedor_key') != prov_key):
+                        continue
+                    vistos.add(clave)
+                    filas.append(r)
+            return filas
+
+        reintentar = []
+        for cb in pendientes:
+            plan = planes[cb]
+            if cb in aprendidos:
+                prov_key, codigo = aprendidos.pop(cb)
+                filas = [r for r in coincidencias([codigo], prov_key) if r.get('codigo') == codigo]
+                if filas:
+                    resueltos[cb] = {'fuente': 'aprendido', 'resultados': filas}
+                else:
+                    # El producto ya no está en las listas: se busca de nuevo como siempre
+                    barcode_aprendido_olvidar(cb)
+                    reintentar.append(cb)
+                continue
+            filas = coincidencias([cb], plan['filtro_key'], ignorar_ceros=True)
+            fuente = 'codigo'
+            if not filas and plan['variantes']:
+                filas = coincidencias(plan['variantes'], plan['filtro_key'])
+                fuente = 'variantes'
+            resueltos[cb] = {'fuente': fuente if filas else None, 'resultados': filas}
+        pendientes = reintentar
+
+    if barcode_aprendidos_activo() and not proveedor:
+        barcode_aprendidos_guardar({
+            cb: (res['resultados'][0].get('proveedor_key'), res['resultados'][0].get('codigo'))
+            for cb, res in resueltos.items()
+            if planes[cb]['es_codigo_barras'] and res['fuente'] in ('codigo', 'variantes') and len(res['resultados']) == 1
+        })
+    return resueltos
+
+
 @app.route('/busqueda_codigos', methods=['GET', 'POST'])
 @login_required
 def barcode_search():
@@ -5329,16 +8426,16 @@ def barcode_search():
         proveedor_filtro = proveedor_filtro_manual
         ejecutar_busqueda = bool(barcode_input)
 
-    # Auto-sincronizar listas si están desactualizadas (solo si se usa DB para listas)
-    if LISTAS_EN_DB and DATABASE_URL and psycopg:
-        auto_sync_info = maybe_auto_sync_listas()
-        if auto_sync_info and not auto_sync_info.get('error'):
-            try:
-                archivos = auto_sync_info.get('procesados')
-                insertados = auto_sync_info.get('insertados')
-                mensaje = (mensaje or '') + ("\n" if mensaje else '') + f"🔄 Listas sincronizadas automáticamente: {archivos} archivo(s), {insertados} fila(s) insertadas."
-            except Exception:
-                pass
+    # Auto-sincronizar listas si están desactualizadas (solo si se usa DB para listas).
+    # Solo se encola la verificación: la búsqueda nunca espera a la sincronización.
+    if LISTAS_DB:
+        maybe_auto_sync_listas()
+        try:
+            actual = sync_listas_estado()['actual']
+            if actual and actual.get('fase') == 'sincronizando':
+                mensaje = (mensaje or '') + ("\n" if mensaje else '') + "🔄 Sincronizando listas en segundo plano: los resultados pueden no incluir los últimos cambios."
+        except Exception:
+            pass
 
     if ejecutar_busqueda:
         if len(barcode_input) < 4:
@@ -5364,15 +8461,29 @@ def barcode_search():
             
             # Intentar primero con el código tal como se ingresó (para códigos normales de productos)
             codigos_intentados = [codigo_limpio]
+            es_codigo_barras = barcode_input.isdigit() and len(barcode_input) >= 12
+            
+            # Código de barras ya escaneado antes con un único resultado: directo al producto
+            aprendido = None
+            if es_codigo_barras and barcode_aprendidos_activo():
+                aprendido = barcode_aprendido_obtener(codigo_limpio)
+                if aprendido and proveedor_filtro_manual and provider_name_to_key(proveedor_filtro_manual) != aprendido[0]:
+                    aprendido = None
+                if aprendido:
+                    resultados.extend(buscar_producto_aprendido(*aprendido))
+                    if not resultados:
+                        # El producto ya no está en las listas
+                        barcode_aprendido_olvidar(codigo_limpio)
+                        aprendido = None
             
             # Buscar primero con el código original
-            resultados_temp = buscar_productos_por_codigo_exacto(codigo_limpio, proveedor_filtro)
+            resultados_temp = buscar_productos_por_codigo_exacto(codigo_limpio, proveedor_filtro) if not resultados else []
             if resultados_temp:
                 resultados.extend(resultados_temp)
             
             # Si no encontró nada y parece ser un código de barras (solo dígitos, >= 12 caracteres),
             # intentar con las variantes de código de barras
-            if not resultados and barcode_input.isdigit() and len(barcode_input) >= 12:
+            if not resultados and es_codigo_barras:
                 variantes_barcode = extraer_codigo_de_barras(barcode_input, proveedor_filtro)
                 if variantes_barcode:
                     codigos_intentados.extend(variantes_barcode)
@@ -5408,13 +8519,22 @@ def barcode_search():
                     codigos_vistos.add(key)
                     resultados_unicos.append(r)
             resultados = resultados_unicos
+
+            # Un único producto (sin filtro manual de proveedor): se aprende para los próximos escaneos
+            if (es_codigo_barras and not aprendido and not proveedor_filtro_manual and len(resultados) == 1
+                    and barcode_aprendidos_activo()):
+                barcode_aprendido_guardar(codigo_limpio, resultados[0].get('proveedor_key'), resultados[0].get('codigo'))
             
             if resultados:
                 mensaje_base = f"✅ Se encontraron {len(resultados)} producto(s) con código exacto."
                 if modo_detectado:
                     mensaje_base = f"🔍 {modo_detectado}\n{mensaje_base}"
+                if aprendido:
+                    mensaje_base += " Código de barras reconocido de un escaneo anterior."
                 if len(codigos_intentados) > 1:
                     mensaje_base += f" Variantes probadas: {', '.join(codigos_intentados[:3])}{'...' if len(codigos_intentados) > 3 else ''}"
+                    if len(resultados) > 1:
+                        mensaje_base += "\n⚠️ Código de barras ambiguo: corresponde a varios productos, verificá cuál es."
                 mensaje = mensaje_base
             else:
                 mensaje_base = f"ℹ️ No se encontraron productos con código exacto."
@@ -5565,6 +8685,51 @@ def api_calculadora_calcular_manual():
         return jsonify({'error': f'No se pudo calcular: {exc}'}), 400
 
 
+def _producto_api(item) -> dict:
+    """Producto (formato de las búsquedas) como lo devuelve la API."""
+    codigo = item.get('codigo')
+    nombre = item.get('producto') or item.get('nombre') or ''
+
+    categoria = None
+    extra = item.get('extra_datos') or {}
+    if isinstance(extra, dict):
+        categoria = (
+            extra.get('Categoria')
+            or extra.get('categoria')
+            or extra.get('CATEGORIA')
+        )
+
+    precio = None
+    precios = item.get('precios') or {}
+    if isinstance(precios, dict) and precios:
+        primer_valor = next(iter(precios.values()))
+        try:
+            if primer_valor is not None and primer_valor != '':
+                precio = float(primer_valor)
+        except Exception:
+            precio = primer_valor
+
+    return {
+        'codigo': str(codigo) if codigo is not None else '',
+        'nombre': nombre,
+        'proveedor': item.get('proveedor') or '',
+        'proveedor_key': item.get('proveedor_key') or '',
+        'hoja': item.get('sheet_name') or '',
+        'iva': item.get('iva') or 'N/A',
+        'categoria': categoria,
+        'precio': precio,
+        'precios': precios if isinstance(precios, dict) else {},
+        'extra_datos': extra if isinstance(extra, dict) else {},
+    }
+
+
+def _api_search_resultados_db(q: str, proveedor_key: str = None) -> list:
+    """Respuesta de /api/search para una consulta de texto con listas en DB: los 500 primeros resultados de la
+    búsqueda avanzada, en el formato de la API y re-ordenados por relevancia."""
+    resultados_db = _buscar_productos_avanzados_ordenados(q, proveedor_key, fetch_limit=15000)[:500]
+    return ordenar_resultados_por_relevancia([_producto_api(item) for item in resultados_db], q)
+
+
 @app.route('/api/search', methods=['GET'])
 def api_search():
     if not _api_authorized():
@@ -5591,15 +8756,34 @@ def api_search():
         if not resultados_raw and solo_digitos_q:
             resultados_raw = buscar_productos_por_codigo_patron(solo_digitos_q, proveedor)
     elif tiene_letras:
-        if LISTAS_EN_DB and DATABASE_URL and psycopg:
+        if LISTAS_DB and ('page' in request.args or 'cursor' in request.args):
+            # Paginado con cursor (opcional): el cuerpo sigue siendo la lista de productos, ya ordenada, de
+            # la página pedida; el total y el cursor para pedir las siguientes van en los encabezados.
+            try:
+                page = max(1, int(request.args.get('page') or 1))
+                per_page = min(500, max(1, int(request.args.get('per_page') or 50)))
+            except ValueError:
+                return jsonify({'error': 'page y per_page deben ser números'}), 400
             proveedor_key = provider_name_to_key(proveedor) if proveedor else None
-            resultados_db, _ = buscar_productos_avanzados_db(
-                q,
-                page=1,
-                per_page=500,
-                proveedor_filter=proveedor_key
+            resultados_db, total, cursor = buscar_productos_avanzados_paginado(
+                q, page, per_page, proveedor_filter=proveedor_key, cursor=request.args.get('cursor')
             )
-            resultados_raw = resultados_db or []
+            respuesta = jsonify([_producto_api(item) for item in resultados_db])
+            respuesta.headers['X-Total-Count'] = str(total)
+            if cursor:
+                respuesta.headers['X-Search-Cursor'] = cursor
+            return respuesta
+        if LISTAS_DB:
+            # La respuesta completa (ya en formato API y ordenada) sale de la caché de búsquedas
+            proveedor_key = provider_name_to_key(proveedor) if proveedor else None
+            try:
+                return jsonify(busqueda_cache_obtener(
+                    busqueda_cache_clave(q, 'api', proveedor_key or ''),
+                    lambda: _api_search_resultados_db(q, proveedor_key)
+                ))
+            except Exception as exc:
+                log_debug('api_search: error en búsqueda avanzada', exc)
+                return jsonify([])
         else:
             # Fallback local sin DB: reutilizar listas cargadas desde Excel
             productos_excel = []
@@ -5629,7 +8813,7 @@ def api_search():
 
                 file_path = os.path.join(LISTAS_PATH, filename)
                 try:
-                    all_sheets = pd.read_excel(file_path, sheet_name=None, header=header_row_index)
+                    all_sheets = leer_excel_cacheado(file_path, header=header_row_index)
                 except Exception:
                     continue
 
@@ -5678,47 +8862,75 @@ def api_search():
     else:
         resultados_raw = buscar_productos_por_codigo_patron(q, proveedor)
 
-    resultados_api = []
+    resultados_api = [_producto_api(item) for item in resultados_raw]
+    resultados_api = ordenar_resultados_por_relevancia(resultados_api, q)
 
-    for item in resultados_raw:
-        codigo = item.get('codigo')
-        nombre = item.get('producto') or item.get('nombre') or ''
+    return jsonify(resultados_api)
 
-        categoria = None
-        extra = item.get('extra_datos') or {}
-        if isinstance(extra, dict):
-            categoria = (
-                extra.get('Categoria')
-                or extra.get('categoria')
-                or extra.get('CATEGORIA')
-            )
 
-        precio = None
-        precios = item.get('precios') or {}
-        if isinstance(precios, dict) and precios:
-            primer_valor = next(iter(precios.values()))
-            try:
-                if primer_valor is not None and primer_valor != '':
-                    precio = float(primer_valor)
-            except Exception:
-                precio = primer_valor
+BARCODE_LOTE_MAX = int(os.getenv('BARCODE_LOTE_MAX', '5000'))  # códigos por pedido a /api/codigos_barras
+BARCODE_LOTE_TRAMO = int(os.getenv('BARCODE_LOTE_TRAMO', '500'))  # códigos por búsqueda al responder en NDJSON
 
-        resultados_api.append({
-            'codigo': str(codigo) if codigo is not None else '',
-            'nombre': nombre,
-            'proveedor': item.get('proveedor') or '',
-            'proveedor_key': item.get('proveedor_key') or '',
-            'hoja': item.get('sheet_name') or '',
-            'iva': item.get('iva') or 'N/A',
-            'categoria': categoria,
-            'precio': precio,
-            'precios': precios if isinstance(precios, dict) else {},
-            'extra_datos': extra if isinstance(extra, dict) else {},
-        })
 
-    resultados_api = ordenar_resultados_por_relevancia(resultados_api, q)
+@app.route('/api/codigos_barras', methods=['POST'])
+def api_codigos_barras():
+    """Búsqueda de un lote de códigos de barras (inventarios, lectores).
+    Cuerpo JSON {"codigos": [...], "proveedor": "..."} (o una lista), o texto plano con un código por línea.
+    Responde un objeto por código, en el orden recibido; con ?formato=ndjson (o Accept: application/x-ndjson)
+    los devuelve de a uno por línea a medida que se resuelven, en tramos de BARCODE_LOTE_TRAMO códigos.
+    """
+    if not _api_authorized():
+        return _api_unauthorized_response()
 
-    return jsonify(resultados_api)
+    datos = request.get_json(silent=True)
+    proveedor = (request.args.get('proveedor') or '').strip()
+    if isinstance(datos, dict):
+        codigos = datos.get('codigos') or []
+        if datos.get('proveedor') is not None and not isinstance(datos.get('proveedor'), str):
+            return jsonify({'error': '"proveedor" debe ser un texto.'}), 400
+        proveedor = (datos.get('proveedor') or proveedor).strip()
+    elif isinstance(datos, list):
+        codigos = datos
+    else:
+        codigos = request.get_data(as_text=True).splitlines()
+    if not isinstance(codigos, list):
+        return jsonify({'error': '"codigos" debe ser una lista.'}), 400
+    codigos = [str(c).strip() for c in codigos if c is not None and str(c).strip()]
+    if not codigos:
+        return jsonify({'error': 'No se recibieron códigos.'}), 400
+    if len(codigos) > BARCODE_LOTE_MAX:
+        return jsonify({'error': f'Máximo {BARCODE_LOTE_MAX} códigos por pedido.'}), 413
+
+    ndjson = (request.args.get('formato') or '').lower() == 'ndjson' or 'application/x-ndjson' in (request.headers.get('Accept') or '')
+
+    def items(tramo):
+        for inicio in range(0, len(codigos), tramo):
+            parte = codigos[inicio:inicio + tramo]
+            resueltos = resolver_codigos_barras(parte, proveedor)
+            for indice, cb in enumerate(parte, start=inicio):
+                res = resueltos.get(cb) or {'fuente': None, 'resultados': []}
+                yield {
+                    'indice': indice,
+                    'codigo_barras': cb,
+                    'fuente': res['fuente'],
+                    'ambiguo': len(res['resultados']) > 1,
+                    'resultados': [_producto_api(r) for r in res['resultados']],
+                }
+
+    try:
+        if ndjson:
+            lineas = (json.dumps(item, ensure_ascii=False, default=str) + '\n' for item in items(max(1, BARCODE_LOTE_TRAMO)))
+            return Response(stream_with_context(lineas), mimetype='application/x-ndjson')
+        resultados = list(items(len(codigos)))
+        return jsonify({
+            'total': len(resultados),
+            'encontrados': sum(1 for r in resultados if r['resultados']),
+            'ambiguos': sum(1 for r in resultados if r['ambiguo']),
+            'resultados': resultados,
+        })
+    except Exception as exc:
+        log_debug('api_codigos_barras: error', exc)
+        return jsonify({'error': f'No se pudieron buscar los códigos: {exc}'}), 500
 
 
 def _collect_api_proveedores():
@@ -5736,27 +8948,28 @@ def _collect_api_proveedores():
     except Exception:
         pass
 
-    if LISTAS_EN_DB and DATABASE_URL and psycopg:
+    if LISTAS_DB:
         try:
-            with get_pg_conn() as conn, conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT DISTINCT COALESCE(proveedor_key,''), COALESCE(proveedor_nombre,'')
-                    FROM productos_listas
-                    """
-                )
-                for row in (cur.fetchall() or []):
-                    if isinstance(row, dict):
-                        key = (row.get('coalesce') or row.get('proveedor_key') or '').strip()
-                        nombre = (row.get('coalesce_1') or row.get('proveedor_nombre') or '').strip()
-                    else:
-                        key = (row[0] or '').strip() if len(row) > 0 else ''
-                        nombre = (row[1] or '').strip() if len(row) > 1 else ''
+            sql_proveedores = "SELECT DISTINCT COALESCE(proveedor_key,''), COALESCE(proveedor_nombre,'') FROM productos_listas"
+            if LISTAS_SQLITE:
+                with get_sqlite_conn() as conn:
+                    rows = conn.execute(sql_proveedores).fetchall()
+            else:
+                with get_pg_conn() as conn, conn.cursor() as cur:
+                    cur.execute(sql_proveedores)
+                    rows = cur.fetchall() or []
+            for row in rows:
+                if isinstance(row, dict):
+                    key = (row.get('coalesce') or row.get('proveedor_key') or '').strip()
+                    nombre = (row.get('coalesce_1') or row.get('proveedor_nombre') or '').strip()
+                else:
+                    key = (row[0] or '').strip() if len(row) > 0 else ''
+                    nombre = (row[1] or '').strip() if len(row) > 1 else ''
 
-                    if key and nombre:
-                        prov_map[key] = nombre
-                    elif key and key not in prov_map:
-                        prov_map[key] = get_proveedor_display_name(key)
+                if key and nombre:
+                    prov_map[key] = nombre
+                elif key and key not in prov_map:
+                    prov_map[key] = get_proveedor_display_name(key)
         except Exception as exc:
             log_debug('_collect_api_proveedores(DB): error', exc)
     else:
@@ -5819,15 +9032,32 @@ def health():
                             productos_en_db = row[0] if row else 0
         except Exception as e:
             productos_en_db = f'error: {e}'
+    elif LISTAS_SQLITE:
+        try:
+            with get_sqlite_conn() as conn:
+                productos_en_db = conn.execute('SELECT COUNT(*) FROM productos_listas').fetchone()[0]
+        except Exception as e:
+            productos_en_db = f'error: {e}'
     
     return {
         'status': 'ok',
         'storage': modo_storage,
         'listas_en_db': LISTAS_EN_DB,
+        'listas_sqlite': {'activo': LISTAS_SQLITE, 'fts': _SQLITE_LISTAS_FTS['activo']},
         'database_url_configured': bool(DATABASE_URL),
         'productos_en_db': productos_en_db,
         'proveedores': prov_count,
         'historial_count': histo_len,
+        'pg_pool': pg_pool_stats(),
+        'catalogo': catalogo_stats(),
+        'sync_listas': sync_listas_estado(),
+        'listas_estado': listas_estado_stats(),
+        'listas_watcher': listas_watcher_stats(),
+        'excel_cache': excel_cache_stats(),
+        'snapshots': snapshots_stats(),
+        'barcode_aprendidos': barcode_aprendidos_stats(),
+        'busqueda_cursores': busqueda_cursores_stats(),
+        'busqueda_cache': busqueda_cache_stats(),
         'debug': DEBUG_LOG
     }, 200
 
@@ -5889,6 +9119,8 @@ def pick_port() -> int:
     return 5000
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos de la sincronización en ejecutables congelados (Windows)
+    multiprocessing.freeze_support()
     # Elegir automáticamente un puerto disponible cercano a 5000 (o PORT si está definido)
     port = pick_port()
     # No se abre navegador automáticamente (evitar 127.0.0.1); habilitar con OPEN_BROWSER=1
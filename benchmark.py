@@ -0,0 +1,496 @@
+"""Benchmarks y verificaciones de equivalencia de las rutas optimizadas de app_v5.
+
+Uso:
+    python benchmark.py ingesta [carpeta]   # ingesta columnar vs recorrido con iterrows (default: extras/)
+    python benchmark.py mapeo [carpeta]     # mapeo de filas de productos_listas a productos de búsqueda
+    python benchmark.py normalize [carpeta] # normalize_text con tablas de traducción vs NFD + re.sub
+
+No necesita PostgreSQL: trabaja sobre los Excel de ejemplo y compara las filas que se insertarían
+o los productos que devolverían las búsquedas.
+"""
+import gc
+import os
+import random
+import re
+import string
+import sys
+import time
+import json
+import unicodedata
+from decimal import Decimal
+
+import pandas as pd
+
+import app_v5 as app
+
+
+# ---------------------------------------------------------------------------
+# Ingesta de hojas
+# ---------------------------------------------------------------------------
+def _ingesta_referencia(df, cfg, provider_key, sheet_name):
+    """Recorrido original de sync_listas_to_db (df.iterrows), conservado como referencia."""
+    df_columns = list(df.columns)
+    codigo_col = app._find_first_col(df_columns, cfg.get('codigo', []))
+    nombre_col = app._find_first_col(df_columns, cfg.get('nombre', []))
+    iva_col = app._find_first_col(df_columns, cfg.get('iva', []))
+    precio_canon_col = app._find_first_col(df_columns, cfg.get('precio_canon', []))
+    precios_extra_alias = cfg.get('precios_extra', []) or []
+    extra_cols = [c for c in df_columns if app.normalize_text(str(c)) in [app.normalize_text(x) for x in precios_extra_alias]]
+    cantidad_col = app._find_first_col(df_columns, cfg.get('extras', [])) if cfg.get('extras') else None
+    if not nombre_col:
+        return None
+
+    filas = []
+    for row_number, (_, fila) in enumerate(df.iterrows(), start=1):
+        code = ''
+        if codigo_col:
+            raw_code = fila.get(codigo_col)
+            if raw_code is not None and not pd.isna(raw_code):
+                code = str(raw_code).strip()
+                if code.endswith('.0'):
+                    code = code[:-2] or code
+        raw_name = fila.get(nombre_col)
+        name = ''
+        if raw_name is not None and not pd.isna(raw_name):
+            name = str(raw_name).strip()
+        if not code and not name:
+            continue
+        if not name and code:
+            name = code
+        if not code and name:
+            code = f"SIN-COD-{provider_key}-{app.normalize_text(sheet_name)}-{row_number}"
+
+        price_val = None
+        if precio_canon_col and pd.notna(fila.get(precio_canon_col)):
+            price_val = app.parse_price_value(fila.get(precio_canon_col))
+
+        iva_text = None
+        if iva_col and pd.notna(fila.get(iva_col)):
+            iva_text = app._format_iva_text(fila.get(iva_col))
+
+        precios_dict = {}
+        if provider_key == 'brementools':
+            for alias in ['precio de lista', 'precio lista', 'precio neto', 'precioneto', 'precio neto unitario', 'precionetunitario']:
+                col = app._find_first_col(df_columns, [alias])
+                if col and pd.notna(fila.get(col)):
+                    v = app.parse_price_value(fila.get(col))
+                    if v is not None:
+                        precios_dict[alias] = v
+        else:
+            for col in extra_cols:
+                if pd.notna(fila.get(col)):
+                    v = app.parse_price_value(fila.get(col))
+                    if v is not None:
+                        precios_dict[str(col)] = v
+
+        extra = {}
+        try:
+            categoria_col = app._find_first_col(df_columns, ['categoria'])
+            if categoria_col and pd.notna(fila.get(categoria_col)):
+                extra['Categoria'] = str(fila.get(categoria_col)).strip()
+        except Exception:
+            pass
+        if provider_key == 'brementools' and cantidad_col:
+            try:
+                raw_qty = fila.get(cantidad_col)
+                if pd.notna(raw_qty):
+                    qty_val = None
+                    if isinstance(raw_qty, (int, float)):
+                        qty_val = raw_qty
+                    else:
+                        try:
+                            qty_val_num = float(str(raw_qty).strip().replace(',', '.'))
+                            qty_val = int(qty_val_num) if qty_val_num.is_integer() else qty_val_num
+                        except Exception:
+                            qty_val = str(raw_qty).strip()
+                    if qty_val is not None:
+                        extra['Cantidad'] = qty_val
+            except Exception:
+                pass
+        codigo_digitos = ''.join(filter(str.isdigit, code))
+        nombre_pulg, nombre_norm, medidas, tokens = app.atributos_busqueda_producto(name, code)
+        codigo_norm = app.normalize_text(code)
+        filas.append((
+            code, codigo_digitos, codigo_norm,
+            name, nombre_norm,
+            float(price_val) if price_val is not None else None,
+            iva_text,
+            json.dumps(precios_dict, ensure_ascii=False),
+            json.dumps(extra, ensure_ascii=False),
+            nombre_pulg, json.dumps(medidas), tokens
+        ))
+    return filas
+
+
+def _hojas_de_carpeta(carpeta):
+    """[(archivo, provider_key, cfg, hoja, df)] para los Excel de la carpeta que el sync reconocería."""
+    prov_cfg = app._listas_provider_configs()
+    hojas = []
+    for filename in sorted(os.listdir(carpeta)):
+        if not filename.lower().endswith(('.xlsx', '.xls')):
+            continue
+        provider_key = app.provider_key_from_filename(filename)
+        cfg = prov_cfg.get(provider_key)
+        if not cfg:
+            try:
+                provider_key = app.provider_name_to_key(app.inferir_nombre_base_archivo(filename, app.proveedores))
+                cfg = prov_cfg.get(provider_key)
+            except Exception:
+                cfg = None
+        if not cfg:
+            print(f'  {filename}: proveedor no reconocido, se omite')
+            continue
+        sheets = pd.read_excel(os.path.join(carpeta, filename), sheet_name=None, header=cfg.get('header', 0))
+        for sheet_name, df in sheets.items():
+            if df is not None and not df.empty:
+                hojas.append((filename, provider_key, cfg, sheet_name, df))
+    return hojas
+
+
+def _medir(fn, hojas, repeticiones):
+    mejor = None
+    salida = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = [fn(df, cfg, key, hoja) for _, key, cfg, hoja, df in hojas]
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, salida
+
+
+def bench_ingesta(carpeta=None, repeticiones=3):
+    carpeta = carpeta or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extras')
+    print(f'Leyendo Excel de {carpeta} ...')
+    hojas = _hojas_de_carpeta(carpeta)
+    t_ref, ref = _medir(_ingesta_referencia, hojas, repeticiones)
+    t_col, col = _medir(app.procesar_hoja_listas, hojas, repeticiones)
+
+    filas = 0
+    diferencias = 0
+    for (archivo, _, _, hoja, _), a, b in zip(hojas, ref, col):
+        filas += len(a or [])
+        if a != b:
+            diferencias += 1
+            n_a = len(a) if a is not None else None
+            n_b = len(b) if b is not None else None
+            primera = next((i for i, (x, y) in enumerate(zip(a or [], b or [])) if x != y), None)
+            print(f'  DIFERENCIA {archivo} / {hoja}: {n_a} vs {n_b} filas, primera fila distinta: {primera}')
+            if primera is not None:
+                print(f'    referencia: {a[primera]}')
+                print(f'    columnar:   {b[primera]}')
+
+    print(f'Hojas: {len(hojas)} | filas: {filas}')
+    print(f'iterrows:  {t_ref:8.3f} s  ({filas / t_ref:10.0f} filas/s)')
+    print(f'columnar:  {t_col:8.3f} s  ({filas / t_col:10.0f} filas/s)  x{t_ref / t_col:.2f}')
+    print('Equivalencia:', 'OK' if not diferencias else f'{diferencias} hoja(s) con diferencias')
+    return diferencias == 0
+
+
+# ---------------------------------------------------------------------------
+# Mapeo de filas de productos_listas a productos de búsqueda
+# ---------------------------------------------------------------------------
+_ETIQUETAS_REFERENCIA = {'brementools': 'Precio de Venta', 'crossmaster': 'Precio Lista', 'chiesa': 'Pr.Unit'}
+
+
+def _precios_referencia(prov_key, precio_db, precios_json, normalizar):
+    """Armado de precios que estaba copiado en cada búsqueda (if/elif por proveedor y por clave)."""
+    precios_a_mostrar = {}
+    if precio_db is not None and precio_db > 0:
+        precio_float = float(precio_db) if hasattr(precio_db, '__float__') else precio_db
+        if prov_key == 'brementools':
+            precios_a_mostrar['Precio de Venta'] = precio_float
+        elif prov_key == 'crossmaster':
+            precios_a_mostrar['Precio Lista'] = precio_float
+        elif prov_key == 'berger':
+            precios_a_mostrar['Precio'] = precio_float
+        elif prov_key == 'chiesa':
+            precios_a_mostrar['Pr.Unit'] = precio_float
+        elif prov_key == 'cachan':
+            precios_a_mostrar['Precio'] = precio_float
+        else:
+            precios_a_mostrar['Precio'] = precio_float
+    if precios_json:
+        for k, v in precios_json.items():
+            if v is None or v == '':
+                continue
+            if not normalizar:
+                try:
+                    precios_a_mostrar[k] = float(v) if hasattr(v, '__float__') else v
+                except Exception:
+                    precios_a_mostrar[k] = v
+                continue
+            v_float = float(v) if hasattr(v, '__float__') else v
+            k_lower = str(k).lower().strip().replace('  ', ' ')
+            if k_lower in ['precio neto', 'precioneto']:
+                k_display = 'Precio Neto'
+            elif k_lower in ['precio neto unitario', 'precionetunitario']:
+                k_display = 'Precio Neto Unitario'
+            elif k_lower in ['precio de lista', 'precio lista', 'preciolista', 'preciodelista']:
+                k_display = 'Precio de Lista'
+            else:
+                k_display = k.title() if isinstance(k, str) else str(k)
+            if k_display not in precios_a_mostrar:
+                precios_a_mostrar[k_display] = v_float
+    return precios_a_mostrar
+
+
+def _json_referencia(valor):
+    valor = valor or {}
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except Exception:
+            valor = {}
+    return valor
+
+
+def _mapeo_referencia(formato, r):
+    """Mapeo que hacían por separado buscar_productos_por_codigos_multiples, _por_codigo_exacto,
+    _por_codigo_patron y buscar_productos_avanzados_db, conservado como referencia."""
+    prov_key = r.get('proveedor_key')
+    precio = r.get('precio')
+    precios_json = _json_referencia(r.get('precios'))
+    extra_json = _json_referencia(r.get('extra_datos'))
+    if formato == 'avanzado':
+        precios_calculados = {}
+        if prov_key == 'chiesa' and precio is not None:
+            base = float(precio) if hasattr(precio, '__float__') else precio
+            precios_calculados['Costo (-4% extra)'] = round(base * 0.96, 4)
+            precios_calculados['Costo (+4% extra)'] = round(base * 1.04, 4)
+        codigo = r.get('codigo')
+        return {
+            'codigo': str(codigo) if codigo is not None else '',
+            'nombre': r.get('nombre') or '',
+            'precio': float(precio) if precio is not None else None,
+            'precio_valido': precio is not None and precio > 0,
+            'precios': _precios_referencia(prov_key, precio, precios_json, True),
+            'proveedor': r.get('proveedor_nombre') or prov_key or '',
+            'proveedor_key': prov_key or '',
+            'extra_datos': extra_json or {},
+            'iva': r.get('iva') or 'N/A',
+            'precios_calculados': precios_calculados,
+            'fuente': 'DB'
+        }
+    prov_name = r.get('proveedor_nombre') or app.get_proveedor_display_name(prov_key)
+    hoja = r.get('hoja')
+    codigo_raw = r.get('codigo') or ''
+    nombre_raw = r.get('nombre') or ''
+    if formato == 'codigo':
+        iva_db = r.get('iva')
+        return {
+            'codigo': codigo_raw,
+            'producto': nombre_raw,
+            'proveedor': f"{prov_name} (Hoja: {hoja})" if hoja else prov_name,
+            'proveedor_key': prov_key,
+            'sheet_name': hoja or '',
+            'iva': iva_db if iva_db is not None else 'N/A',
+            'precios': _precios_referencia(prov_key, precio, precios_json, False),
+            'extra_datos': extra_json,
+            'precios_calculados': {},
+            'fuente': 'DB'
+        }
+    producto = {
+        'codigo': str(codigo_raw),
+        'producto': r.get('nombre_pulgadas') or app.formatear_pulgadas(nombre_raw),
+        'proveedor': f"{prov_name} (Hoja: {hoja})",
+        'proveedor_key': prov_key,
+        'sheet_name': hoja,
+        'iva': r.get('iva') or 'N/A',
+        'precios': _precios_referencia(prov_key, precio, precios_json, formato == 'exacto'),
+        'extra_datos': extra_json,
+        'precios_calculados': {},
+        'fuente': 'DB'
+    }
+    if formato == 'patron':
+        producto['codigo_coincidencia'] = ''.join(filter(str.isdigit, str(codigo_raw)))
+        return producto
+    if r.get('archivo'):
+        producto['archivo'] = r['archivo']
+    if r.get('mtime') is not None:
+        try:
+            producto['fecha_archivo'] = app.ts_to_local(float(r['mtime'])).strftime('%d/%m/%Y %H:%M')
+        except Exception:
+            producto['fecha_archivo'] = None
+    return producto
+
+
+_MAPEOS = {
+    'codigo': app._producto_fila_codigo,
+    'exacto': app._producto_fila_exacto,
+    'patron': app._producto_fila_patron,
+    'avanzado': app._producto_fila_avanzado,
+}
+
+
+def _filas_de_busqueda(hojas, carpeta):
+    """Filas como las devuelve cada backend: SQLite/catálogo (JSON en texto, precio float) y
+    PostgreSQL (JSONB ya parseado, precio Decimal)."""
+    sqlite, postgres = [], []
+    for archivo, key, cfg, hoja, df in hojas:
+        mtime = os.path.getmtime(os.path.join(carpeta, archivo))
+        nombre_prov = app.get_proveedor_display_name(key)
+        for fila in app.procesar_hoja_listas(df, cfg, key, hoja) or []:
+            r = {
+                'proveedor_key': key, 'proveedor_nombre': nombre_prov, 'archivo': archivo, 'hoja': hoja,
+                'codigo': fila[0], 'nombre': fila[3], 'precio': fila[5], 'iva': fila[6],
+                'precios': fila[7], 'extra_datos': fila[8], 'mtime': mtime, 'nombre_pulgadas': fila[9],
+            }
+            sqlite.append(r)
+            pg = dict(r, precios=json.loads(fila[7]), extra_datos=json.loads(fila[8]))
+            pg['precio'] = Decimal(repr(fila[5])) if fila[5] is not None else None
+            postgres.append(pg)
+    return {'sqlite': sqlite, 'postgres': postgres}
+
+
+def _medir_mapeo(formato, filas, repeticiones):
+    """(tiempo referencia, tiempo nuevo, salidas): las dos versiones se alternan en cada repetición para que
+    el ruido de la máquina afecte a ambas por igual, y sin el GC, cuyas pasadas con tantos dicts nuevos dominan."""
+    mapeo = _MAPEOS[formato]
+    mejores = [None, None]
+    salidas = [None, None]
+    for _ in range(repeticiones):
+        for i, fn in enumerate((lambda r: _mapeo_referencia(formato, r), mapeo)):
+            salidas[i] = None
+            gc.collect()
+            gc.disable()
+            try:
+                inicio = time.perf_counter()
+                salidas[i] = [fn(r) for r in filas]
+                transcurrido = time.perf_counter() - inicio
+            finally:
+                gc.enable()
+            mejores[i] = transcurrido if mejores[i] is None else min(mejores[i], transcurrido)
+    return mejores[0], mejores[1], salidas
+
+
+def bench_mapeo(carpeta=None, repeticiones=5):
+    carpeta = carpeta or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extras')
+    print(f'Leyendo Excel de {carpeta} ...')
+    filas_por_backend = _filas_de_busqueda(_hojas_de_carpeta(carpeta), carpeta)
+
+    diferencias = 0
+    for backend, filas in filas_por_backend.items():
+        print(f'{backend}: {len(filas)} filas')
+        for formato in _MAPEOS:
+            t_ref, t_nuevo, (ref, nuevo) = _medir_mapeo(formato, filas, repeticiones)
+            distintas = [i for i, (a, b) in enumerate(zip(ref, nuevo)) if a != b]
+            if distintas:
+                diferencias += len(distintas)
+                i = distintas[0]
+                print(f'  DIFERENCIA {formato}: {len(distintas)} filas, primera {i}')
+                print(f'    referencia: {ref[i]}')
+                print(f'    nuevo:      {nuevo[i]}')
+            n = max(1, len(filas))
+            print(f'  {formato:<9} referencia {t_ref / n * 1e6:6.2f} us/fila | nuevo {t_nuevo / n * 1e6:6.2f} us/fila  x{t_ref / t_nuevo:.2f}')
+    print('Equivalencia:', 'OK' if not diferencias else f'{diferencias} fila(s) con diferencias')
+    return diferencias == 0
+
+
+# ---------------------------------------------------------------------------
+# normalize_text
+# ---------------------------------------------------------------------------
+def _normalize_referencia(text):
+    """normalize_text original (NFD, filtro por categoría y dos re.sub), conservado como referencia."""
+    text = str(text)
+    text = ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+    text = text.lower()
+    text = re.sub(r'[^a-z0-9\s]+', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+# Caracteres con casos borde: acentos sueltos y combinados, espacios Unicode, ligaduras, sigma final,
+# I con punto, signos de Kelvin y Angstrom (se descomponen a K y Å), fracciones y superíndices
+_ALFABETO_PRUEBA = (
+    string.ascii_letters + string.digits + string.punctuation + ' \t\n\r\x0b\x0c\x1c\x1f\x85\xa0'
+    + 'áéíóúüñÁÉÍÓÚÜÑçÇàèâêôãõ°ºª½¾²³µ×÷®™' + '\u0301\u0308\u0327\u0345\u20dd'
+    + '\u2000\u2003\u2028\u3000\u200b\ufeff' + 'ΣσςİıKÅﬁẞßØøÆæŒœ' + '中文한국어'
+)
+
+
+def _textos_aleatorios(cantidad, semilla=25):
+    azar = random.Random(semilla)
+    textos = []
+    for _ in range(cantidad):
+        largo = azar.randint(0, 60)
+        if azar.random() < 0.1:
+            # Cualquier punto de código, incluidos surrogates sueltos y no asignados
+            textos.append(''.join(chr(azar.randrange(0x110000)) for _ in range(largo)))
+        else:
+            textos.append(''.join(azar.choice(_ALFABETO_PRUEBA) for _ in range(largo)))
+    return textos
+
+
+def _textos_de_hojas(hojas):
+    """(encabezados, celdas de texto) de las hojas: lo que normaliza la ingesta."""
+    encabezados, celdas = [], []
+    for _, _, _, _, df in hojas:
+        encabezados.extend(str(c) for c in df.columns)
+        for columna in df.columns:
+            celdas.extend(str(v) for v in df[columna].dropna().tolist() if isinstance(v, str))
+    return encabezados, celdas
+
+
+def _medir_normalize(textos, repeticiones, memo_llena):
+    mejores = [None, None]
+    for _ in range(repeticiones):
+        for i, fn in enumerate((_normalize_referencia, app.normalize_text)):
+            if not memo_llena:
+                app._NORMALIZADOS.clear()
+            inicio = time.perf_counter()
+            for t in textos:
+                fn(t)
+            transcurrido = time.perf_counter() - inicio
+            mejores[i] = transcurrido if mejores[i] is None else min(mejores[i], transcurrido)
+    return mejores
+
+
+def bench_normalize(carpeta=None, repeticiones=5):
+    carpeta = carpeta or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extras')
+    print(f'Leyendo Excel de {carpeta} ...')
+    encabezados, celdas = _textos_de_hojas(_hojas_de_carpeta(carpeta))
+    aleatorios = _textos_aleatorios(50000)
+
+    # Equivalencia: cada punto de código solo y entre texto, textos al azar y los de las listas
+    pruebas = {
+        'puntos de código': ((chr(cp), f'A{chr(cp)}b {chr(cp)}') for cp in range(0x110000)),
+        'aleatorios': ((t,) for t in aleatorios),
+        'encabezados y celdas': ((t,) for t in encabezados + celdas),
+    }
+    diferencias = 0
+    for nombre, grupos in pruebas.items():
+        distintos = [t for grupo in grupos for t in grupo if app.normalize_text(t) != _normalize_referencia(t)]
+        diferencias += len(distintos)
+        print(f'  {nombre:<21} {"OK" if not distintos else f"{len(distintos)} diferencia(s)"}')
+        for t in distintos[:3]:
+            print(f'    {t!r}: referencia {_normalize_referencia(t)!r} | nuevo {app.normalize_text(t)!r}')
+
+    conjuntos = [
+        ('encabezados', encabezados * 20, True),
+        ('celdas', celdas, False),
+        ('celdas (memo llena)', celdas, True),
+        ('aleatorios', aleatorios, False),
+    ]
+    for nombre, textos, memo_llena in conjuntos:
+        if not textos:
+            continue
+        t_ref, t_nuevo = _medir_normalize(textos, repeticiones, memo_llena)
+        n = len(textos)
+        print(f'  {nombre:<21} {n:7d} textos | referencia {t_ref / n * 1e6:6.2f} us | nuevo {t_nuevo / n * 1e6:6.2f} us  x{t_ref / t_nuevo:.2f}')
+    print('Equivalencia:', 'OK' if not diferencias else f'{diferencias} texto(s) con diferencias')
+    return diferencias == 0
+
+
+COMANDOS = {
+    'ingesta': bench_ingesta,
+    'mapeo': bench_mapeo,
+    'normalize': bench_normalize,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in COMANDOS:
+        print(__doc__)
+        sys.exit(2)
+    ok = COMANDOS[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if ok else 1)